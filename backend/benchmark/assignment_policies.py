@@ -0,0 +1,122 @@
+import argparse
+import heapq
+import random
+import statistics
+
+from backend.helperClasses.assignment import POLICIES
+from backend.helperClasses.station import Station
+
+# (power in kW, number of chargers) at the simulated station
+CHARGER_MIX = ((11, 4), (50, 4), (150, 2))
+
+# (max power a car accepts in kW, share of cars)
+CAR_MIX = ((11, 0.4), (50, 0.4), (150, 0.2))
+
+
+def make_trace(num_cars, arrivals_per_hour, seed):
+    """Poisson arrivals as (arrival hour, car id, accepted power kW, requested kWh)."""
+    rng = random.Random(seed)
+    powers, weights = zip(*CAR_MIX)
+
+    trace = []
+    now = 0.0
+    for car in range(num_cars):
+        now += rng.expovariate(arrivals_per_hour)
+        trace.append((now, 'car{}'.format(car), rng.choices(powers, weights)[0], rng.uniform(5, 60)))
+    return trace
+
+
+def make_station():
+    station = Station(station_id=1, area_id=1, station_name='Simulated', area_name='Simulated', num_chargers=0)
+    for power_kw, count in CHARGER_MIX:
+        for i in range(count):
+            station.add_charger('{}kW-{}'.format(power_kw, i), power_kw)
+    return station
+
+
+def simulate(policy, trace):
+    """
+    Discrete-event run of one policy over an arrival trace.
+
+    Time is in hours. A session lasts requested energy divided by the lower of
+    the car's and the charger's power.
+    """
+    station = make_station()
+    station.use_queue(policy.make_queue())
+
+    requests = {car_id: (power_kw, energy_kwh) for _, car_id, power_kw, energy_kwh in trace}
+    arrived_at = {}
+    waits = []
+    busy = {charger_id: 0.0 for charger_id in station.chargers}
+
+    events = [(arrival, 0, 'arrive', car_id) for arrival, car_id, _, _ in trace]
+    heapq.heapify(events)
+    sequence = len(events)
+    end = 0.0
+
+    def start_session(now, car_id, charger_id):
+        nonlocal sequence
+        power_kw, energy_kwh = requests[car_id]
+        charger = station.chargers[charger_id]
+        charger.car_id = car_id
+        charger.assigned = True
+
+        duration = energy_kwh / min(power_kw, charger.power_kw)
+        busy[charger_id] += duration
+        waits.append(now - arrived_at[car_id])
+
+        sequence += 1
+        heapq.heappush(events, (now + duration, sequence, 'leave', charger_id))
+
+    while events:
+        now, _, kind, subject = heapq.heappop(events)
+        end = now
+
+        if kind == 'arrive':
+            power_kw, energy_kwh = requests[subject]
+            arrived_at[subject] = now
+            if station.available_chargers > 0:
+                start_session(now, subject, policy.choose_charger(station, power_kw))
+            else:
+                station.add_to_queue(subject, policy.queue_priority(now, energy_kwh), power_kw)
+        else:
+            charger = station.chargers[subject]
+            charger.car_id = None
+            charger.assigned = False
+            if len(station.queue) > 0:
+                car_id = station.remove_from_queue()
+                power_kw = station.requested_power.pop(car_id, None)
+                start_session(now, car_id, policy.choose_charger(station, power_kw))
+
+    busy_hours = list(busy.values())
+    waits_minutes = sorted(wait * 60 for wait in waits)
+    return {
+        'policy': policy.name,
+        'avg_wait_min': statistics.mean(waits_minutes),
+        'p95_wait_min': waits_minutes[int(0.95 * (len(waits_minutes) - 1))],
+        'utilization': sum(busy_hours) / (len(busy_hours) * end) if end else 0.0,
+        'wear_spread': statistics.pstdev(busy_hours) / statistics.mean(busy_hours) if any(busy_hours) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare charger assignment policies on simulated arrivals.')
+    parser.add_argument('--cars', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=4.0, help='arrivals per hour')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    trace = make_trace(args.cars, args.rate, args.seed)
+
+    print('{:<12} {:>14} {:>14} {:>12} {:>12}'.format('policy', 'avg wait min', 'p95 wait min', 'utilization',
+                                                      'wear spread'))
+    for policy_class in POLICIES.values():
+        # Same seed for every policy so the random pick does not vary between runs
+        random.seed(args.seed)
+        result = simulate(policy_class(), trace)
+        print('{policy:<12} {avg_wait_min:>14.1f} {p95_wait_min:>14.1f} {utilization:>12.2%} '
+              '{wear_spread:>12.2f}'.format(**result))
+
+
+if __name__ == "__main__":
+    main()
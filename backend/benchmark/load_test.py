@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from backend.helperClasses.station import Station
+from backend.server.async_server import AsyncServer
+from backend.server.local_broker import LocalBroker
+from backend.server.rate_limit import RateLimiter
+from backend.server.server import MQTT_TOPIC_CAR_OUTPUT, MQTT_TOPIC_CHARGER_OUTPUT, station_input_topic
+
+
+def make_stations(num_stations, chargers_per_station):
+    stations = {}
+    for station_id in range(1, num_stations + 1):
+        station = Station(station_id=station_id, area_id=station_id % 10, station_name='Station {}'.format(station_id),
+                          area_name='Area {}'.format(station_id % 10), num_chargers=0)
+        for i in range(chargers_per_station):
+            station.add_charger('c{}'.format(i))
+        stations[station_id] = station
+    return stations
+
+
+def memory_per_station(num_stations, chargers_per_station):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    stations = make_stations(num_stations, chargers_per_station)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del stations
+    return allocated / num_stations
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class FleetSimulator:
+    """
+    Simulated cars and chargers sharing one client on the local broker.
+
+    Messages use the same formats as CarStateMachine and charger_logic. A
+    charger that gets a car plugs it in at once and frees itself again after
+    `session_time` seconds, which pulls the next car off the station queue.
+    """
+
+    def __init__(self, broker, stations, num_cars, session_time, arrival_rate):
+        self.broker = broker
+        self.stations = stations
+        self.num_cars = num_cars
+        self.session_time = session_time
+        self.arrival_rate = arrival_rate
+
+        self.registered_at = {}
+        self.latencies = []
+        self.sent = 0
+        self.done = asyncio.Event()
+
+    async def run(self):
+        async with self.broker.client() as client:
+            await client.subscribe(MQTT_TOPIC_CAR_OUTPUT.format('+'))
+            await client.subscribe(MQTT_TOPIC_CHARGER_OUTPUT.format('+', '+'))
+            listener = asyncio.create_task(self._listen(client))
+
+            # Chargers announce themselves the way charger_logic does on connect
+            for station in self.stations.values():
+                for charger_id in station.chargers:
+                    await self._send(client, station.id, {
+                        'command': 'charger_available', 'charger_id': charger_id, 'station_id': station.id,
+                    })
+
+            for car in range(self.num_cars):
+                station_id = car % len(self.stations) + 1
+                car_id = 'car{}'.format(car)
+                self.registered_at[car_id] = time.perf_counter()
+                await self._send(client, station_id, {
+                    'command': 'register_to_queue', 'car_id': car_id, 'station_id': station_id,
+                })
+                if self.arrival_rate:
+                    await asyncio.sleep(1 / self.arrival_rate)
+
+            await self.done.wait()
+            listener.cancel()
+
+    async def _listen(self, client):
+        async for message in client.messages:
+            payload = json.loads(message.payload)
+            if payload.get('command') != 'charger_assigned':
+                continue
+
+            topic = str(message.topic)
+            if topic.startswith(MQTT_TOPIC_CAR_OUTPUT.format('')):
+                started = self.registered_at.pop(payload['car_id'], None)
+                if started is not None:
+                    self.latencies.append(time.perf_counter() - started)
+                    if len(self.latencies) == self.num_cars:
+                        self.done.set()
+            else:
+                asyncio.create_task(self._charge(client, payload['station_id'], payload['charger_id']))
+
+    async def _charge(self, client, station_id, charger_id):
+        await self._send(client, station_id, {
+            'command': 'charger_connected', 'charger_id': charger_id, 'station_id': station_id,
+        })
+        await asyncio.sleep(self.session_time)
+        await self._send(client, station_id, {
+            'command': 'charger_available', 'charger_id': charger_id, 'station_id': station_id,
+        })
+
+    async def _send(self, client, station_id, data):
+        self.sent += 1
+        await client.publish(station_input_topic(station_id), json.dumps(data))
+
+
+async def run_benchmark(num_stations, chargers_per_station, num_cars, session_time, arrival_rate, timeout):
+    broker = LocalBroker()
+    stations = make_stations(num_stations, chargers_per_station)
+    server = AsyncServer(broker.client, stations=stations, data_dir=None)
+    # Simulated chargers cycle through sessions far faster than real ones
+    server.rate_limiter = RateLimiter(float('inf'), float('inf'))
+    simulator = FleetSimulator(broker, stations, num_cars, session_time, arrival_rate)
+
+    server_task = asyncio.create_task(server.run())
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    timed_out = False
+    try:
+        await asyncio.wait_for(simulator.run(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+
+    server.stop()
+    await server_task
+
+    handled = sum(command.count for command in server.commands)
+    return {
+        'stations': num_stations,
+        'chargers_per_station': chargers_per_station,
+        'cars': num_cars,
+        'assigned': len(simulator.latencies),
+        'timed_out': timed_out,
+        'elapsed_s': elapsed,
+        'messages_sent': simulator.sent,
+        'messages_handled': handled,
+        'throughput_msg_per_s': handled / elapsed if elapsed else 0.0,
+        'latency_p50_ms': percentile(simulator.latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(simulator.latencies, 0.99) * 1000,
+        'memory_per_station_bytes': memory_per_station(num_stations, chargers_per_station),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the queue server against an in-process broker.')
+    parser.add_argument('--stations', type=int, default=100)
+    parser.add_argument('--chargers', type=int, default=10, help='chargers per station')
+    parser.add_argument('--cars', type=int, default=5000)
+    parser.add_argument('--session-time', type=float, default=0.0, help='seconds a car stays plugged in')
+    parser.add_argument('--arrival-rate', type=float, default=0.0, help='cars per second, 0 registers all at once')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--ci', action='store_true', help='small headless scenario that fails unless every car is served')
+    args = parser.parse_args()
+
+    if args.ci:
+        args.stations, args.chargers, args.cars, args.timeout = 10, 4, 400, 30.0
+
+    result = asyncio.run(run_benchmark(args.stations, args.chargers, args.cars, args.session_time,
+                                       args.arrival_rate, args.timeout))
+
+    print(json.dumps(result, indent=2))
+
+    if args.ci and (result['timed_out'] or result['assigned'] != args.cars):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
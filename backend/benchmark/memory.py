@@ -0,0 +1,194 @@
+import argparse
+import json
+import threading
+import time
+import tracemalloc
+
+from backend.helperClasses.car_queue import CarQueue
+from backend.helperClasses.charger import Charger
+from backend.helperClasses.station import Station
+from backend.server.dashboard_publisher import DashboardPublisher
+
+
+def without_slots(cls, **overrides):
+    """A copy of `cls` that keeps its attributes in an instance dict, as it did before it had slots."""
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name not in cls.__slots__ and name not in ('__slots__', '__dict__', '__weakref__')}
+    namespace.update(overrides)
+    return type(cls.__name__, (), namespace)
+
+
+# The layout before chargers and stations were compacted: instance dicts
+# everywhere, queues starting with room for 64 tickets and dashboard rows kept
+# as dicts. Charger flags stay packed, so the baseline charger is a little
+# smaller than it really was.
+BaselineCharger = without_slots(Charger)
+
+BaselineCarQueue = without_slots(CarQueue, __init__=lambda self, capacity=64: CarQueue.__init__(self, capacity))
+
+
+def _baseline_station_init(self, *args, **kwargs):
+    Station.__init__(self, *args, **kwargs)
+    self.queue = BaselineCarQueue()
+
+
+def _baseline_create_charger(self, charger_id, power_kw=None):
+    charger = BaselineCharger(charger_id, station=self, power_kw=power_kw)
+    self.update_availability(charger)
+    return charger
+
+
+BaselineStation = without_slots(Station, __init__=_baseline_station_init, _create_charger=_baseline_create_charger)
+
+
+class BaselineDashboardPublisher(DashboardPublisher):
+    """Keeps every charger as a serialized dict between ticks, and diffs them field by field."""
+
+    def _build_message(self, station_id):
+        previous = self._sent.get(station_id)
+        seq = self._seq.get(station_id, 0)
+
+        if previous is None or station_id in self._force_snapshot:
+            return self._snapshot_message(station_id)
+
+        state = self._station_state(station_id)
+        changes = {key: value for key, value in state.items()
+                   if key != 'chargers' and previous.get(key) != value}
+
+        previous_chargers = previous['chargers']
+        chargers = {}
+        for charger_id, charger in state['chargers'].items():
+            old = previous_chargers.get(charger_id)
+            if old is None:
+                chargers[charger_id] = charger
+            else:
+                fields = {key: value for key, value in charger.items() if old.get(key) != value}
+                if fields:
+                    chargers[charger_id] = fields
+        removed = [charger_id for charger_id in previous_chargers if charger_id not in state['chargers']]
+
+        if not changes and not chargers and not removed:
+            return None
+
+        if (seq + 1) % self.snapshot_every == 0:
+            return self._snapshot_message(station_id)
+
+        seq += 1
+        self._seq[station_id] = seq
+        self._sent[station_id] = state
+
+        message = {'type': 'delta', 'id': station_id, 'seq': seq}
+        message.update(changes)
+        if chargers:
+            message['chargers'] = chargers
+        if removed:
+            message['removedChargers'] = removed
+        return message
+
+    def _snapshot_message(self, station_id):
+        state = self._station_state(station_id)
+        seq = self._seq.get(station_id, 0) + 1
+        self._seq[station_id] = seq
+        self._sent[station_id] = state
+
+        message = {'type': 'snapshot', 'id': station_id, 'seq': seq}
+        message.update(state)
+        message['chargers'] = list(state['chargers'].values())
+        return message
+
+    def _station_state(self, station_id):
+        station = self._get_station(station_id)
+        return {
+            'stationName': station.station_name,
+            'availableChargers': station.available_chargers,
+            'unavailableChargers': station.unavailable_chargers,
+            'queue': list(station.queue),
+            'queueLength': len(station.queue),
+            'chargers': {str(charger.id): charger.serialize() for charger in station.chargers.values()}
+        }
+
+
+LAYOUTS = {
+    'baseline': (BaselineStation, BaselineDashboardPublisher),
+    'current': (Station, DashboardPublisher),
+}
+
+
+def measure(build):
+    """Bytes allocated by `build()` that are still alive once it returns."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')), result
+
+
+def make_station(station_id, num_chargers, station_class=Station):
+    station = station_class(station_id=station_id, area_id=station_id % 50, station_name='Station {}'.format(station_id),
+                      area_name='Area {}'.format(station_id % 50), num_chargers=0)
+    for i in range(num_chargers):
+        charger = station.add_charger('s{}c{}'.format(station_id, i), power_kw=(11, 50, 150)[i % 3])
+        # Half the chargers are in use, as in a busy evening
+        if i % 2:
+            charger.car_id = 'car{}-{}'.format(station_id, i)
+            charger.assigned = True
+            charger.charging = True
+    return station
+
+
+def bytes_per_charger(num_stations, chargers_per_station, station_class=Station):
+    empty, _ = measure(lambda: [make_station(i, 0, station_class) for i in range(num_stations)])
+    full, _ = measure(lambda: [make_station(i, chargers_per_station, station_class) for i in range(num_stations)])
+    return empty / num_stations, (full - empty) / (num_stations * chargers_per_station)
+
+
+def dashboard_cost(chargers_per_station, rounds, station_class=Station, publisher_class=DashboardPublisher):
+    """Time and bytes for one dashboard tick of a station where one charger changed."""
+    station = make_station(1, chargers_per_station, station_class)
+    sent = []
+    publisher = publisher_class(publish=sent.append, get_station={1: station}.get, lock=threading.RLock(),
+                                   snapshot_every=rounds + 10)
+    publisher.publish_all_snapshots([1])
+
+    charger = next(iter(station.chargers.values()))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        charger.charging = not charger.charging
+        publisher.mark_dirty(1)
+        publisher.flush()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    charger.charging = not charger.charging
+    publisher.mark_dirty(1)
+    publisher.flush()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed / rounds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory per station and charger.')
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--chargers', type=int, default=20, help='chargers per station')
+    parser.add_argument('--rounds', type=int, default=200, help='dashboard ticks to time')
+    args = parser.parse_args()
+
+    results = {}
+    for name, (station_class, publisher_class) in LAYOUTS.items():
+        per_station, per_charger = bytes_per_charger(args.stations, args.chargers, station_class)
+        tick_time, tick_peak = dashboard_cost(1000, args.rounds, station_class, publisher_class)
+        results[name] = {
+            'bytes_per_station': round(per_station, 1),
+            'bytes_per_charger': round(per_charger, 1),
+            'dashboard_tick_ms_1000_chargers': round(tick_time * 1000, 3),
+            'dashboard_tick_peak_bytes_1000_chargers': tick_peak,
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
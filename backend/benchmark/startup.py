@@ -0,0 +1,70 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+from backend.server.async_server import AsyncServer
+from backend.server.local_broker import LocalBroker
+from backend.server.station_registry import REGISTRY_LOAD_BUDGET, load_registry
+
+
+def write_registry(path, num_stations, chargers_per_station):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['station_id', 'area_id', 'station_name', 'area_name', 'chargers'])
+        for station_id in range(1, num_stations + 1):
+            chargers = ';'.join('s{}c{}:{}'.format(station_id, i, (11, 50, 150)[i % 3])
+                                for i in range(chargers_per_station))
+            writer.writerow([station_id, station_id // 20, 'Station {}'.format(station_id),
+                             'Area {}'.format(station_id // 20), chargers])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time a server start from a large station registry file.')
+    parser.add_argument('--stations', type=int, default=50000)
+    parser.add_argument('--chargers', type=int, default=8, help='chargers per station')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stations.csv')
+        write_registry(path, args.stations, args.chargers)
+
+        boot_start = time.perf_counter()
+        server = AsyncServer(LocalBroker().client, stations=load_registry(path), data_dir=None)
+        boot = time.perf_counter() - boot_start
+        loaded = len(server.stations.values())
+
+        # Handled while the search index is still being built in the background
+        start = time.perf_counter()
+        server.register_to_queue({'car_id': 'car', 'station_id': args.stations // 2})
+        first_command = time.perf_counter() - start
+
+        # A search sent right after boot, answered by scanning the names while
+        # the n-grams are built in the background
+        start = time.perf_counter()
+        server.get_available_chargers({'search_string': 'Station 4999'})
+        search_at_boot = time.perf_counter() - start
+
+        server.search_replica.index_ready.wait()
+        index_ready = time.perf_counter() - boot_start
+
+        start = time.perf_counter()
+        server.get_available_chargers({'search_string': 'Station 2999'})
+        search_after_index = time.perf_counter() - start
+
+    print(json.dumps({
+        'stations': args.stations,
+        'boot_s': round(boot, 3),
+        'boot_budget_s': REGISTRY_LOAD_BUDGET,
+        'stations_loaded_after_boot': loaded,
+        'first_command_ms': round(first_command * 1000, 3),
+        'index_ready_after_start_s': round(index_ready, 3),
+        'search_at_boot_ms': round(search_at_boot * 1000, 3),
+        'search_after_index_ms': round(search_after_index * 1000, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
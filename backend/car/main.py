@@ -1,11 +1,14 @@
 import paho.mqtt.client as mqtt
 import stmpy
 import logging
+import argparse
 from threading import Thread
 import json
 import random
 import string
-import RPi.GPIO as GPIO
+import uuid
+
+from backend.helperClasses.io_backend import BOTH, FALLING, HIGH, PULL_DOWN, PULL_UP, GPIOBackend, SimulatedIOBackend
 
 
 # TODO: choose proper MQTT broker address
@@ -13,8 +16,10 @@ MQTT_BROKER = 'broker.hivemq.com'
 MQTT_PORT = 1883
 
 # TODO: choose proper topics for communication
-MQTT_TOPIC_SERVER_INPUT = 'charging_ahead/queue/server_input'
-MQTT_TOPIC_SERVER_OUTPUT = 'charging_ahead/queue/server_output'
+MQTT_TOPIC_SERVER_INPUT = 'charging_ahead/queue/server_input/station/{}'
+MQTT_TOPIC_CAR_OUTPUT = 'charging_ahead/queue/car/{}'
+
+STATION_ID = 1
 
 register_button = 17
 charger_pin = 21
@@ -22,46 +27,57 @@ pulled_down_pin = 20
 
 
 class CarStateMachine:
-    def __init__(self, duration):
+    def __init__(self, duration, io=None, station_id=STATION_ID, client=None, stm_driver=None):
+        """
+        `client` and `stm_driver` are shared when the car runs in a fleet, see
+        backend/fleet/main.py. A standalone car creates its own.
+        """
         self._logger = logging.getLogger(__name__)
         self.duration = duration
         self.id = self.generate_random_id(10)
+        self.station_id = station_id
         self.charger_id = None
+        self.io = io if io is not None else GPIOBackend()
 
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)  # MQTTv311 corresponds to version 3.1.1
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        self.client = client
+        if self.client is None:
+            self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)  # MQTTv311 corresponds to version 3.1.1
+            self.client.on_connect = self.on_connect
+            self.client.on_message = self.on_message
+            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
 
-        self.client.loop_start()
+            self.client.loop_start()
 
         transitions = [
             {'source': 'initial', 'target': 'disconnected'},
             {'trigger': 'register', 'source': 'disconnected', 'target': 'in_queue', 'effect': 'register_for_queue'},
             {'trigger': 'assigned_charger', 'source': 'disconnected', 'target': 'assigned'},
+            {'trigger': 'reservation_expired', 'source': 'assigned', 'target': 'disconnected'},
             {'trigger': 'register', 'source': 'in_queue', 'target': 'disconnected', 'effect': 'unregister_from_queue'},
             {'trigger': 'charger_connected', 'source': 'in_queue', 'target': 'charging'},
             {'trigger': 'charger_disconnected', 'source': 'charging', 'target': 'disconnected'},
         ]
 
         self.stm = stmpy.Machine(name=self.id, transitions=transitions, obj=self)
-        self.stm_driver = stmpy.Driver()
-        self.stm_driver.add_machine(self.stm)
-        self.stm_driver.start(keep_active=True)
+        self.stm_driver = stm_driver
+        if self.stm_driver is None:
+            self.stm_driver = stmpy.Driver()
+            self.stm_driver.add_machine(self.stm)
+            self.stm_driver.start(keep_active=True)
+        else:
+            self.stm_driver.add_machine(self.stm)
 
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(register_button, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(register_button, GPIO.FALLING, callback=self.button_press, bouncetime=500)
+        self.io.setup_input(register_button, PULL_UP)
+        self.io.add_event_detect(register_button, FALLING, callback=self.button_press, bouncetime=500)
 
-        
-        GPIO.setup(charger_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(charger_pin, GPIO.BOTH, callback=self.charger, bouncetime=500)
+        self.io.setup_input(charger_pin, PULL_UP)
+        self.io.add_event_detect(charger_pin, BOTH, callback=self.charger, bouncetime=500)
 
-        GPIO.setup(pulled_down_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        self.io.setup_input(pulled_down_pin, PULL_DOWN)
 
     def on_connect(self, client, userdata, flags, rc):
         print("Connected to MQTT broker with result code "+str(rc))
-        client.subscribe(MQTT_TOPIC_SERVER_OUTPUT)
+        client.subscribe(MQTT_TOPIC_CAR_OUTPUT.format(self.id))
 
     def on_message(self, client, userdata, msg):
         print('Received message: {}'.format(msg.payload))
@@ -71,11 +87,24 @@ class CarStateMachine:
         if command == 'charger_assigned':
             if payload.get('car_id') == self.id:
                 self.charger_id = payload.get('charger_id')
+                # The server may have sent us to a less busy station in the area
+                self.station_id = payload.get('station_id', self.station_id)
                 print('Charger assigned: {}'.format(self.charger_id))
                 self.stm_driver._stms_by_id.get(self.stm.id).send('assigned_charger')
-        elif command == 'registered_in_queue':
+        elif command == 'reservation_expired':
+            print('Reservation of charger {} expired'.format(self.charger_id))
+            self.charger_id = None
+            self.stm_driver._stms_by_id.get(self.stm.id).send('reservation_expired')
+        elif command == 'queue_eta':
+            print('Estimated wait: {} seconds'.format(payload.get('eta_seconds')))
+        elif command in ('registered_in_queue', 'queue_position'):
             position = payload.get('position')
             print('Position in queue: {}'.format(position))
+            if payload.get('alternative'):
+                print('Chargers free at {}'.format(payload['alternative'].get('name')))
+            if payload.get('area'):
+                print('Area: {} chargers free, {} cars queued'.format(
+                    payload['area'].get('availableChargers'), payload['area'].get('queued')))
 
         else:
             self._logger.warning('Unknown command: {}'.format(command))
@@ -85,9 +114,10 @@ class CarStateMachine:
         data = {
             'command': 'charger_disconnected',
             'charger_id': self.charger_id,
-            'station_id': 1,
+            'station_id': self.station_id,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
         self.charger_id =  None
 
     def register_for_queue(self):
@@ -95,18 +125,20 @@ class CarStateMachine:
         data = {
             'command': 'register_to_queue',
             'car_id': self.id,
-            'station_id': 1,
+            'station_id': self.station_id,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
 
     def unregister_from_queue(self):
         print('Unregistering from queue')
         data = {
             'command': 'unregister_from_queue',
             'car_id': self.id,
-            'station_id': 1,
+            'station_id': self.station_id,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
 
     def generate_random_id(self, length):
             letters_and_digits = string.ascii_letters + string.digits
@@ -116,7 +148,7 @@ class CarStateMachine:
         self.stm_driver._stms_by_id.get(self.stm.id).send('register')
 
     def charger(self, channel):
-        if GPIO.input(channel) == True:
+        if self.io.input(channel) == HIGH:
             self.stm_driver._stms_by_id.get(self.stm.id).send('charger_disconnected')
             print("Charger unplugged")
         else:
@@ -124,4 +156,16 @@ class CarStateMachine:
             print("Charger plugged")
 
 
-car_stm = CarStateMachine(10)
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--simulated', type=int, default=0,
+                        help='run this many virtual cars with simulated pins instead of GPIO')
+    args = parser.parse_args()
+
+    if args.simulated:
+        return [CarStateMachine(10, io=SimulatedIOBackend()) for _ in range(args.simulated)]
+    return [CarStateMachine(10)]
+
+
+if __name__ == "__main__":
+    cars = main()
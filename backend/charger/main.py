@@ -1,10 +1,16 @@
+import argparse
 import json
 import stmpy
 import random
 import string
+import uuid
 import logging
+import threading
+import time
 import paho.mqtt.client as mqtt
-import RPi.GPIO as GPIO
+
+from backend.helperClasses.io_backend import BOTH, FALLING, HIGH, LOW, PULL_UP, GPIOBackend, SimulatedIOBackend
+from backend.helperClasses.telemetry import pack_samples
 
 
 # TODO: choose proper MQTT broker address
@@ -12,8 +18,24 @@ MQTT_BROKER = 'broker.hivemq.com'
 MQTT_PORT = 1883
 
 # TODO: choose proper topics for communication
-MQTT_TOPIC_SERVER_INPUT = 'charging_ahead/queue/server_input'
-MQTT_TOPIC_SERVER_OUTPUT = 'charging_ahead/queue/server_output'
+MQTT_TOPIC_SERVER_INPUT = 'charging_ahead/queue/server_input/station/{}'
+MQTT_TOPIC_CHARGER_OUTPUT = 'charging_ahead/queue/station/{}/charger/{}'
+MQTT_TOPIC_TELEMETRY = 'charging_ahead/telemetry/station/{}/charger/{}'
+
+STATION_ID = 1
+
+# Seconds between heartbeats, the server takes a charger out of service after three missed
+HEARTBEAT_INTERVAL = 10
+
+# While charging, power and state of charge are sampled every
+# TELEMETRY_SAMPLE_INTERVAL seconds and sent TELEMETRY_BATCH_SIZE at a time
+TELEMETRY_SAMPLE_INTERVAL = 1
+TELEMETRY_BATCH_SIZE = 10
+
+# Battery size of the simulated car, and the state of charge above which it
+# draws less than full power
+SIMULATED_BATTERY_KWH = 60.0
+SIMULATED_TAPER_SOC = 80.0
 
 red = 4
 yellow = 22
@@ -22,32 +44,65 @@ charger_pin = 21
 service_button = 7
 
 
+def heartbeat_message(station_id, charger_ids):
+    return json.dumps({'command': 'heartbeat', 'station_id': station_id, 'charger_ids': charger_ids})
+
+
+def offline_message(station_id, charger_ids):
+    # Left with the broker as last will, so the server hears of a crash right away
+    return json.dumps({'command': 'chargers_offline', 'station_id': station_id, 'charger_ids': charger_ids})
+
+
 class charger_logic:
-    def __init__(self, duration):
+    def __init__(self, duration, io=None, station_id=STATION_ID, client=None, stm_driver=None, charger_id=None,
+                 power_kw=50.0):
+        """
+        A fleet passes a shared `client` and `stm_driver`, and then routes this
+        device's messages and connect event to it. Otherwise the device opens
+        its own connection and driver.
+
+        `charger_id` should match the station registry. Without one the charger
+        makes up an id and the server adds it to the station on announcement.
+        `power_kw` is the rated power, announced with every charger_available.
+        """
         self._logger = logging.getLogger(__name__)
 
-        self.id = self.generate_random_id(10)
+        self.id = charger_id if charger_id is not None else self.generate_random_id(10)
         self.duration = duration
+        self.station_id = station_id
         self.car_id = None
-        
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)  # MQTTv311 corresponds to version 3.1.1
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        self.io = io if io is not None else GPIOBackend()
 
-        self.client.loop_start()
+        self.power_kw = power_kw
+        self.charging = False
+        self.soc = None
+        self._last_sample = None
+        self._samples = []
+        self._telemetry_lock = threading.Lock()
         
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(red, GPIO.OUT)
-        GPIO.setup(yellow, GPIO.OUT)
-        GPIO.setup(green, GPIO.OUT)
-        
-        GPIO.setup(service_button, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(service_button, GPIO.FALLING, callback=self.button, bouncetime=500)
+        self.client = client
+        if self.client is None:
+            self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)  # MQTTv311 corresponds to version 3.1.1
+            self.client.on_connect = self.on_connect
+            self.client.on_message = self.on_message
+            self.client.will_set(MQTT_TOPIC_SERVER_INPUT.format(self.station_id),
+                                 offline_message(self.station_id, [self.id]), qos=1)
+            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+
+            self.client.loop_start()
+
+            threading.Thread(target=self.send_heartbeats, daemon=True).start()
+            threading.Thread(target=self.send_telemetry, daemon=True).start()
         
-        GPIO.setup(charger_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(charger_pin, GPIO.BOTH, callback=self.charger, bouncetime=500)
+        self.io.setup_output(red)
+        self.io.setup_output(yellow)
+        self.io.setup_output(green)
+
+        self.io.setup_input(service_button, PULL_UP)
+        self.io.add_event_detect(service_button, FALLING, callback=self.button, bouncetime=500)
+
+        self.io.setup_input(charger_pin, PULL_UP)
+        self.io.add_event_detect(charger_pin, BOTH, callback=self.charger, bouncetime=500)
 
 
 
@@ -62,17 +117,22 @@ class charger_logic:
             {'trigger': 'charger_disconnected', 'source': 'in_use', 'target': 'waiting', 'effect': 'waiting'},
             {'trigger': 'button', 'source': 'in_use', 'target': 'out_of_order', 'effect': 'out_of_order'},
             {'trigger': 'button', 'source': 'booked', 'target': 'out_of_order', 'effect': 'out_of_order'},
+            {'trigger': 'reservation_expired', 'source': 'booked', 'target': 'waiting', 'effect': 'green_light'},
         ]
 
         self.stm = stmpy.Machine(name=self.id, transitions=transitions, obj=self)
-        self.stm_driver = stmpy.Driver()
-        self.stm_driver.add_machine(self.stm)
-        self.stm_driver.start(keep_active=True)
+        self.stm_driver = stm_driver
+        if self.stm_driver is None:
+            self.stm_driver = stmpy.Driver()
+            self.stm_driver.add_machine(self.stm)
+            self.stm_driver.start(keep_active=True)
+        else:
+            self.stm_driver.add_machine(self.stm)
 
 
     def on_connect(self, client, userdata, flags, rc):
         print("Connected to MQTT broker with result code "+str(rc))
-        client.subscribe(MQTT_TOPIC_SERVER_OUTPUT)
+        client.subscribe(MQTT_TOPIC_CHARGER_OUTPUT.format(self.station_id, self.id))
         self.stm_driver._stms_by_id.get(self.stm.id).send('mqtt_connected')
 
         
@@ -81,25 +141,39 @@ class charger_logic:
         payload = json.loads(msg.payload.decode('utf-8'))
         command = payload.get('command')
 
-        if command == 'charger_assigned':
-            if payload.get('charger_id') == self.id:
-                self.car_id = payload.get('car_id')
-                print('Charger assigned with car: {}'.format(self.car_id))
-                self.stm_driver._stms_by_id.get(self.stm.id).send('server_book')
+        if command in ('charger_assigned', 'reservation_expired') and not self.is_addressed_to(payload):
+            # Charger ids are only unique within a station
+            self._logger.warning('Ignored {} for charger {} at station {}'.format(
+                command, payload.get('charger_id'), payload.get('station_id')))
+        elif command == 'charger_assigned':
+            self.car_id = payload.get('car_id')
+            print('Charger assigned with car: {}'.format(self.car_id))
+            self.stm_driver._stms_by_id.get(self.stm.id).send('server_book')
+        elif command == 'reservation_expired':
+            # The server has already freed us, so no charger_available is sent
+            self.car_id = None
+            self.stm_driver._stms_by_id.get(self.stm.id).send('reservation_expired')
         elif command == 'stop_engine':
             self.stm.send('stop_charging')
         else:
             self._logger.warning('Unknown command: {}'.format(command))
 
+    def is_addressed_to(self, payload):
+        return (str(payload.get('station_id')) == str(self.station_id)
+                and str(payload.get('charger_id')) == str(self.id))
+
     def waiting(self):
         print("waiting")
+        self.stop_metering()
         self.green_light()
         data = {
             'command': 'charger_available', 
             'charger_id': self.id, 
-            'station_id': 1,  
+            'station_id': self.station_id,
+            'power_kw': self.power_kw,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
        
     def booked(self):
         self.yellow_light()
@@ -107,50 +181,105 @@ class charger_logic:
     def charger_connected(self):
         self.yellow_light()
         print("Charger connected")
+        self.start_metering()
         data = {
             'command': 'charger_connected', 
             'charger_id': self.id, 
-            'station_id': 1,  
+            'station_id': self.station_id,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
     
     def out_of_order(self):
         self.red_light()
         print("Out of order")
+        self.stop_metering()
         data = {
             'command': 'out_of_order', 
             'charger_id': self.id, 
-            'station_id': 1,  
+            'station_id': self.station_id,
+            'request_id': uuid.uuid4().hex,
         }
-        self.client.publish(MQTT_TOPIC_SERVER_INPUT, json.dumps(data))
+        self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id), json.dumps(data), qos=1)
         
+    def send_heartbeats(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id),
+                                heartbeat_message(self.station_id, [self.id]))
+
+    def send_telemetry(self):
+        while True:
+            time.sleep(TELEMETRY_SAMPLE_INTERVAL)
+            self.sample_telemetry(time.time())
+
+    def start_metering(self):
+        with self._telemetry_lock:
+            self.charging = True
+            self.soc = random.uniform(10, 40)
+            self._last_sample = None
+
+    def stop_metering(self):
+        with self._telemetry_lock:
+            if not self.charging:
+                return
+            self.charging = False
+            self._publish_samples()
+
+    def read_meter(self, elapsed):
+        """
+        Return (power kW, state of charge %) after `elapsed` seconds of charging.
+
+        Simulated: full power up to SIMULATED_TAPER_SOC, then tapering off.
+        """
+        power_kw = self.power_kw
+        if self.soc > SIMULATED_TAPER_SOC:
+            power_kw *= max(0.1, (100 - self.soc) / (100 - SIMULATED_TAPER_SOC))
+        self.soc = min(100.0, self.soc + power_kw * elapsed / 3600 / SIMULATED_BATTERY_KWH * 100)
+        return power_kw, self.soc
+
+    def sample_telemetry(self, now):
+        with self._telemetry_lock:
+            if not self.charging:
+                return
+            elapsed = now - self._last_sample if self._last_sample is not None else 0
+            self._last_sample = now
+            self._samples.append((now,) + self.read_meter(elapsed))
+            if len(self._samples) >= TELEMETRY_BATCH_SIZE:
+                self._publish_samples()
+
+    def _publish_samples(self):
+        if self._samples:
+            self.client.publish(MQTT_TOPIC_TELEMETRY.format(self.station_id, self.id), pack_samples(self._samples))
+            self._samples = []
+
     def generate_random_id(self, length):
             letters_and_digits = string.ascii_letters + string.digits
             return ''.join(random.choice(letters_and_digits) for _ in range(length))
 
     
     def red_light(self):
-        GPIO.output(red, GPIO.HIGH)
-        GPIO.output(yellow, GPIO.LOW)
-        GPIO.output(green, GPIO.LOW)
+        self.io.output(red, HIGH)
+        self.io.output(yellow, LOW)
+        self.io.output(green, LOW)
 
     def yellow_light(self):
-        GPIO.output(red, GPIO.LOW)
-        GPIO.output(yellow, GPIO.HIGH)
-        GPIO.output(green, GPIO.LOW)
+        self.io.output(red, LOW)
+        self.io.output(yellow, HIGH)
+        self.io.output(green, LOW)
 
     def green_light(self):
-        GPIO.output(red, GPIO.LOW)
-        GPIO.output(yellow, GPIO.LOW)
-        GPIO.output(green, GPIO.HIGH)
+        self.io.output(red, LOW)
+        self.io.output(yellow, LOW)
+        self.io.output(green, HIGH)
 
     def off_light(self):
-        GPIO.output(red, GPIO.LOW)
-        GPIO.output(yellow, GPIO.LOW)
-        GPIO.output(green, GPIO.LOW)
+        self.io.output(red, LOW)
+        self.io.output(yellow, LOW)
+        self.io.output(green, LOW)
     
     def charger(self, channel):
-        if GPIO.input(channel) == True:
+        if self.io.input(channel) == HIGH:
             self.stm_driver._stms_by_id.get(self.stm.id).send('charger_disconnected')
             print("Charger unplugged")
         else:
@@ -160,6 +289,22 @@ class charger_logic:
     def button(self, channel):
         self.stm_driver._stms_by_id.get(self.stm.id).send('button')
 
-            
-        
-car_stm = charger_logic(10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--simulated', type=int, default=0,
+                        help='run this many virtual chargers with simulated pins instead of GPIO')
+    parser.add_argument('--station', type=int, default=STATION_ID)
+    parser.add_argument('--id', help='charger id from the station registry')
+    parser.add_argument('--power', type=float, default=50.0, help='rated power in kW')
+    args = parser.parse_args()
+
+    if args.simulated:
+        return [charger_logic(10, io=SimulatedIOBackend(), station_id=args.station, power_kw=args.power)
+                for _ in range(args.simulated)]
+    return [charger_logic(10, station_id=args.station, charger_id=args.id, power_kw=args.power)]
+
+
+if __name__ == "__main__":
+    chargers = main()
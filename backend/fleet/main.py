@@ -0,0 +1,115 @@
+import argparse
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import stmpy
+
+from backend.car.main import MQTT_TOPIC_CAR_OUTPUT, CarStateMachine
+from backend.charger.main import (HEARTBEAT_INTERVAL, MQTT_BROKER, MQTT_PORT, MQTT_TOPIC_CHARGER_OUTPUT,
+                                  MQTT_TOPIC_SERVER_INPUT, TELEMETRY_SAMPLE_INTERVAL, charger_logic,
+                                  heartbeat_message, offline_message)
+from backend.helperClasses.io_backend import SimulatedIOBackend
+
+
+class Fleet:
+    """
+    Many simulated cars and chargers behind one MQTT connection.
+
+    Every device's state machine runs on one shared stmpy driver, and every
+    device publishes through the shared client. Inbound messages are routed to
+    the device named by the last level of their topic through a dict, so the
+    fleet costs four threads and one broker connection whatever its size.
+    All chargers share one heartbeat and one last will, since they sit at one
+    station, and one thread samples the telemetry of all of them.
+    """
+
+    def __init__(self, num_chargers, num_cars, station_id, power_kw=50.0):
+        self._logger = logging.getLogger(__name__)
+        self.station_id = station_id
+
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+        self.stm_driver = stmpy.Driver()
+
+        self.chargers = {}
+        for _ in range(num_chargers):
+            charger = charger_logic(10, io=SimulatedIOBackend(), station_id=station_id,
+                                    client=self.client, stm_driver=self.stm_driver, power_kw=power_kw)
+            self.chargers[charger.id] = charger
+
+        self.cars = {}
+        for _ in range(num_cars):
+            car = CarStateMachine(10, io=SimulatedIOBackend(), station_id=station_id,
+                                  client=self.client, stm_driver=self.stm_driver)
+            self.cars[car.id] = car
+
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = threading.Thread(target=self.send_heartbeats, daemon=True)
+        self._telemetry_thread = threading.Thread(target=self.send_telemetry, daemon=True)
+
+        self._routes = {
+            MQTT_TOPIC_CHARGER_OUTPUT.format(self.station_id, ''): self.chargers,
+            MQTT_TOPIC_CAR_OUTPUT.format(''): self.cars,
+        }
+
+    def start(self):
+        self.stm_driver.start(keep_active=True)
+        self.client.will_set(MQTT_TOPIC_SERVER_INPUT.format(self.station_id),
+                             offline_message(self.station_id, list(self.chargers)), qos=1)
+        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        self.client.loop_start()
+        self._heartbeat_thread.start()
+        self._telemetry_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.client.loop_stop()
+        self.stm_driver.stop()
+
+    def send_heartbeats(self):
+        while not self._stop_event.wait(HEARTBEAT_INTERVAL):
+            self.client.publish(MQTT_TOPIC_SERVER_INPUT.format(self.station_id),
+                                heartbeat_message(self.station_id, list(self.chargers)))
+
+    def send_telemetry(self):
+        while not self._stop_event.wait(TELEMETRY_SAMPLE_INTERVAL):
+            now = time.time()
+            for charger in self.chargers.values():
+                charger.sample_telemetry(now)
+
+    def on_connect(self, client, userdata, flags, rc):
+        self._logger.info('Fleet connected with result code {}'.format(rc))
+        # Each device subscribes to its own topic and, for chargers, announces itself
+        for device in list(self.chargers.values()) + list(self.cars.values()):
+            device.on_connect(client, userdata, flags, rc)
+
+    def on_message(self, client, userdata, msg):
+        prefix, _, device_id = msg.topic.rpartition('/')
+        device = self._routes.get(prefix + '/', {}).get(device_id)
+        if device is None:
+            self._logger.warning('No device for topic {}'.format(msg.topic))
+            return
+        device.on_message(client, userdata, msg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run many simulated cars and chargers on one connection.')
+    parser.add_argument('--chargers', type=int, default=100)
+    parser.add_argument('--cars', type=int, default=100)
+    parser.add_argument('--station', type=int, default=1)
+    parser.add_argument('--power', type=float, default=50.0, help='rated power of every charger in kW')
+    args = parser.parse_args()
+
+    fleet = Fleet(args.chargers, args.cars, args.station, args.power)
+    fleet.start()
+    return fleet
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    fleet = main()
+    threading.Event().wait()
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+
+class AreaIndex:
+    """
+    Free chargers and queue lengths of every station, grouped by area.
+
+    Stations report changes themselves (see `Station.area_index`), so the
+    index is always current without rescanning. A station's load is its queue
+    length minus its free chargers, lower is better. Stations are bucketed by
+    load per area and the lowest load is tracked, so the least loaded station
+    of an area is found in O(1). Loads move one step per charger or queue
+    change, which keeps the minimum cheap to maintain. Free chargers and
+    queued cars are also summed per area, for `area_summary`.
+
+    Stations also report which cars they hold a charger or queue place for,
+    so the station a car is already at is found in O(1) wherever it
+    registers again.
+    """
+
+    def __init__(self):
+        # area id -> load -> station ids in the order they reached that load
+        self._buckets = {}
+        self._min_load = {}
+        # area id -> [free chargers, queued cars] over all its stations
+        self._totals = {}
+        # station id -> (area id, load, free chargers, queue length)
+        self._stations = {}
+        # car id -> id of the station holding a charger or queue place for it
+        self._car_stations = {}
+
+    def add_station(self, station):
+        station.area_index = self
+        self.update(station)
+        for car_id in station.cars():
+            self.car_arrived(car_id, station.id)
+
+    def car_arrived(self, car_id, station_id):
+        self._car_stations[car_id] = station_id
+
+    def car_left(self, car_id, station_id):
+        if self._car_stations.get(car_id) == station_id:
+            del self._car_stations[car_id]
+
+    def station_of_car(self, car_id):
+        """The id of the station holding a charger or queue place for `car_id`, or None."""
+        return self._car_stations.get(car_id)
+
+    def add_unloaded(self, station_id, area_id, free_chargers):
+        """Add a station that is not loaded yet, with all its chargers free and no queue."""
+        self._set(station_id, area_id, free_chargers, 0)
+
+    def update(self, station):
+        self._set(station.id, station.area_id, station.available_chargers, len(station.queue))
+
+    def _set(self, station_id, area_id, free, queued):
+        load = queued - free
+
+        entry = self._stations.pop(station_id, None)
+        if entry is not None:
+            self._discard(*entry, station_id)
+
+        self._stations[station_id] = (area_id, load, free, queued)
+        totals = self._totals.setdefault(area_id, [0, 0])
+        totals[0] += free
+        totals[1] += queued
+        self._buckets.setdefault(area_id, {}).setdefault(load, OrderedDict())[station_id] = None
+        if load < self._min_load.get(area_id, load + 1):
+            self._min_load[area_id] = load
+
+    def _discard(self, area_id, load, free, queued, station_id):
+        totals = self._totals[area_id]
+        totals[0] -= free
+        totals[1] -= queued
+
+        buckets = self._buckets[area_id]
+        del buckets[load][station_id]
+        if buckets[load]:
+            return
+
+        del buckets[load]
+        if not buckets:
+            del self._buckets[area_id]
+            del self._min_load[area_id]
+            del self._totals[area_id]
+        elif self._min_load[area_id] == load:
+            # Usually the next load up, a scan is only needed after a jump
+            self._min_load[area_id] = load + 1 if load + 1 in buckets else min(buckets)
+
+    def least_loaded(self, area_id, exclude=None):
+        """Return the id of the least loaded station in the area, or None."""
+        buckets = self._buckets.get(area_id)
+        if not buckets:
+            return None
+
+        min_load = self._min_load[area_id]
+        for station_id in buckets[min_load]:
+            if station_id != exclude:
+                return station_id
+
+        # Only `exclude` has the lowest load, look one bucket further
+        higher = [load for load in buckets if load != min_load]
+        if not higher:
+            return None
+        return next(iter(buckets[min(higher)]))
+
+    def area_summary(self, area_id):
+        """Free chargers and queued cars over the whole area."""
+        free, queued = self._totals.get(area_id, (0, 0))
+        return {'areaId': area_id, 'availableChargers': free, 'queued': queued}
@@ -0,0 +1,87 @@
+from backend.helperClasses.car_queue import CarQueue, PriorityCarQueue
+from backend.helperClasses.charger import power_class
+
+
+class AssignmentPolicy:
+    """
+    Decides which free charger a car gets and in which order queued cars are served.
+
+    `choose_charger` picks among the station's free chargers for a car that
+    asked for `power_kw` (may be None). `queue_priority` gives the key a car
+    is queued under, and `make_queue` the queue type that honours it.
+    """
+
+    name = None
+    uses_priority = False
+
+    def make_queue(self):
+        return CarQueue()
+
+    def queue_priority(self, arrival_time, energy_kwh):
+        return None
+
+    def choose_charger(self, station, power_kw=None):
+        raise NotImplementedError
+
+
+class RandomPolicy(AssignmentPolicy):
+    """Any free charger, first come first served. O(1)."""
+
+    name = 'random'
+
+    def choose_charger(self, station, power_kw=None):
+        return station.get_random_available_charger()
+
+
+class LeastRecentlyUsedPolicy(AssignmentPolicy):
+    """The charger that has been idle longest, to spread wear. O(power classes)."""
+
+    name = 'lru'
+
+    def choose_charger(self, station, power_kw=None):
+        return station.get_least_recently_used_charger()
+
+
+class PowerMatchPolicy(AssignmentPolicy):
+    """
+    A charger in the car's power class if one is free, else the nearest class.
+
+    Keeps rapid chargers free for cars that can use them. Cars that did not
+    say what they need are treated as slow.
+    """
+
+    name = 'power_match'
+
+    def choose_charger(self, station, power_kw=None):
+        preferred = power_class(power_kw) if power_kw is not None else 0
+        return station.get_least_recently_used_charger(preferred)
+
+
+class ReservationPolicy(PowerMatchPolicy):
+    """
+    Power matching plus a priority queue keyed by arrival time and energy.
+
+    Every requested kWh counts as `seconds_per_kwh` of extra waiting, so short
+    top-ups are served before long sessions that arrived at about the same
+    time. Joining and leaving the queue are O(log n).
+    """
+
+    name = 'reservation'
+    uses_priority = True
+
+    def __init__(self, seconds_per_kwh=30.0):
+        self.seconds_per_kwh = seconds_per_kwh
+
+    def make_queue(self):
+        return PriorityCarQueue()
+
+    def queue_priority(self, arrival_time, energy_kwh):
+        return arrival_time + self.seconds_per_kwh * (energy_kwh or 0)
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy, LeastRecentlyUsedPolicy, PowerMatchPolicy,
+                                               ReservationPolicy)}
+
+
+def make_policy(name):
+    return POLICIES[name]()
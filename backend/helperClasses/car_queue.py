@@ -0,0 +1,154 @@
+import heapq
+import itertools
+from collections import OrderedDict
+
+
+class CarQueue:
+    """
+    FIFO queue of car ids with O(1) membership checks and removal by id.
+
+    Every car gets an increasing ticket when it joins. A Fenwick tree over the
+    tickets counts how many cars are still waiting ahead of a given ticket, so
+    position lookups are O(log n) even after cancellations in the middle.
+    """
+
+    __slots__ = ('_tickets', '_capacity', '_tree', '_next_ticket')
+
+    def __init__(self, capacity=8):
+        self._tickets = OrderedDict()
+        self._capacity = capacity
+        self._tree = [0] * (capacity + 1)
+        self._next_ticket = 0
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __iter__(self):
+        return iter(self._tickets)
+
+    def __contains__(self, car_id):
+        return car_id in self._tickets
+
+    def append(self, car_id, priority=None):
+        # Priorities are ignored, cars are always served in arrival order
+        if car_id in self._tickets:
+            return False
+
+        if self._next_ticket >= self._capacity:
+            self._rebuild()
+
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._tickets[car_id] = ticket
+        self._update(ticket, 1)
+        return True
+
+    def priority(self, car_id):
+        return None
+
+    def popleft(self):
+        car_id, ticket = self._tickets.popitem(last=False)
+        self._update(ticket, -1)
+        return car_id
+
+    def remove(self, car_id):
+        ticket = self._tickets.pop(car_id, None)
+        if ticket is None:
+            return False
+
+        self._update(ticket, -1)
+        return True
+
+    def position(self, car_id):
+        """Return the 1-based position of the car, or None if it is not queued."""
+        ticket = self._tickets.get(car_id)
+        if ticket is None:
+            return None
+        return self._prefix_sum(ticket)
+
+    def _rebuild(self):
+        # Renumber the waiting cars from zero, growing the tree if it is crowded
+        self._capacity = max(self._capacity, 2 * len(self._tickets))
+        self._tree = [0] * (self._capacity + 1)
+        self._next_ticket = 0
+        for car_id in self._tickets:
+            self._tickets[car_id] = self._next_ticket
+            self._update(self._next_ticket, 1)
+            self._next_ticket += 1
+
+    def _update(self, ticket, delta):
+        i = ticket + 1
+        while i <= self._capacity:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix_sum(self, ticket):
+        total = 0
+        i = ticket + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class PriorityCarQueue:
+    """
+    Queue of car ids served in priority order, lowest first.
+
+    A binary heap makes joining and popping the next car O(log n). Cancelled
+    cars are dropped lazily when they reach the top, and the heap is rebuilt
+    once it is mostly stale. Cars with equal priority are served in arrival
+    order. Positions need a scan, so `position` is O(n).
+    """
+
+    __slots__ = ('_heap', '_entries', '_counter')
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(sorted(self._entries, key=self._entries.__getitem__))
+
+    def __contains__(self, car_id):
+        return car_id in self._entries
+
+    def append(self, car_id, priority=0):
+        if car_id in self._entries:
+            return False
+
+        # Cars moved over from a FIFO queue have no priority and keep their order
+        key = (priority if priority is not None else 0, next(self._counter))
+        self._entries[car_id] = key
+        heapq.heappush(self._heap, (key, car_id))
+        return True
+
+    def priority(self, car_id):
+        return self._entries[car_id][0]
+
+    def popleft(self):
+        while self._heap:
+            key, car_id = heapq.heappop(self._heap)
+            if self._entries.get(car_id) == key:
+                del self._entries[car_id]
+                return car_id
+        raise IndexError('pop from an empty queue')
+
+    def remove(self, car_id):
+        if self._entries.pop(car_id, None) is None:
+            return False
+
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(key, car_id) for car_id, key in self._entries.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def position(self, car_id):
+        key = self._entries.get(car_id)
+        if key is None:
+            return None
+        return 1 + sum(1 for other in self._entries.values() if other < key)
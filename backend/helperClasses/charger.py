@@ -1,10 +1,99 @@
+# Upper bounds in kW for the slow, fast and rapid charger classes
+POWER_CLASS_LIMITS = (22, 100, float('inf'))
+
+
+def power_class(power_kw):
+    if power_kw is None:
+        return None
+    for index, limit in enumerate(POWER_CLASS_LIMITS):
+        if power_kw <= limit:
+            return index
+
+
+# Bits of Charger._flags
+OPERATIONAL = 1
+CHARGING = 2
+ASSIGNED = 4
+
+# Field names of Charger.state(), as serialized
+STATE_FIELDS = ('carId', 'operational', 'charging', 'assigned', 'powerKw')
+
+
 class Charger:
-    def __init__(self, charger_id):
+    """
+    One charger at a station.
+
+    There can be hundreds of thousands of these, so they use slots and keep
+    their three flags packed in one int.
+    """
+
+    __slots__ = ('id', 'station', 'power_kw', '_car_id', '_flags')
+
+    def __init__(self, charger_id, station=None, power_kw=None):
         self.id = charger_id
-        self.car_id = None
-        self.operational = True
-        self.charging = False
-        self.assigned = False
+        self.station = station
+        self.power_kw = power_kw
+        self._car_id = None
+        self._flags = OPERATIONAL
+
+    def _set_flag(self, flag, value):
+        if value:
+            self._flags |= flag
+        else:
+            self._flags &= ~flag
+
+    @property
+    def car_id(self):
+        return self._car_id
+
+    @car_id.setter
+    def car_id(self, value):
+        if self.station is not None:
+            self.station.update_car(self, value)
+        self._car_id = value
+
+    @property
+    def operational(self):
+        return bool(self._flags & OPERATIONAL)
+
+    @operational.setter
+    def operational(self, value):
+        self._set_flag(OPERATIONAL, value)
+        self._notify_station()
+
+    @property
+    def charging(self):
+        return bool(self._flags & CHARGING)
+
+    @charging.setter
+    def charging(self, value):
+        self._set_flag(CHARGING, value)
+
+    @property
+    def assigned(self):
+        return bool(self._flags & ASSIGNED)
+
+    @assigned.setter
+    def assigned(self, value):
+        self._set_flag(ASSIGNED, value)
+        self._notify_station()
+
+    @property
+    def power_class(self):
+        return power_class(self.power_kw)
+
+    def is_available(self):
+        return self._flags & (OPERATIONAL | ASSIGNED) == OPERATIONAL
+
+    def _notify_station(self):
+        # Keep the station's index of free chargers in sync with our flags
+        if self.station is not None:
+            self.station.update_availability(self)
+
+    def state(self):
+        """The serialized fields as a tuple, in STATE_FIELDS order."""
+        flags = self._flags
+        return self._car_id, bool(flags & OPERATIONAL), bool(flags & CHARGING), bool(flags & ASSIGNED), self.power_kw
 
     def serialize(self):
         return {
@@ -12,5 +101,6 @@ class Charger:
             'carId': self.car_id,
             'operational': self.operational,
             'charging': self.charging,
-            'assigned': self.assigned
-        }
\ No newline at end of file
+            'assigned': self.assigned,
+            'powerKw': self.power_kw
+        }
@@ -0,0 +1,115 @@
+import threading
+
+HIGH = 1
+LOW = 0
+
+PULL_UP = 'pull_up'
+PULL_DOWN = 'pull_down'
+
+FALLING = 'falling'
+RISING = 'rising'
+BOTH = 'both'
+
+
+class IOBackend:
+    """
+    Pin I/O used by the car and charger clients.
+
+    Pins are BCM numbers. `GPIOBackend` drives a Raspberry Pi and
+    `SimulatedIOBackend` keeps pin levels in memory, so the clients can run
+    anywhere and many of them can share one process.
+    """
+
+    def setup_output(self, pin):
+        raise NotImplementedError
+
+    def setup_input(self, pin, pull):
+        raise NotImplementedError
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=None):
+        raise NotImplementedError
+
+    def input(self, pin):
+        raise NotImplementedError
+
+    def output(self, pin, value):
+        raise NotImplementedError
+
+
+class GPIOBackend(IOBackend):
+    def __init__(self):
+        # Imported here so that nothing but a Pi ever needs RPi.GPIO
+        import RPi.GPIO as GPIO
+
+        self._gpio = GPIO
+        self._pulls = {PULL_UP: GPIO.PUD_UP, PULL_DOWN: GPIO.PUD_DOWN}
+        self._edges = {FALLING: GPIO.FALLING, RISING: GPIO.RISING, BOTH: GPIO.BOTH}
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+    def setup_output(self, pin):
+        self._gpio.setup(pin, self._gpio.OUT)
+
+    def setup_input(self, pin, pull):
+        self._gpio.setup(pin, self._gpio.IN, pull_up_down=self._pulls[pull])
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=None):
+        self._gpio.add_event_detect(pin, self._edges[edge], callback=callback, bouncetime=bouncetime)
+
+    def input(self, pin):
+        return HIGH if self._gpio.input(pin) else LOW
+
+    def output(self, pin, value):
+        self._gpio.output(pin, self._gpio.HIGH if value == HIGH else self._gpio.LOW)
+
+
+class SimulatedIOBackend(IOBackend):
+    """
+    In-memory pins for running clients off a Pi.
+
+    Tests and simulators change input levels with `set_input` or `press`,
+    which run edge callbacks the same way the GPIO event thread would.
+    Output levels can be read back with `level`.
+    """
+
+    def __init__(self):
+        self._levels = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def setup_output(self, pin):
+        self._levels[pin] = LOW
+
+    def setup_input(self, pin, pull):
+        self._levels[pin] = HIGH if pull == PULL_UP else LOW
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=None):
+        self._callbacks[pin] = (edge, callback)
+
+    def input(self, pin):
+        return self._levels.get(pin, LOW)
+
+    def output(self, pin, value):
+        self._levels[pin] = value
+
+    def level(self, pin):
+        return self._levels.get(pin, LOW)
+
+    def set_input(self, pin, value):
+        with self._lock:
+            previous = self._levels.get(pin, LOW)
+            self._levels[pin] = value
+
+        edge, callback = self._callbacks.get(pin, (None, None))
+        if callback is None or previous == value:
+            return
+
+        rising = value == HIGH
+        if edge == BOTH or (edge == RISING and rising) or (edge == FALLING and not rising):
+            callback(pin)
+
+    def press(self, pin):
+        """Press and release a pulled-up button."""
+        self.set_input(pin, LOW)
+        self.set_input(pin, HIGH)
@@ -1,39 +1,230 @@
-from collections import deque
+import random
+from collections import OrderedDict
 
+from backend.helperClasses.car_queue import CarQueue
 from backend.helperClasses.charger import Charger
 
 
 class Station:
+    __slots__ = ('id', 'area_id', 'station_name', 'area_name', 'queue', 'requested_power', 'num_chargers',
+                 'unavailable_chargers', '_available_ids', '_available_pos', '_free_by_class', '_free_tick',
+                 '_charger_of_car', 'area_index', 'chargers')
+
     def __init__(self, station_id, area_id, station_name, area_name, num_chargers):
         self.id = station_id
         self.area_id = area_id
         self.station_name = station_name
         self.area_name = area_name
-        self.queue = deque()
+        self.queue = CarQueue()
+        # Power asked for by queued cars, used to match them once a charger frees up
+        self.requested_power = {}
         self.num_chargers = num_chargers
-        self.available_chargers = num_chargers
         self.unavailable_chargers = 0
+
+        # Free and operational chargers, kept as a list plus a position lookup
+        # so both membership updates and random picks are O(1)
+        self._available_ids = []
+        self._available_pos = {}
+
+        # The same free chargers per power class, oldest-freed first, for
+        # least recently used picks
+        self._free_by_class = {}
+        self._free_tick = 0
+
+        # Car id -> id of the charger it holds, kept up to date by the chargers
+        self._charger_of_car = {}
+
+        # Area-level index to report free charger and queue changes to, if any
+        self.area_index = None
+
         self.chargers = self.init_chargers()
 
+    @property
+    def available_chargers(self):
+        return len(self._available_ids)
+
     def init_chargers(self):
         chargers = dict()
         for i in range(1, self.num_chargers+1):
-            chargers.update({i: Charger(i)})
+            chargers.update({i: self._create_charger(i)})
 
         return chargers
 
-    def add_to_queue(self, id):
-        self.queue.append(id)
+    def add_charger(self, charger_id, power_kw=None):
+        charger = self._create_charger(charger_id, power_kw)
+        self.chargers.update({charger_id: charger})
+        return charger
+
+    def remove_charger(self, charger_id):
+        charger = self.chargers.pop(charger_id)
+        # Taking it out of service drops it from the free charger indexes
+        charger.operational = False
+        if self._charger_of_car.get(charger.car_id) == charger_id:
+            del self._charger_of_car[charger.car_id]
+            self._notify_car_left(charger.car_id)
+        charger.station = None
+        self.num_chargers = len(self.chargers)
+        return charger
+
+    def _create_charger(self, charger_id, power_kw=None):
+        charger = Charger(charger_id, station=self, power_kw=power_kw)
+        self.update_availability(charger)
+        return charger
+
+    def set_charger_power(self, charger_id, power_kw):
+        charger = self.chargers[charger_id]
+        free = self._free_by_class.get(charger.power_class, {})
+        if charger.id in free:
+            del free[charger.id]
+            charger.power_kw = power_kw
+            self._add_free(charger)
+        else:
+            charger.power_kw = power_kw
+
+    def update_availability(self, charger):
+        if charger.is_available():
+            if charger.id not in self._available_pos:
+                self._available_pos[charger.id] = len(self._available_ids)
+                self._available_ids.append(charger.id)
+                self._add_free(charger)
+                self._notify_area()
+        elif charger.id in self._available_pos:
+            del self._free_by_class[charger.power_class][charger.id]
+            # Swap the last id into the removed slot to avoid shifting the list
+            pos = self._available_pos.pop(charger.id)
+            last_id = self._available_ids.pop()
+            if last_id != charger.id:
+                self._available_ids[pos] = last_id
+                self._available_pos[last_id] = pos
+            self._notify_area()
+
+    def update_car(self, charger, car_id):
+        if self._charger_of_car.get(charger.car_id) == charger.id:
+            del self._charger_of_car[charger.car_id]
+            self._notify_car_left(charger.car_id)
+        if car_id is not None:
+            self._charger_of_car[car_id] = charger.id
+            if self.area_index is not None:
+                self.area_index.car_arrived(car_id, self.id)
+
+    def cars(self):
+        """Ids of the cars holding a charger or a queue place here."""
+        return list(self._charger_of_car) + list(self.queue)
+
+    def charger_of(self, car_id):
+        """The charger `car_id` holds, or None."""
+        charger_id = self._charger_of_car.get(car_id)
+        return self.chargers[charger_id] if charger_id is not None else None
+
+    def _add_free(self, charger):
+        self._free_tick += 1
+        self._free_by_class.setdefault(charger.power_class, OrderedDict())[charger.id] = self._free_tick
+
+    def _notify_area(self):
+        if self.area_index is not None:
+            self.area_index.update(self)
+
+    def _notify_car_left(self, car_id):
+        if self.area_index is not None:
+            self.area_index.car_left(car_id, self.id)
+
+    def use_queue(self, queue):
+        for car_id in self.queue:
+            queue.append(car_id, self.queue.priority(car_id))
+        self.queue = queue
+        self._notify_area()
+
+    def to_record(self):
+        return {
+            'id': self.id,
+            'area_id': self.area_id,
+            'station_name': self.station_name,
+            'area_name': self.area_name,
+            # Queued cars with the priority and power they were queued with
+            'queue': [[car_id, self.queue.priority(car_id), self.requested_power.get(car_id)]
+                      for car_id in self.queue],
+            'chargers': [
+                [charger.id, charger.car_id, charger.operational, charger.charging, charger.assigned, charger.power_kw]
+                for charger in self.chargers.values()
+            ]
+        }
+
+    @classmethod
+    def from_record(cls, record, queue=None):
+        """Restore a station from `to_record`, queueing its cars in `queue` if given, so priorities survive."""
+        station = cls(record['id'], record['area_id'], record['station_name'], record['area_name'], 0)
+        if queue is not None:
+            station.queue = queue
+        for charger_id, car_id, operational, charging, assigned, *power_kw in record['chargers']:
+            # Records written before chargers had a power rating have no last field
+            charger = station.add_charger(charger_id, power_kw[0] if power_kw else None)
+            charger.car_id = car_id
+            charger.operational = operational
+            charger.charging = charging
+            charger.assigned = assigned
+        station.num_chargers = len(station.chargers)
+        for entry in record['queue']:
+            # Records written before queued cars kept their priority list bare ids
+            car_id, priority, power_kw = entry if isinstance(entry, list) else (entry, None, None)
+            station.add_to_queue(car_id, priority, power_kw)
+        return station
+
+    def get_random_available_charger(self):
+        if not self._available_ids:
+            return None
+        return random.choice(self._available_ids)
+
+    def get_least_recently_used_charger(self, preferred_class=None):
+        """
+        Return the free charger that has been idle longest.
+
+        With a `preferred_class` the search starts in that power class and then
+        tries the nearest classes, higher ones before lower ones. Cost is
+        O(number of classes).
+        """
+        if preferred_class is None:
+            oldest = None
+            for free in self._free_by_class.values():
+                if free:
+                    charger_id, tick = next(iter(free.items()))
+                    if oldest is None or tick < oldest[0]:
+                        oldest = (tick, charger_id)
+            return oldest[1] if oldest is not None else None
+
+        def distance(cls):
+            if cls is None:
+                return 2, 0
+            if cls >= preferred_class:
+                return 0, cls - preferred_class
+            return 1, preferred_class - cls
+
+        classes = [cls for cls, free in self._free_by_class.items() if free]
+        if not classes:
+            return None
+        return next(iter(self._free_by_class[min(classes, key=distance)]))
+
+    def add_to_queue(self, id, priority=None, power_kw=None):
+        if self.queue.append(id, priority):
+            if power_kw is not None:
+                self.requested_power[id] = power_kw
+            self._notify_area()
+            if self.area_index is not None:
+                self.area_index.car_arrived(id, self.id)
+        return self.queue.position(id)
 
     def remove_from_queue(self):
-        self.queue.popleft()
+        car_id = self.queue.popleft()
+        self._notify_area()
+        self._notify_car_left(car_id)
+        return car_id
 
     def remove_element(self, element):
-        new_dq = deque()
-        removed = False
-        for item in self.queue:
-            if item == element and not removed:
-                removed = True
-            else:
-                new_dq.append(item)
-        self.queue = new_dq
+        self.requested_power.pop(element, None)
+        removed = self.queue.remove(element)
+        if removed:
+            self._notify_area()
+            self._notify_car_left(element)
+        return removed
+
+    def queue_position(self, id):
+        return self.queue.position(id)
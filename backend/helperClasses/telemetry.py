@@ -0,0 +1,38 @@
+import struct
+
+# Batch header: format version, timestamp of the first sample, sample count
+TELEMETRY_HEADER = struct.Struct('<BdH')
+# Sample: milliseconds after the first sample, power in kW, state of charge in %
+TELEMETRY_SAMPLE = struct.Struct('<IfB')
+TELEMETRY_VERSION = 1
+
+# State of charge of a sample when the car does not report one
+SOC_UNKNOWN = 255
+
+
+def pack_samples(samples):
+    """
+    Pack (timestamp, power kW, state of charge % or None) samples into one binary batch.
+
+    A sample is 9 bytes instead of the ~60 a JSON object takes.
+    """
+    base = samples[0][0] if samples else 0.0
+    parts = [TELEMETRY_HEADER.pack(TELEMETRY_VERSION, base, len(samples))]
+    for timestamp, power_kw, soc in samples:
+        parts.append(TELEMETRY_SAMPLE.pack(int((timestamp - base) * 1000), power_kw,
+                                           SOC_UNKNOWN if soc is None else int(soc)))
+    return b''.join(parts)
+
+
+def unpack_samples(raw):
+    """Yield (timestamp, power kW, state of charge % or None) from a batch made by `pack_samples`."""
+    if len(raw) < TELEMETRY_HEADER.size:
+        raise ValueError('telemetry batch of {} bytes is shorter than its header'.format(len(raw)))
+    version, base, count = TELEMETRY_HEADER.unpack_from(raw)
+    if version != TELEMETRY_VERSION:
+        raise ValueError('unknown telemetry format version {}'.format(version))
+    if len(raw) != TELEMETRY_HEADER.size + count * TELEMETRY_SAMPLE.size:
+        raise ValueError('telemetry batch of {} bytes does not hold {} samples'.format(len(raw), count))
+
+    for offset_ms, power_kw, soc in TELEMETRY_SAMPLE.iter_unpack(raw[TELEMETRY_HEADER.size:]):
+        yield base + offset_ms / 1000, power_kw, None if soc == SOC_UNKNOWN else soc
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import logging
+import threading
+
+from backend.server.inbox import PriorityInbox
+from backend.server.local_broker import LocalBroker
+from backend.server.metrics import start_http_server
+from backend.server.server import (DATA_DIR, DEFAULT_INPUT_TOPICS, INBOX_CHARGER_OVERFLOW, METRICS_HOST, METRICS_PORT,
+                                   MQTT_BROKER, MQTT_PORT, PRIORITY_OTHER, TIMER_TICK_INTERVAL, Server)
+
+INBOUND_QUEUE_SIZE = 10000
+PUBLISH_BATCH_SIZE = 100
+
+
+def mqtt_client_factory(hostname=MQTT_BROKER, port=MQTT_PORT):
+    # aiomqtt is only needed when talking to a real broker
+    import aiomqtt
+
+    def factory():
+        return aiomqtt.Client(hostname, port, protocol=aiomqtt.ProtocolVersion.V5)
+
+    return factory
+
+
+class AsyncServer(Server):
+    """
+    Asyncio core for the queue server.
+
+    One task reads from the MQTT client, rate limits and queues messages in a
+    bounded priority inbox, which sheds other commands before car commands
+    and car commands before charger status when the server falls behind, as
+    `Server` does. A single worker task owns all station state and handles
+    one message at a time. Searches go to a reader thread instead, which
+    answers them from the search snapshot. Publishes are queued without
+    blocking the worker and sent in batches by a separate task. The command
+    set is the same as `Server`.
+    """
+
+    def __init__(self, client_factory, stations=None, input_topics=DEFAULT_INPUT_TOPICS,
+                 queue_size=INBOUND_QUEUE_SIZE, publish_batch_size=PUBLISH_BATCH_SIZE, data_dir=DATA_DIR):
+        self._logger = logging.getLogger(__name__)
+        self.init_state(stations, data_dir)
+        self.input_topics = input_topics
+        self.client_factory = client_factory
+        self.publish_batch_size = publish_batch_size
+
+        self.inbox = PriorityInbox(queue_size, levels=PRIORITY_OTHER + 1, overflow=INBOX_CHARGER_OVERFLOW)
+        self._inbox_ready = None
+        self.outbound = None
+        self._loop = None
+        self._loop_thread = None
+        self._search_thread = None
+        self._tasks = []
+
+    async def run(self):
+        self._inbox_ready = asyncio.Event()
+        self.outbound = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._search_thread = threading.Thread(target=self._run_search_reader, daemon=True)
+        self._search_thread.start()
+
+        async with self.client_factory() as client:
+            for topic in self.input_topics:
+                await client.subscribe(topic)
+
+            self.init_dashboard()
+            self._tasks = [
+                asyncio.create_task(self._read(client)),
+                asyncio.create_task(self._work()),
+                asyncio.create_task(self._publish_batches(client)),
+                asyncio.create_task(self._tick_dashboard()),
+                asyncio.create_task(self._tick_timers()),
+            ]
+            self._logger.debug('Async server running')
+
+            try:
+                await asyncio.gather(*self._tasks)
+            except asyncio.CancelledError:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+        for task in self._tasks:
+            task.cancel()
+        self.sessions.close()
+        if self.event_log is not None:
+            self.event_log.stop()
+
+    def publish(self, topic, payload):
+        self.count_publish(payload)
+        if threading.get_ident() == self._loop_thread:
+            self.outbound.put_nowait((topic, payload))
+        else:
+            # Search replies come from the reader thread
+            self._loop.call_soon_threadsafe(self.outbound.put_nowait, (topic, payload))
+
+    async def _read(self, client):
+        async for message in client.messages:
+            # Telemetry is buffered right here and never reaches the inbox
+            self.receive_message(str(message.topic), message.payload)
+            self._inbox_ready.set()
+
+    async def _work(self):
+        while True:
+            message = self.inbox.get_nowait()
+            if message is None:
+                self._inbox_ready.clear()
+                await self._inbox_ready.wait()
+                continue
+            self.handle_command(message[1])
+            # Let the reader in between messages
+            await asyncio.sleep(0)
+
+    async def _publish_batches(self, client):
+        while True:
+            batch = [await self.outbound.get()]
+            while len(batch) < self.publish_batch_size and not self.outbound.empty():
+                batch.append(self.outbound.get_nowait())
+
+            for topic, payload in batch:
+                await client.publish(topic, payload=payload)
+
+    async def _tick_dashboard(self):
+        while True:
+            await asyncio.sleep(self.dashboard.tick_interval)
+            try:
+                self.dashboard.flush()
+            except Exception as err:
+                self._logger.error('Dashboard publish failed. {}'.format(err))
+
+    async def _tick_timers(self):
+        while True:
+            await asyncio.sleep(TIMER_TICK_INTERVAL)
+            self.expire_reservations()
+            self.sweep_liveness()
+            self.flush_sessions()
+            self.publish_telemetry()
+            self.refresh_search_replica()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the asyncio queue server.')
+    parser.add_argument('--local', action='store_true', help='use an in-process broker instead of MQTT_BROKER')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    factory = LocalBroker().client if args.local else mqtt_client_factory()
+    server = AsyncServer(factory)
+    if METRICS_PORT:
+        start_http_server(server.metrics, METRICS_HOST, METRICS_PORT)
+    asyncio.run(server.run())
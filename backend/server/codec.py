@@ -0,0 +1,81 @@
+import json
+
+from backend.server.local_broker import topic_matches
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JsonCodec:
+    name = 'json'
+
+    def decode(self, raw):
+        return json.loads(raw.decode('utf-8'))
+
+    def encode(self, data):
+        return json.dumps(data)
+
+
+class OrjsonCodec:
+    name = 'orjson'
+
+    def decode(self, raw):
+        return orjson.loads(raw)
+
+    def encode(self, data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+
+    def decode(self, raw):
+        return msgpack.unpackb(raw, raw=False)
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+
+def available_codecs():
+    codecs = {'json': JsonCodec()}
+    if orjson is not None:
+        codecs['orjson'] = OrjsonCodec()
+    if msgpack is not None:
+        codecs['msgpack'] = MsgpackCodec()
+    return codecs
+
+
+class TopicCodecs:
+    """
+    Picks the payload codec per topic.
+
+    Topics default to JSON, using orjson when it is installed since it reads
+    and writes the same wire format. Clients that want msgpack use topics
+    registered for it, e.g. `.../msgpack/#`. Codecs that are not installed
+    fall back to the default.
+    """
+
+    def __init__(self, topic_codecs=None):
+        self._codecs = available_codecs()
+        self.default = self._codecs.get('orjson', self._codecs['json'])
+        self._rules = [(topic_filter, self._codecs.get(name, self.default))
+                       for topic_filter, name in (topic_codecs or {}).items()]
+
+    def for_topic(self, topic):
+        for topic_filter, codec in self._rules:
+            if topic_matches(topic_filter, topic):
+                return codec
+        return self.default
+
+    def decode(self, topic, raw):
+        return self.for_topic(topic).decode(raw)
+
+    def encode(self, topic, data):
+        return self.for_topic(topic).encode(data)
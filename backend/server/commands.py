@@ -0,0 +1,109 @@
+import time
+
+from backend.server.metrics import Histogram
+
+
+class Schema:
+    """
+    Payload schema compiled once into a flat tuple of checks.
+
+    `required` and `optional` map field names to a type or tuple of types.
+    `validate` returns an error message, or None if the payload is valid.
+    """
+
+    def __init__(self, required=None, optional=None):
+        self._checks = tuple(
+            [(field, types, True) for field, types in (required or {}).items()] +
+            [(field, types, False) for field, types in (optional or {}).items()]
+        )
+        self.fields = frozenset(field for field, _, _ in self._checks)
+
+    def validate(self, payload):
+        for field, types, required in self._checks:
+            value = payload.get(field)
+            if value is None:
+                if required:
+                    return 'missing field {}'.format(field)
+            elif not isinstance(value, types) or (isinstance(value, bool) and bool not in _as_tuple(types)):
+                return 'field {} has type {}'.format(field, type(value).__name__)
+        return None
+
+
+def _as_tuple(types):
+    return types if isinstance(types, tuple) else (types,)
+
+
+class Command:
+    def __init__(self, name, handler, schema, changes_state=False, guard=None):
+        self.name = name
+        self.handler = handler
+        self.schema = schema
+        self.guard = guard
+        self.changes_state = changes_state
+        self.count = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.latency = Histogram()
+
+
+class CommandRegistry:
+    """
+    Dispatch table from command name to handler.
+
+    Payloads are checked against the command's schema, and then against its
+    optional guard (e.g. "the station exists"), before the handler runs, so
+    malformed messages never touch station state. Each command keeps
+    a count, the total time spent in its handler and a latency histogram,
+    which keeps the per-message overhead measurable as commands are added.
+    """
+
+    def __init__(self):
+        self._commands = {}
+
+    def __contains__(self, name):
+        return name in self._commands
+
+    def __iter__(self):
+        return iter(self._commands.values())
+
+    def register(self, name, handler, schema=None, changes_state=False, guard=None):
+        self._commands[name] = Command(name, handler, schema or Schema(), changes_state, guard)
+
+    def get(self, name):
+        return self._commands.get(name)
+
+    def dispatch(self, payload):
+        """Run the handler for the payload's command and return (command, result)."""
+        command = self._commands.get(payload.get('command'))
+        if command is None:
+            raise UnknownCommand(payload.get('command'))
+
+        error = command.schema.validate(payload)
+        if error is None and command.guard is not None:
+            error = command.guard(payload)
+        if error is not None:
+            command.rejected += 1
+            raise InvalidPayload(command.name, error)
+
+        start = time.perf_counter()
+        try:
+            return command, command.handler(payload)
+        except Exception:
+            command.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            command.count += 1
+            command.total_time += elapsed
+            command.latency.observe(elapsed)
+
+
+class UnknownCommand(Exception):
+    def __init__(self, name):
+        super().__init__('Unknown command {}'.format(name))
+
+
+class InvalidPayload(Exception):
+    def __init__(self, name, error):
+        super().__init__('Invalid payload for {}: {}'.format(name, error))
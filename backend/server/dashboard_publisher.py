@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+
+from backend.helperClasses.charger import STATE_FIELDS
+
+# Fields of the charger rows kept between ticks
+CHARGER_FIELDS = ('id',) + STATE_FIELDS
+
+
+class DashboardPublisher:
+    """
+    Coalesces dashboard updates and publishes them as per-station deltas.
+
+    Handlers only mark a station as dirty. Once per tick every dirty station is
+    serialized, compared with what was last sent, and published as a delta
+    carrying a per-station sequence number. Every `snapshot_every` messages a
+    full snapshot is sent instead, so dashboards that missed a delta resync.
+    Chargers are kept as state tuples between ticks, and dicts are only built
+    for the chargers that go into a message.
+    """
+
+    def __init__(self, publish, get_station, lock, tick_interval=0.5, snapshot_every=20):
+        self._logger = logging.getLogger(__name__)
+        self._publish = publish
+        self._get_station = get_station
+        self._lock = lock
+        self.tick_interval = tick_interval
+        self.snapshot_every = snapshot_every
+
+        self._dirty = set()
+        self._force_snapshot = set()
+        self._sent = {}
+        self._seq = {}
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def mark_dirty(self, station_id):
+        with self._lock:
+            self._dirty.add(station_id)
+
+    def request_snapshot(self, station_id):
+        with self._lock:
+            self._dirty.add(station_id)
+            self._force_snapshot.add(station_id)
+
+    def publish_all_snapshots(self, station_ids):
+        with self._lock:
+            messages = [self._snapshot_message(station_id) for station_id in station_ids]
+        self._publish(json.dumps(messages))
+
+    def flush(self):
+        with self._lock:
+            messages = []
+            for station_id in self._dirty:
+                message = self._build_message(station_id)
+                if message is not None:
+                    messages.append(message)
+            self._dirty.clear()
+            self._force_snapshot.clear()
+
+        for message in messages:
+            self._publish(json.dumps(message))
+
+    def _run(self):
+        while not self._stop_event.wait(self.tick_interval):
+            try:
+                self.flush()
+            except Exception as err:
+                self._logger.error('Dashboard publish failed. {}'.format(err))
+
+    def _build_message(self, station_id):
+        previous = self._sent.get(station_id)
+        seq = self._seq.get(station_id, 0)
+
+        if previous is None or station_id in self._force_snapshot:
+            return self._snapshot_message(station_id)
+
+        state = self._station_state(station_id)
+        changes = {key: value for key, value in state.items()
+                   if key != 'chargers' and previous.get(key) != value}
+
+        previous_chargers = previous['chargers']
+        chargers = {}
+        for charger_id, charger in state['chargers'].items():
+            old = previous_chargers.get(charger_id)
+            if old is None:
+                chargers[charger_id] = dict(zip(CHARGER_FIELDS, charger))
+            elif old != charger:
+                chargers[charger_id] = {field: value for field, value, old_value in zip(CHARGER_FIELDS, charger, old)
+                                        if value != old_value}
+        removed = [charger_id for charger_id in previous_chargers if charger_id not in state['chargers']]
+
+        if not changes and not chargers and not removed:
+            return None
+
+        if (seq + 1) % self.snapshot_every == 0:
+            return self._snapshot_message(station_id)
+
+        seq += 1
+        self._seq[station_id] = seq
+        self._sent[station_id] = state
+
+        message = {'type': 'delta', 'id': station_id, 'seq': seq}
+        message.update(changes)
+        if chargers:
+            message['chargers'] = chargers
+        if removed:
+            message['removedChargers'] = removed
+        return message
+
+    def _snapshot_message(self, station_id):
+        state = self._station_state(station_id)
+        seq = self._seq.get(station_id, 0) + 1
+        self._seq[station_id] = seq
+        self._sent[station_id] = state
+
+        message = {'type': 'snapshot', 'id': station_id, 'seq': seq}
+        message.update(state)
+        message['chargers'] = [dict(zip(CHARGER_FIELDS, charger)) for charger in state['chargers'].values()]
+        return message
+
+    def _station_state(self, station_id):
+        station = self._get_station(station_id)
+        return {
+            'stationName': station.station_name,
+            'availableChargers': station.available_chargers,
+            'unavailableChargers': station.unavailable_chargers,
+            'queue': list(station.queue),
+            'queueLength': len(station.queue),
+            'chargers': {str(charger.id): (charger.id,) + charger.state() for charger in station.chargers.values()}
+        }
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+
+class DedupCache:
+    """
+    Replies to recently handled requests, by request key.
+
+    A command whose key (see `request_key` in the server) is still in the
+    cache is a duplicate delivery or a retry: it is answered with the stored replies
+    instead of running again. Entries expire `ttl` seconds after they were
+    stored and the least recently used ones are evicted beyond `capacity`,
+    so the cache stays bounded under any load. Expired entries are dropped
+    from the front as new ones are stored, and on lookup.
+    """
+
+    def __init__(self, capacity=100000, ttl=600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        # request key -> (stored at, replies), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        """Return the replies stored for `key`, or None if it has not been seen."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now - self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, replies, now):
+        self._entries[key] = (now, replies)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        while self._entries:
+            stored_at, _ = next(iter(self._entries.values()))
+            if stored_at > now - self.ttl:
+                break
+            self._entries.popitem(last=False)
@@ -0,0 +1,129 @@
+import glob
+import json
+import logging
+import os
+import threading
+
+SEGMENT_PATTERN = 'events-{:012d}.log'
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+class EventLog:
+    """
+    Append-only log of state-changing commands, split into segments.
+
+    Appends go to an in-memory batch that a background thread writes and
+    fsyncs every `commit_interval` seconds (group commit), so a burst of
+    commands costs one fsync. Anything appended within the last interval can
+    be lost on a crash. `sync` forces a commit.
+
+    A snapshot records the sequence number it covers. Writing one starts a new
+    segment and deletes the old ones, so recovery only replays the tail.
+    """
+
+    def __init__(self, data_dir, commit_interval=0.01):
+        self._logger = logging.getLogger(__name__)
+        self.data_dir = data_dir
+        self.commit_interval = commit_interval
+        os.makedirs(data_dir, exist_ok=True)
+
+        self.seq = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._open_segment(self.seq + 1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+
+    def append(self, entry):
+        self.seq += 1
+        line = json.dumps({'seq': self.seq, **entry}) + '\n'
+        with self._lock:
+            self._pending.append(line)
+        return self.seq
+
+    def sync(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending and self._file is not None:
+                self._file.write(''.join(pending))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def load_snapshot(self):
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        self.seq = snapshot['seq']
+        return snapshot
+
+    def write_snapshot(self, state, sessions=()):
+        """Persist `state`, and the charging sessions open at the time, as covering every entry appended so far."""
+        self.sync()
+        snapshot = {'seq': self.seq, 'state': state, 'sessions': list(sessions)}
+
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            current = self._open_segment(self.seq + 1)
+            old_segments = [segment for segment in self._segments() if segment != current]
+        for segment in old_segments:
+            os.remove(segment)
+
+    def replay(self):
+        """Yield logged entries newer than the loaded snapshot, in order."""
+        for segment in self._segments():
+            with open(segment, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn write at the end of the last segment
+                        self._logger.warning('Skipping damaged log entry in {}'.format(segment))
+                        continue
+                    if entry['seq'] > self.seq:
+                        self.seq = entry['seq']
+                        yield entry
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.data_dir, SEGMENT_PATTERN.replace('{:012d}', '*'))))
+
+    def _open_segment(self, first_seq):
+        path = os.path.join(self.data_dir, SEGMENT_PATTERN.format(first_seq))
+        self._file = open(path, 'a+', encoding='utf-8')
+        # Terminate a torn last line so new entries start on a line of their own
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != '\n':
+                self._file.write('\n')
+        return path
+
+    def _run(self):
+        while not self._stop_event.wait(self.commit_interval):
+            try:
+                self.sync()
+            except Exception as err:
+                self._logger.error('Event log commit failed. {}'.format(err))
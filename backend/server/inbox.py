@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+
+
+class PriorityInbox:
+    """
+    Bounded inbound message queue with priority levels, 0 being the highest.
+
+    `get` returns the oldest message of the highest non-empty level. When the
+    inbox holds `maxsize` messages, a new one evicts the newest message of a
+    strictly lower level, or is shed itself if there is none. Level 0 may
+    also use `overflow` slots beyond `maxsize` before it is shed, so charger
+    state outlasts a full inbox for a while but the inbox stays bounded.
+    `put` never blocks, so the thread reading from the broker never waits
+    behind the server.
+    """
+
+    def __init__(self, maxsize, levels=3, overflow=0):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._levels = [deque() for _ in range(levels)]
+        self._size = 0
+        self._ready = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def lengths(self):
+        return [len(level) for level in self._levels]
+
+    def put(self, priority, item):
+        """Queue `item` and return the (priority, item) shed to make room, or None."""
+        shed = None
+        with self._ready:
+            if self._size >= self.maxsize:
+                shed = self._evict_below(priority)
+                if shed is None and (priority > 0 or self._size >= self.maxsize + self.overflow):
+                    return priority, item
+            self._levels[priority].append(item)
+            self._size += 1
+            self._ready.notify()
+        return shed
+
+    def _evict_below(self, priority):
+        for level in range(len(self._levels) - 1, priority, -1):
+            if self._levels[level]:
+                self._size -= 1
+                return level, self._levels[level].pop()
+        return None
+
+    def get_nowait(self):
+        """Return (priority, item), or None if the inbox is empty."""
+        with self._ready:
+            return self._pop()
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds for a message, return (priority, item) or None."""
+        with self._ready:
+            if not self._size:
+                self._ready.wait(timeout)
+            return self._pop()
+
+    def _pop(self):
+        for priority, level in enumerate(self._levels):
+            if level:
+                self._size -= 1
+                return priority, level.popleft()
+        return None
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+
+class LivenessTracker:
+    """
+    When each charger was last heard from, in the order it was heard.
+
+    A heartbeat moves the charger to the back of an ordered dict, so the
+    chargers that have been silent longest are always at the front. A sweep
+    pops from the front until it reaches one that is still fresh. There is no
+    timer per charger and a sweep costs O(1) plus the chargers it finds stale.
+
+    `offline` holds the chargers the server took out of service because they
+    went silent, as opposed to chargers reported out of order. Only those are
+    put back when they are heard from again.
+    """
+
+    def __init__(self, timeout, forget_after):
+        self.timeout = timeout
+        self.forget_after = forget_after
+
+        self._last_seen = OrderedDict()
+        # Silent chargers, by when they were found silent
+        self._lapsed = OrderedDict()
+        self.offline = set()
+        self._revived = set()
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def seen(self, key, now):
+        self._lapsed.pop(key, None)
+        self._last_seen.pop(key, None)
+        self._last_seen[key] = now
+        if key in self.offline:
+            self._revived.add(key)
+
+    def forget(self, key):
+        self._last_seen.pop(key, None)
+        self._lapsed.pop(key, None)
+        self.offline.discard(key)
+        self._revived.discard(key)
+
+    def sweep(self, now):
+        """
+        Return (stale, forgotten, revived) charger keys.
+
+        Stale chargers have been silent for `timeout` seconds, forgotten ones
+        for `forget_after` seconds more. Revived chargers are offline ones
+        heard from since the last sweep.
+        """
+        stale = []
+        while self._last_seen:
+            key, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > now - self.timeout:
+                break
+            del self._last_seen[key]
+            self._lapsed[key] = now
+            stale.append(key)
+
+        forgotten = []
+        while self._lapsed:
+            key, lapsed_at = next(iter(self._lapsed.items()))
+            if lapsed_at > now - self.forget_after:
+                break
+            del self._lapsed[key]
+            forgotten.append(key)
+
+        revived = list(self._revived)
+        self._revived.clear()
+        return stale, forgotten, revived
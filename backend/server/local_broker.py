@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+from collections import namedtuple
+
+Message = namedtuple('Message', ['topic', 'payload'])
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic matching with `+` and `#` wildcards."""
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an MQTT broker.
+
+    Supports wildcards and `$share/<group>/<filter>` shared subscriptions,
+    which are served round robin. Clients look like `aiomqtt.Client`, so the
+    async server, benchmarks and simulators can run without a real broker.
+    """
+
+    def __init__(self):
+        self._subscriptions = []
+        self._shared = {}
+
+    def client(self):
+        return LocalClient(self)
+
+    def subscribe(self, client, topic_filter):
+        if topic_filter.startswith('$share/'):
+            _, group, topic_filter = topic_filter.split('/', 2)
+            members, _ = self._shared.get((group, topic_filter), ([], None))
+            members.append(client)
+            self._shared[(group, topic_filter)] = (members, itertools.cycle(members))
+        else:
+            self._subscriptions.append((topic_filter, client))
+
+    def unsubscribe_all(self, client):
+        self._subscriptions = [(f, c) for f, c in self._subscriptions if c is not client]
+        for key, (members, _) in list(self._shared.items()):
+            members = [member for member in members if member is not client]
+            if members:
+                self._shared[key] = (members, itertools.cycle(members))
+            else:
+                del self._shared[key]
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        message = Message(topic, payload)
+
+        for topic_filter, client in self._subscriptions:
+            if topic_matches(topic_filter, topic):
+                client.deliver(message)
+
+        for (group, topic_filter), (members, members_cycle) in self._shared.items():
+            if topic_matches(topic_filter, topic):
+                next(members_cycle).deliver(message)
+
+
+class LocalClient:
+    def __init__(self, broker):
+        self._broker = broker
+        self._queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._broker.unsubscribe_all(self)
+
+    async def subscribe(self, topic_filter, qos=0):
+        self._broker.subscribe(self, topic_filter)
+
+    async def publish(self, topic, payload=None, qos=0):
+        self._broker.publish(topic, payload)
+
+    def deliver(self, message):
+        self._queue.put_nowait(message)
+
+    @property
+    def messages(self):
+        return self._iter_messages()
+
+    async def _iter_messages(self):
+        while True:
+            yield await self._queue.get()
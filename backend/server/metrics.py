@@ -0,0 +1,146 @@
+import bisect
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum, as Prometheus histograms have."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Counters updated on the hot path, and everything else read at scrape time.
+
+    Updating a counter is a dict lookup and an add under a lock of its own,
+    since both the thread reading messages and the one handling them count. Gauges and histograms come from
+    collectors that return their labelled values when scraped, so e.g.
+    per-station gauges cost nothing until then.
+    `render` produces the Prometheus text format, holding `lock` so it sees a
+    consistent state.
+    """
+
+    def __init__(self, lock, prefix='charging_ahead'):
+        self._lock = lock
+        self.prefix = prefix
+        self._help = {}
+        self._counters = {}
+        self._counter_lock = threading.Lock()
+        self._collectors = []
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, labels=()):
+        with self._counter_lock:
+            counter = self._counters.setdefault(name, {})
+            counter[labels] = counter.get(labels, 0) + value
+
+    def add_collector(self, collect):
+        """
+        Register `collect()`, which yields (name, type, {labels: value}).
+
+        `type` is 'gauge', 'counter' or 'histogram' (values are then Histograms).
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            return self._render()
+
+    def _render(self):
+        lines = []
+        with self._counter_lock:
+            families = [(name, 'counter', dict(values)) for name, values in self._counters.items()]
+        for collect in self._collectors:
+            families += list(collect())
+
+        for name, kind, values in families:
+            full_name = '{}_{}'.format(self.prefix, name)
+            if name in self._help:
+                lines.append('# HELP {} {}'.format(full_name, self._help[name]))
+            lines.append('# TYPE {} {}'.format(full_name, kind))
+            for labels, value in values.items():
+                if kind == 'histogram':
+                    lines.extend(_histogram_lines(full_name, labels, value))
+                else:
+                    lines.append('{}{} {}'.format(full_name, _labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels) + '}'
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield '{}_bucket{} {}'.format(name, _labels(labels + (('le', le),)), cumulative)
+    yield '{}_sum{} {}'.format(name, _labels(labels), histogram.sum)
+    yield '{}_count{} {}'.format(name, _labels(labels), histogram.count)
+
+
+class SampledLog:
+    """
+    Logs one in `every` events as a JSON line, with the number of events it stands for.
+
+    Replaces per-message printing on the hot path: skipped events cost a
+    counter increment.
+    """
+
+    def __init__(self, logger, every=100):
+        self._logger = logger
+        self.every = every
+        self._seen = {}
+
+    def log(self, event, fields):
+        seen = self._seen.get(event, 0) + 1
+        self._seen[event] = seen
+        if seen % self.every == 1 or self.every == 1:
+            self._logger.info(json.dumps({'event': event, 'sample_rate': self.every, 'seen': seen, **fields},
+                                         default=str))
+
+
+def start_http_server(metrics, host, port):
+    """Serve `metrics.render()` at /metrics from a daemon thread and return the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
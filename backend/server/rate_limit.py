@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """
+    A token bucket per client.
+
+    Each client may send `burst` messages at once and `rate` per second after
+    that. Buckets are kept for the `max_clients` most recently seen clients;
+    one evicted after going quiet would have refilled anyway, unless it was
+    evicted within `burst / rate` seconds, so the limit is only approximate
+    when more than `max_clients` clients are active at once.
+    """
+
+    def __init__(self, rate, burst, max_clients=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> [tokens, last refill], least recently seen first
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, client, now, cost=1.0):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
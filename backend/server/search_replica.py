@@ -0,0 +1,101 @@
+import threading
+
+from backend.server.station_registry import build_station
+from backend.server.station_search import StationSearchIndex, search_order
+
+
+class SearchReplica:
+    """
+    Station searches served from a snapshot, without the server lock.
+
+    The snapshot maps station id to its serialized summary and is never
+    changed once published: `refresh` copies it, re-serializes the stations
+    marked dirty since the last refresh and swaps the copy in (copy on
+    write). Both run on the write path under the server lock. Readers take
+    the current snapshot with a single attribute read, so a search never
+    waits for, or blocks, the handlers and sees every station as of the same
+    refresh.
+
+    Results are in `search_order`, the same order the shard router merges
+    partial results from several servers in.
+
+    Stations that have not changed since they were read from the registry
+    file are summarized from their row, as the file describes them, and never
+    hydrated by a search. `build_index_in_background` builds the name index on
+    its own thread once the server has booted, outside the server lock.
+    Searches wait only for the names to be normalized and scan them until the
+    n-grams are ready.
+    """
+
+    def __init__(self, stations, summarize):
+        self._stations = stations
+        self._summarize = summarize
+        self._snapshot = {}
+        self._dirty = set()
+
+        self._index = None
+        self._index_lock = threading.Lock()
+        self.index_ready = threading.Event()
+        self._row_summaries = {}
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def mark_dirty(self, station_id):
+        self._dirty.add(station_id)
+
+    def refresh(self):
+        if not self._dirty:
+            return
+
+        snapshot = dict(self._snapshot)
+        for station_id in self._dirty:
+            snapshot[station_id] = self._summarize(self._stations[station_id])
+        self._dirty.clear()
+        self._snapshot = snapshot
+
+    @property
+    def index(self):
+        with self._index_lock:
+            if self._index is None:
+                index = StationSearchIndex()
+                # Added in `search_order`, which the index returns matches in
+                for station_id in sorted(self._stations, key=search_order):
+                    index.add_station(self._stations.describe(station_id))
+                self._index = index
+        return self._index
+
+    def build_index_in_background(self):
+        thread = threading.Thread(target=self._build_index, name='search-index', daemon=True)
+        thread.start()
+        return thread
+
+    def _build_index(self):
+        self.index.build_ngrams()
+        self.index_ready.set()
+
+    def search(self, search_string, offset=0, limit=None):
+        """Return (total number of matches, summaries for the requested page)."""
+        snapshot = self._snapshot
+        matches = self.index.match(search_string)
+        total = len(matches)
+        end = total if limit is None else offset + limit
+
+        summaries = []
+        for station_id in matches[offset:end]:
+            summary = snapshot.get(station_id) or self._row_summary(station_id)
+            # A station added since the last refresh without a registry row is
+            # left out until the next one
+            if summary is not None:
+                summaries.append(summary)
+        return total, summaries
+
+    def _row_summary(self, station_id):
+        summary = self._row_summaries.get(station_id)
+        if summary is None:
+            row = self._stations.row(station_id)
+            if row is None:
+                return None
+            summary = self._summarize(build_station(row))
+            self._row_summaries[station_id] = summary
+        return summary
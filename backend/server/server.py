@@ -1,27 +1,246 @@
-import json
-import random
+import os
+import threading
+import time
 
 import stmpy
 import logging
 
 import paho.mqtt.client as mqtt
 
-from backend.helperClasses.charger import Charger
+from backend.helperClasses.area_index import AreaIndex
+from backend.helperClasses.assignment import make_policy
 from backend.helperClasses.station import Station
+from backend.server.codec import TopicCodecs
+from backend.server.commands import CommandRegistry, InvalidPayload, Schema, UnknownCommand
+from backend.server.dashboard_publisher import DashboardPublisher
+from backend.server.dedup import DedupCache
+from backend.server.event_log import EventLog
+from backend.server.inbox import PriorityInbox
+from backend.server.liveness import LivenessTracker
+from backend.server.metrics import Metrics, SampledLog, start_http_server
+from backend.server.rate_limit import RateLimiter
+from backend.server.search_replica import SearchReplica
+from backend.server.session_store import SessionStore
+from backend.server.station_registry import StationRegistry, load_registry
+from backend.server.telemetry_pipeline import TelemetryPipeline
+from backend.server.timer_wheel import TimerWheel
+from backend.server.wait_estimator import WaitEstimator
 
 MQTT_BROKER = 'broker.hivemq.com'
 MQTT_PORT = 1883
 
 MQTT_TOPIC_INPUT = 'charging_ahead/queue/server_input'
+MQTT_TOPIC_STATION_INPUT = MQTT_TOPIC_INPUT + '/station/{}'
 MQTT_TOPIC_OUTPUT = 'charging_ahead/queue/server_output'
+MQTT_TOPIC_CAR_OUTPUT = 'charging_ahead/queue/car/{}'
+MQTT_TOPIC_CHARGER_OUTPUT = 'charging_ahead/queue/station/{}/charger/{}'
 MQTT_TOPIC_DASHBOARD_UPDATE = 'charging_ahead/dashboard/update'
+MQTT_TOPIC_DASHBOARD_TELEMETRY = 'charging_ahead/dashboard/telemetry'
+
+# Shard routers collect partial search results on their own topic of this
+# form. Searches that name a reply topic may only name one of these
+MQTT_TOPIC_SEARCH_REPLY = 'charging_ahead/queue/router/{}/search_reply'
+
+# Chargers publish packed telemetry batches (backend.helperClasses.telemetry)
+# here, one topic per charger
+MQTT_TOPIC_TELEMETRY = 'charging_ahead/telemetry/station/{}/charger/{}'
+
+# Server instances in the same group share the input topics, the broker hands
+# each message to only one of them (MQTT v5 shared subscriptions)
+MQTT_SHARED_GROUP = 'charging_ahead_server'
+
+SEARCH_RESULT_LIMIT = 50
+
+# Searches skip the inbox and are answered by a reader thread from a snapshot
+# of the stations refreshed every timer tick, so they never wait for the lock
+SEARCH_COMMAND = 'status_available_charger'
+SEARCH_INBOX_SIZE = 1000
+
+# Charger assignment policy, one of backend.helperClasses.assignment.POLICIES
+ASSIGNMENT_POLICY = os.environ.get('CHARGING_AHEAD_ASSIGNMENT_POLICY', 'random')
+
+# Station registry file (.csv or .json), the built-in demo stations are used if unset
+STATION_REGISTRY = os.environ.get('CHARGING_AHEAD_STATION_REGISTRY')
+
+# Prometheus scrape endpoint at http://METRICS_HOST:METRICS_PORT/metrics, port 0 turns it off
+METRICS_HOST = os.environ.get('CHARGING_AHEAD_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('CHARGING_AHEAD_METRICS_PORT', 9464))
+
+# One in this many replies is logged
+REPLY_LOG_SAMPLE_EVERY = 100
+
+# Directory for the event log and snapshots, state is kept in memory only if unset
+DATA_DIR = os.environ.get('CHARGING_AHEAD_DATA_DIR')
+SNAPSHOT_EVERY = 10000
+
+# Charging session history, kept in DATA_DIR next to the event log
+SESSION_DB_NAME = 'sessions.sqlite3'
+STATISTICS_DEFAULT_HOURS = 24
+
+# Samples kept per charging session (15 minutes at one a second), and the
+# buckets they are reduced to for the dashboard
+TELEMETRY_BUFFER_SIZE = 900
+TELEMETRY_BUCKET_SECONDS = 10.0
+TELEMETRY_PUBLISH_INTERVAL = 5.0
+
+# Messages each client may send per second, and in one burst, before the
+# rest are dropped. Clients are told apart by their client, charger or car id
+CLIENT_RATE_LIMIT = float(os.environ.get('CHARGING_AHEAD_CLIENT_RATE_LIMIT', 10))
+CLIENT_BURST = 20
+
+# Inbound messages wait here for the worker, charger state ahead of cars
+# ahead of searches. A full inbox sheds the lowest priority messages, charger
+# state only once INBOX_CHARGER_OVERFLOW more are waiting
+INBOX_SIZE = 10000
+INBOX_CHARGER_OVERFLOW = 1000
+PRIORITY_CHARGER = 0
+PRIORITY_CAR = 1
+PRIORITY_OTHER = 2
+COMMAND_PRIORITIES = {
+    'charger_available': PRIORITY_CHARGER,
+    'charger_connected': PRIORITY_CHARGER,
+    'out_of_order': PRIORITY_CHARGER,
+    'reservation_expired': PRIORITY_CHARGER,
+    'chargers_offline': PRIORITY_CHARGER,
+    'chargers_online': PRIORITY_CHARGER,
+    'chargers_removed': PRIORITY_CHARGER,
+    'register_to_queue': PRIORITY_CAR,
+    'unregister_from_queue': PRIORITY_CAR,
+    'queue_position': PRIORITY_CAR,
+}
+
+# State-changing commands may carry a `request_id`. Its replies are kept this
+# many seconds, and for at most this many requests, to answer retries and
+# duplicate deliveries without running the command again
+DEDUP_TTL = 600.0
+DEDUP_CACHE_SIZE = 100000
+
+DASHBOARD_TICK_INTERVAL = 0.5
+DASHBOARD_SNAPSHOT_EVERY = 20
+
+# Assumed session length before a station has measured any, and how far a
+# queued car's ETA has to move before it is sent an update
+ETA_PRIOR_SECONDS = 1800.0
+ETA_PUSH_THRESHOLD = 60.0
+
+# Seconds an assigned car has to plug in before the charger goes to the next car
+RESERVATION_TIMEOUT = float(os.environ.get('CHARGING_AHEAD_RESERVATION_TIMEOUT', 300))
+TIMER_TICK_INTERVAL = 1.0
+
+# Chargers heartbeat every 10 s. One silent for LIVENESS_TIMEOUT seconds is
+# taken out of service, and removed after STALE_CHARGER_TIMEOUT more
+LIVENESS_TIMEOUT = 30.0
+STALE_CHARGER_TIMEOUT = 24 * 3600.0
+
+NUMBER_TYPES = (int, float)
+
+# Station ids are ints in the registry but may arrive as strings, charger ids
+# are either pre-created ints or the random strings devices announce
+ID_TYPES = (int, str)
+
+
+def default_stations():
+    return {
+        1: Station(station_id=1, area_id=1, station_name="Sluppen", area_name="Trondheim", num_chargers=4),
+        2: Station(station_id=2, area_id=1, station_name="Lade", area_name="Trondheim", num_chargers=4),
+        3: Station(station_id=3, area_id=2, station_name="Sandvika", area_name="Oslo", num_chargers=8),
+        4: Station(station_id=4, area_id=1, station_name="Øya", area_name="Trondheim", num_chargers=4)
+    }
+
+
+def as_replies(data):
+    # Handlers return one reply, or a list when several devices are told
+    return data if isinstance(data, list) else [data] if data is not None else []
+
+
+def request_key(payload):
+    """
+    Dedup cache key of a command, or None if it has no usable `request_id`.
+
+    Request ids are only unique per sender, e.g. counters, so the key also
+    names the command, the station and the car or charger that sent it.
+    """
+    request_id = payload.get('request_id')
+    if not isinstance(request_id, ID_TYPES):
+        return None
+    sender = payload.get('car_id') if payload.get('car_id') is not None else payload.get('charger_id')
+    # Stringified, as the fields are not validated yet and must be hashable
+    return str(payload.get('command')), str(payload.get('station_id')), str(sender), request_id
+
+
+def client_of(payload):
+    """The sender of a message as far as rate limiting goes. Clients without an id share one bucket."""
+    if payload.get('client_id') is not None:
+        return 'client', str(payload.get('client_id'))
+    if payload.get('charger_id') is not None:
+        # Charger ids are only unique within a station
+        return 'charger', str(payload.get('station_id')), str(payload.get('charger_id'))
+    if payload.get('charger_ids') is not None:
+        # A last will names the one charger, or the fleet, that sent it
+        charger_ids = payload.get('charger_ids')
+        charger_ids = tuple(map(str, charger_ids)) if isinstance(charger_ids, list) else str(charger_ids)
+        return 'chargers', str(payload.get('station_id')), charger_ids
+    for field in ('car_id', 'reply_topic', 'station_id'):
+        if payload.get(field) is not None:
+            return field, str(payload.get(field))
+    return 'anonymous', None
+
+
+# Shared with the shard router, which checks searches before scattering them
+SEARCH_SCHEMA = Schema(optional={'search_string': str, 'offset': int, 'limit': int,
+                                 'reply_topic': str, 'request_id': str})
+
+
+def search_page(payload):
+    """(search string, offset, limit) of a search that passed SEARCH_SCHEMA, missing or null fields defaulted."""
+    offset = payload.get('offset')
+    limit = payload.get('limit')
+    return (payload.get('search_string') or '',
+            max(offset, 0) if offset is not None else 0,
+            max(min(limit, SEARCH_RESULT_LIMIT), 0) if limit is not None else SEARCH_RESULT_LIMIT)
+
+
+def is_search_reply_topic(topic):
+    prefix, _, suffix = MQTT_TOPIC_SEARCH_REPLY.partition('{}')
+    if not topic.startswith(prefix) or not topic.endswith(suffix):
+        return False
+    router_id = topic[len(prefix):len(topic) - len(suffix)]
+    return bool(router_id) and not any(c in router_id for c in '/+#')
+
+
+def shared_topic(topic, group=MQTT_SHARED_GROUP):
+    return '$share/{}/{}'.format(group, topic)
+
+
+def station_input_topic(station_id):
+    return MQTT_TOPIC_STATION_INPUT.format(station_id)
+
+
+# Payload codec per topic, anything not listed is JSON
+MQTT_TOPIC_CODECS = {
+    station_input_topic('+') + '/msgpack': 'msgpack',
+}
+
+TELEMETRY_TOPIC_PREFIX = MQTT_TOPIC_TELEMETRY.split('{}')[0]
+
+DEFAULT_INPUT_TOPICS = (
+    shared_topic(MQTT_TOPIC_INPUT),
+    shared_topic(station_input_topic('+')),
+    shared_topic(station_input_topic('+') + '/msgpack'),
+    shared_topic(MQTT_TOPIC_TELEMETRY.format('+', '+')),
+)
 
 
 class Server:
-    def __init__(self):
+    def __init__(self, stations=None, input_topics=DEFAULT_INPUT_TOPICS, data_dir=DATA_DIR, metrics_port=METRICS_PORT):
         """
         Start the server.
 
+        `stations` defaults to the full station set. When running sharded, each
+        worker gets its own slice and only subscribes to `input_topics` for it.
+        With a `data_dir`, state changes are logged there and restored on start.
+        Metrics are served on `metrics_port` unless it is 0.
+
         ## Start of MQTT
         We subscribe to the topic(s) the component listens to.
         The client is available as variable `self.client` so that subscriptions
@@ -34,21 +253,16 @@ class Server:
         print('logging under name {}.'.format(__name__))
         self._logger.info('Starting Component')
 
-        self.stations = {
-            1: Station(station_id=1, area_id=1, station_name="Sluppen", area_name="Trondheim", num_chargers=4),
-            2: Station(station_id=2, area_id=1, station_name="Lade", area_name="Trondheim", num_chargers=4),
-            3: Station(station_id=3, area_id=2, station_name="Sandvika", area_name="Oslo", num_chargers=8),
-            4: Station(station_id=4, area_id=1, station_name="Øya", area_name="Trondheim", num_chargers=4)
-        }
+        self.init_state(stations, data_dir)
+        self.input_topics = input_topics
 
         self._logger.debug('Connecting to MQTT broker {} at port {}'.format(MQTT_BROKER, MQTT_PORT))
-        self.mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+        self.mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, protocol=mqtt.MQTTv5)
 
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
 
         self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
-        self.mqtt_client.subscribe(MQTT_TOPIC_INPUT)
         self.mqtt_client.loop_start()
 
         self.stm_driver = stmpy.Driver()
@@ -56,67 +270,461 @@ class Server:
         self._logger.debug('Server initialization finished')
 
         self.init_dashboard()
+        self.dashboard.start()
+
+        self._timer_thread = threading.Thread(target=self._run_timers, daemon=True)
+        self._timer_thread.start()
+        self._worker_thread = threading.Thread(target=self._run_worker, daemon=True)
+        self._worker_thread.start()
+        self._search_thread = threading.Thread(target=self._run_search_reader, daemon=True)
+        self._search_thread.start()
+
+        if metrics_port:
+            start_http_server(self.metrics, METRICS_HOST, metrics_port)
+
+    def init_state(self, stations, data_dir=None):
+        """Set up station state, independent of how messages reach the server."""
+        if stations is None:
+            stations = load_registry(STATION_REGISTRY) if STATION_REGISTRY else default_stations()
+        if not isinstance(stations, StationRegistry):
+            stations = StationRegistry(stations=stations)
+
+        # Charger picks and clock readings made while handling the current
+        # command, logged so a replay makes the same decisions
+        self._choices = None
+        self._replay_choices = None
+
+        self.assignment = make_policy(ASSIGNMENT_POLICY)
+
+        # Kept current by the stations themselves, so it is also right after a replay
+        self.area_index = AreaIndex()
+
+        # Assigned chargers waiting for their car, keyed by (station id, charger id).
+        # Armed again while replaying, so bookings survive a restart
+        self.reservations = TimerWheel(tick=TIMER_TICK_INTERVAL, now=time.time())
+
+        # Only chargers that have announced themselves or sent a heartbeat are
+        # tracked, pre-created chargers without a device are left alone
+        self.liveness = LivenessTracker(LIVENESS_TIMEOUT, STALE_CHARGER_TIMEOUT)
+
+        self.wait_estimator = WaitEstimator(ETA_PRIOR_SECONDS, push_threshold=ETA_PUSH_THRESHOLD)
+
+        self.dedup = DedupCache(DEDUP_CACHE_SIZE, DEDUP_TTL)
+        self.rate_limiter = RateLimiter(CLIENT_RATE_LIMIT, CLIENT_BURST)
+        self.inbox = PriorityInbox(INBOX_SIZE, levels=PRIORITY_OTHER + 1, overflow=INBOX_CHARGER_OVERFLOW)
+        self.search_inbox = PriorityInbox(SEARCH_INBOX_SIZE, levels=1)
+        self._stop_event = threading.Event()
+
+        # Heartbeats are merged per station as they arrive and applied once a
+        # timer tick, so they are neither rate limited nor queued
+        self._heartbeats = {}
+        self._heartbeat_lock = threading.Lock()
+
+        self.telemetry = TelemetryPipeline(TELEMETRY_BUFFER_SIZE, TELEMETRY_BUCKET_SECONDS,
+                                           TELEMETRY_PUBLISH_INTERVAL)
+
+        # Stations already loaded are prepared here, the rest as they are first used
+        self.stations = stations
+        self.search_replica = SearchReplica(self.stations, self.serialize_station_summary)
+        self.stations.on_hydrate = self.prepare_station
+        for station in self.stations.values():
+            self.prepare_station(station)
+
+        self.event_log = None
+        snapshot = None
+        if data_dir is not None:
+            self.event_log = EventLog(data_dir)
+            snapshot = self.event_log.load_snapshot()
+            if snapshot is not None:
+                for record in snapshot['state']:
+                    self.stations.add(Station.from_record(record, self.assignment.make_queue()))
+
+        # Session history lives next to the event log, or in memory without one.
+        # Sessions open at the snapshot are reopened, so their end is recorded
+        self.sessions = SessionStore(os.path.join(data_dir, SESSION_DB_NAME) if data_dir is not None else ':memory:')
+        if snapshot is not None:
+            self.sessions.restore(snapshot.get('sessions', ()))
+
+        for row in self.stations.unloaded():
+            self.area_index.add_unloaded(row.id, row.area_id, row.num_chargers)
+
+        self.lock = threading.RLock()
+        self.init_metrics()
+        self.dashboard = DashboardPublisher(
+            publish=self.publish_dashboard,
+            get_station=self.stations.get,
+            lock=self.lock,
+            tick_interval=DASHBOARD_TICK_INTERVAL,
+            snapshot_every=DASHBOARD_SNAPSHOT_EVERY,
+        )
+
+        self.codecs = TopicCodecs(MQTT_TOPIC_CODECS)
+        self.register_commands()
+
+        if self.event_log is not None:
+            self.replay_event_log()
+            self.event_log.start()
+
+        self.search_replica.refresh()
+        self.search_replica.build_index_in_background()
+
+    def prepare_station(self, station):
+        queue = self.assignment.make_queue()
+        if type(station.queue) is not type(queue):
+            station.use_queue(queue)
+
+        self.area_index.add_station(station)
+        self.search_replica.mark_dirty(station.id)
 
-    def on_connect(self, client, userdata, flags, rc):
+        for charger in station.chargers.values():
+            if charger.assigned:
+                # Snapshots do not record when sessions started, so these count as just reserved
+                self.wait_estimator.session_reserved(station.id, charger.id)
+            if charger.assigned and not charger.charging:
+                self.reservations.schedule((station.id, charger.id), time.time() + RESERVATION_TIMEOUT)
+            if charger.charging:
+                self.telemetry.start_session(station.id, charger.id)
+
+    def init_metrics(self):
+        self.metrics = Metrics(self.lock)
+        self.metrics.describe('messages_received_total', 'MQTT messages received')
+        self.metrics.describe('received_bytes_total', 'Payload bytes received')
+        self.metrics.describe('messages_dropped_total', 'Messages dropped before reaching a handler')
+        self.metrics.describe('published_messages_total', 'Messages published')
+        self.metrics.describe('published_bytes_total', 'Payload bytes published')
+        self.metrics.describe('command_seconds', 'Time spent in command handlers')
+        self.metrics.describe('station_queue_length', 'Cars queued per loaded station')
+        self.metrics.describe('station_free_chargers', 'Free operational chargers per loaded station')
+        self.metrics.describe('telemetry_samples_total', 'Telemetry samples buffered')
+        self.metrics.describe('messages_shed_total', 'Messages dropped from or kept out of a full inbox')
+        self.metrics.describe('inbox_length', 'Messages waiting for the worker')
+        self.metrics.describe('search_inbox_length', 'Searches waiting for the reader')
+        self.metrics.describe('search_snapshot_stations', 'Stations in the search snapshot')
+        self.metrics.describe('duplicate_requests_total', 'Requests answered from the dedup cache')
+        self.metrics.describe('dedup_cache_entries', 'Request ids remembered for deduplication')
+        self.metrics.describe('telemetry_sessions', 'Charging sessions with a telemetry buffer')
+        self.metrics.add_collector(self.collect_metrics)
+
+        self.reply_log = SampledLog(self._logger, REPLY_LOG_SAMPLE_EVERY)
+
+    def collect_metrics(self):
+        commands = list(self.commands)
+        yield 'commands_total', 'counter', {(('command', c.name),): c.count for c in commands}
+        yield 'commands_rejected_total', 'counter', {(('command', c.name),): c.rejected for c in commands}
+        yield 'commands_failed_total', 'counter', {(('command', c.name),): c.failed for c in commands}
+        yield 'command_seconds', 'histogram', {(('command', c.name),): c.latency for c in commands if c.count}
+
+        stations = self.stations.values()
+        yield 'station_queue_length', 'gauge', {(('station', s.id),): len(s.queue) for s in stations}
+        yield 'station_free_chargers', 'gauge', {(('station', s.id),): s.available_chargers for s in stations}
+        yield 'stations_loaded', 'gauge', {(): len(stations)}
+        yield 'reservations_pending', 'gauge', {(): len(self.reservations)}
+        yield 'telemetry_sessions', 'gauge', {(): len(self.telemetry)}
+        yield 'dedup_cache_entries', 'gauge', {(): len(self.dedup)}
+        yield 'inbox_length', 'gauge', {(('priority', priority),): length
+                                        for priority, length in enumerate(self.inbox.lengths())}
+        yield 'search_inbox_length', 'gauge', {(): len(self.search_inbox)}
+        yield 'search_snapshot_stations', 'gauge', {(): len(self.search_replica)}
+
+    def replay_event_log(self):
+        # Sessions closed in the log were written to the session store already
+        self.sessions.recording = False
+        replayed = 0
+        for entry in self.event_log.replay():
+            self._replay_choices = entry['choices']
+            try:
+                _, data = self.commands.dispatch(entry['payload'])
+                # Retries of requests handled before the restart are still recognised
+                key = request_key(entry['payload'])
+                if key is not None:
+                    self.dedup.put(key, as_replies(data), time.time())
+            except Exception as err:
+                self._logger.error('Could not replay event {}. {}'.format(entry['seq'], err))
+            replayed += 1
+        self._replay_choices = None
+        self.sessions.recording = True
+        self._logger.info('Replayed {} logged events'.format(replayed))
+
+    def log_event(self, payload):
+        self.event_log.append({'payload': payload, 'choices': self._choices})
+        if self.event_log.seq % SNAPSHOT_EVERY == 0:
+            self.event_log.write_snapshot([station.to_record() for station in self.stations.values()],
+                                          self.sessions.open_sessions())
+
+    def register_commands(self):
+        station = Schema(required={'station_id': ID_TYPES})
+        car = Schema(required={'car_id': ID_TYPES, 'station_id': ID_TYPES})
+        registration = Schema(required={'car_id': ID_TYPES, 'station_id': ID_TYPES},
+                              optional={'power_kw': NUMBER_TYPES, 'energy_kwh': NUMBER_TYPES,
+                                        'allow_redirect': bool})
+        charger = Schema(required={'charger_id': ID_TYPES, 'station_id': ID_TYPES})
+        announcement = Schema(required={'charger_id': ID_TYPES, 'station_id': ID_TYPES},
+                              optional={'power_kw': NUMBER_TYPES})
+        charger_batch = Schema(required={'station_id': ID_TYPES, 'charger_ids': list})
+        statistics = Schema(optional={'station_id': ID_TYPES, 'area_id': ID_TYPES, 'hours': NUMBER_TYPES})
+
+        self.commands = CommandRegistry()
+        self.commands.register('status_available_charger', self.search_stations, SEARCH_SCHEMA,
+                               guard=self.check_search)
+        self.commands.register('register_to_queue', self.register_to_queue, registration,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('queue_position', self.get_queue_position, car, guard=self.check_station)
+        self.commands.register('unregister_from_queue', self.unregister_from_queue, car,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('charger_connected', self.charger_connected, charger,
+                               changes_state=True, guard=self.check_charger)
+        self.commands.register('charger_available', self.charger_available, announcement,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('out_of_order', self.charger_out_of_order, charger,
+                               changes_state=True, guard=self.check_charger)
+        self.commands.register('reservation_expired', self.reservation_expired, charger,
+                               changes_state=True, guard=self.check_charger)
+        self.commands.register('heartbeat', self.heartbeat, charger_batch, guard=self.check_station)
+        self.commands.register('chargers_offline', self.chargers_offline, charger_batch,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('chargers_online', self.chargers_online, charger_batch,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('chargers_removed', self.chargers_removed, charger_batch,
+                               changes_state=True, guard=self.check_station)
+        self.commands.register('statistics', self.get_statistics, statistics, guard=self.check_statistics)
+        self.commands.register('dashboard_resync', self.resync_dashboard, station, guard=self.check_station)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         self._logger.debug('MQTT connected to {}'.format(client))
+        # Subscribing here restores the subscriptions after a reconnect
+        for topic in self.input_topics:
+            client.subscribe(topic)
 
     def on_message(self, client, userdata, msg):
-        self._logger.debug('Incoming message to topic {}'.format(msg.topic))
+        # Runs on paho's network thread, which only decodes and queues
+        self.receive_message(msg.topic, msg.payload)
 
+    def receive_message(self, topic, raw_payload):
+        """Queue a message from the broker. Never raises, an exception here would stop the reading thread or task."""
         try:
-            payload = json.loads(msg.payload.decode("utf-8"))
+            self.enqueue_message(topic, raw_payload)
         except Exception as err:
-            self._logger.error('Message sent to topic {} had no valid JSON. Message ignored. {}'.format(msg.topic, err))
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'error'),))
+            self._logger.error('Message sent to topic {} could not be queued. Message ignored. {}'.format(topic, err))
+
+    def handle_message(self, topic, raw_payload):
+        """Decode and handle a message right away, bypassing rate limits and the inbox."""
+        payload = self.decode_message(topic, raw_payload)
+        if payload is not None:
+            self.handle_command(payload)
+
+    def enqueue_message(self, topic, raw_payload):
+        """Decode a message and queue it for the worker, unless its client is over its rate or the inbox is full."""
+        payload = self.decode_message(topic, raw_payload)
+        if payload is None:
             return
 
         command = payload.get('command')
-        self._logger.debug('Command in message is {}'.format(command))
+        if not isinstance(command, str):
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'no_command'),))
+            self._logger.error('Message sent to topic {} has no command name. Message ignored.'.format(topic))
+            return
+
+        if command == 'heartbeat':
+            self.collect_heartbeat(payload)
+            return
+
+        priority = COMMAND_PRIORITIES.get(command, PRIORITY_OTHER)
+        if not self.rate_limiter.allow(client_of(payload), time.monotonic()):
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'rate_limited'), ('priority', priority)))
+            return
+
+        if command == SEARCH_COMMAND:
+            shed = self.search_inbox.put(0, payload)
+        else:
+            shed = self.inbox.put(priority, payload)
+        if shed is not None:
+            self.metrics.inc('messages_shed_total', labels=(('priority', shed[0]),))
+            self._logger.debug('Inbox full, shed a %s message', shed[1].get('command'))
+
+    def collect_heartbeat(self, payload):
+        error = self.commands.get('heartbeat').schema.validate(payload)
+        if error is not None:
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'invalid_heartbeat'),))
+            return
 
+        charger_ids = [charger_id for charger_id in payload.get('charger_ids') if isinstance(charger_id, ID_TYPES)]
+        with self._heartbeat_lock:
+            self._heartbeats.setdefault(payload.get('station_id'), set()).update(charger_ids)
+
+    def apply_heartbeats(self):
+        with self._heartbeat_lock:
+            heartbeats, self._heartbeats = self._heartbeats, {}
+        for station_id, charger_ids in heartbeats.items():
+            self.handle_command({'command': 'heartbeat', 'station_id': station_id, 'charger_ids': list(charger_ids)})
+
+    def _run_worker(self):
+        while not self._stop_event.is_set():
+            message = self.inbox.get(timeout=0.5)
+            if message is not None:
+                self.handle_command(message[1])
+
+    def _run_search_reader(self):
+        while not self._stop_event.is_set():
+            message = self.search_inbox.get(timeout=0.5)
+            if message is not None:
+                self.handle_search(message[1])
+
+    def handle_search(self, payload):
+        """Answer a search from the snapshot, without the server lock."""
         try:
-            if command == 'status_available_charger':
-                data = self.get_available_chargers(payload)
-                self.publish_command(data)
+            _, data = self.commands.dispatch(payload)
+            for reply in as_replies(data):
+                self.publish_command(reply)
+        except InvalidPayload as err:
+            self._logger.warning('Message ignored. {}'.format(err))
+        except Exception as err:
+            self._logger.error('Invalid arguments to command. {}'.format(err))
+
+    def decode_message(self, topic, raw_payload):
+        """Return the payload of a command message, or None if it was telemetry or is dropped."""
+        # Lazy %-formatting, this runs for every message even with debug logging off
+        self._logger.debug('Incoming message to topic %s', topic)
+        self.metrics.inc('messages_received_total')
+        self.metrics.inc('received_bytes_total', len(raw_payload))
 
-            elif command == 'register_to_queue':
-                data = self.register_to_queue(payload)
-                self.publish_command(data)
+        # Telemetry is the bulk of the traffic and never touches station state,
+        # so it skips the codecs, the command registry and the server lock
+        if topic.startswith(TELEMETRY_TOPIC_PREFIX):
+            self.handle_telemetry(topic, raw_payload)
+            return None
 
-            elif command == 'unregister_from_queue':
-                self.unregister_from_queue(payload)
+        try:
+            payload = self.codecs.decode(topic, raw_payload)
+        except Exception as err:
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'undecodable'),))
+            self._logger.error('Message sent to topic {} could not be decoded. Message ignored. {}'.format(topic, err))
+            return None
 
-            elif command == 'charger_connected':
-                self.charger_connected(payload)
+        if not isinstance(payload, dict):
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'not_object'),))
+            self._logger.error('Message sent to topic {} is not an object. Message ignored.'.format(topic))
+            return None
 
-            elif command == 'charger_available':
-                self.charger_available(payload)
+        return payload
 
-            elif command == 'out_of_order':
-                self.charger_out_of_order(payload)
+    def handle_telemetry(self, topic, raw_payload):
+        *_, station_id, _, charger_id = topic.split('/')
+        try:
+            accepted = self.telemetry.ingest(station_id, charger_id, raw_payload)
+        except ValueError as err:
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'bad_telemetry'),))
+            self._logger.error('Telemetry sent to topic {} could not be decoded. {}'.format(topic, err))
+            return
 
-            self.update_dashboard(payload.get('station_id'))
+        if accepted is None:
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'no_session'),))
+        else:
+            self.metrics.inc('telemetry_samples_total', accepted)
 
+    def handle_command(self, payload):
+        """Run a decoded command, log it if it changes state and publish the replies."""
+        self._logger.debug('Command in message is %s', payload.get('command'))
 
+        try:
+            with self.lock:
+                self._choices = []
+
+                key = request_key(payload) if self.is_state_changing(payload.get('command')) else None
+                if key is not None and self.answer_duplicate(key):
+                    return
+
+                command, data = self.commands.dispatch(payload)
+
+                if command.changes_state and self.event_log is not None:
+                    self.log_event(payload)
+
+                replies = as_replies(data)
+                if key is not None:
+                    self.dedup.put(key, replies, time.time())
+                for reply in replies:
+                    self.publish_command(reply)
+
+                if command.changes_state:
+                    self.station_changed(payload.get('station_id'))
+                    # A car may have been sent to another station in the area
+                    for reply in replies:
+                        if reply.get('station_id') not in (None, payload.get('station_id')):
+                            self.station_changed(reply.get('station_id'))
+
+        except UnknownCommand as err:
+            self.metrics.inc('messages_dropped_total', labels=(('reason', 'unknown_command'),))
+            self._logger.warning('Message ignored. {}'.format(err))
+        except InvalidPayload as err:
+            self._logger.warning('Message ignored. {}'.format(err))
         except Exception as err:
             self._logger.error('Invalid arguments to command. {}'.format(err))
 
+    def is_state_changing(self, name):
+        command = self.commands.get(name)
+        return command is not None and command.changes_state
+
+    def answer_duplicate(self, key):
+        """Publish the replies again if the request `key` was handled already, and return whether it was."""
+        replies = self.dedup.get(key, time.time())
+        if replies is None:
+            return False
+
+        self.metrics.inc('duplicate_requests_total', labels=(('command', key[0]),))
+        self._logger.debug('Request %s was handled already, replies sent again', key)
+        for reply in replies:
+            self.publish_command(reply)
+        return True
+
+    def get_station(self, station_id):
+        station = self.stations.get(station_id)
+        if station is None and isinstance(station_id, str) and station_id.isdigit():
+            station = self.stations.get(int(station_id))
+        return station
+
+    def check_station(self, payload):
+        if self.get_station(payload.get('station_id')) is None:
+            return 'unknown station {}'.format(payload.get('station_id'))
+        return None
+
+    def check_charger(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        if station is None:
+            return 'unknown station {}'.format(payload.get('station_id'))
+        if payload.get('charger_id') not in station.chargers:
+            return 'unknown charger {}'.format(payload.get('charger_id'))
+        return None
+
+    def check_search(self, payload):
+        reply_topic = payload.get('reply_topic')
+        if reply_topic and not is_search_reply_topic(reply_topic):
+            return 'reply_topic {} is not a search reply topic'.format(reply_topic)
+        return None
+
+    def check_statistics(self, payload):
+        if payload.get('hours') is not None and payload.get('hours') <= 0:
+            return 'hours must be positive, got {}'.format(payload.get('hours'))
+        return None
+
+    def search_stations(self, payload):
+        if payload.get('reply_topic'):
+            data = self.get_shard_search_result(payload)
+            self.publish(payload.get('reply_topic'), self.codecs.encode(payload.get('reply_topic'), data))
+            return None
+
+        return self.get_available_chargers(payload)
+
     def get_available_chargers(self, payload):
-        search_string = payload.get('search_string', '').lower()
-        matching_stations = []
+        search_string, offset, limit = search_page(payload)
 
-        for station in self.stations.values():
-            if search_string in station.station_name.lower() or search_string in station.area_name.lower():
-                matching_stations.append({
-                    'id': station.id,
-                    'name': station.station_name,
-                    'availableChargers': self.get_num_available_chargers(station.id),
-                    'queue': list(station.queue),
-                    'chargers': [charger.serialize() for charger in station.chargers.values()]
-                })
+        total, matching_stations = self.search_replica.search(search_string, offset=offset, limit=limit)
 
         if matching_stations:
             return {
                 'command': 'available_chargers',
-                'stations': matching_stations
+                'stations': matching_stations,
+                'total': total,
+                'offset': offset
             }
         else:
             return {
@@ -124,153 +732,425 @@ class Server:
                 'message': 'No matching station or area found.'
             }
 
+    def get_shard_search_result(self, payload):
+        # A shard returns everything up to the end of the requested page so the
+        # router can merge results from all shards before slicing the page
+        search_string, offset, limit = search_page(payload)
+
+        total, matching_stations = self.search_replica.search(search_string, limit=offset + limit)
+
+        return {
+            'command': 'search_partial',
+            'request_id': payload.get('request_id'),
+            'total': total,
+            'stations': matching_stations
+        }
+
+    def serialize_station_summary(self, station):
+        return {
+            'id': station.id,
+            'name': station.station_name,
+            'availableChargers': station.available_chargers,
+            'queue': list(station.queue),
+            'chargers': [charger.serialize() for charger in station.chargers.values()]
+        }
+
+    def find_overflow_station(self, station):
+        """Return the least loaded other station in the area if it has a free charger."""
+        station_id = self.area_index.least_loaded(station.area_id, exclude=station.id)
+        if station_id is None or self.stations[station_id].available_chargers == 0:
+            return None
+        return self.stations[station_id]
+
     def register_to_queue(self, payload):
         car_id = payload.get('car_id')
-        station = self.stations.get(payload.get('station_id'))
+        station = self.get_station(payload.get('station_id'))
+        power_kw = payload.get('power_kw')
+
+        # A car registering again, e.g. a retry without a request id, keeps its
+        # place, also when it was sent to another station in the area
+        existing = self.area_index.station_of_car(car_id)
+        if existing is not None:
+            held = self.stations[existing]
+            charger = held.charger_of(car_id)
+            if charger is not None and charger.assigned:
+                return {
+                    'command': 'charger_assigned', 'car_id': car_id, 'charger_id': charger.id, 'station_id': held.id
+                }
+            if car_id in held.queue:
+                return {'command': 'registered_in_queue', 'car_id': car_id, 'station_id': held.id,
+                        'position': held.queue_position(car_id)}
+
+        alternative = None
+        if station.available_chargers == 0:
+            alternative = self.find_overflow_station(station)
+            if alternative is not None and payload.get('allow_redirect'):
+                self._logger.debug(f'Station {station.id} is full, sending car {car_id} to station {alternative.id}')
+                station, alternative = alternative, None
 
         if self.get_num_available_chargers(station.id) > 0:
 
-            charger_id = self.get_random_available_charger(station)
+            charger_id = self.choose_charger(station, power_kw)
 
             data = {
-                'command': 'charger_assigned', 'car_id': car_id, 'charger_id': charger_id
+                'command': 'charger_assigned', 'car_id': car_id, 'charger_id': charger_id, 'station_id': station.id
             }
 
-            charger = station.chargers[charger_id]
-            charger.car_id = car_id
-            charger.assigned = True
+            self.assign_charger(station, charger_id, car_id)
 
             self._logger.debug(
                 f"There are { self.get_num_available_chargers(station.id)} chargers left at station {station.id}")
         else:
-            station.add_to_queue(car_id)
+            priority = None
+            if self.assignment.uses_priority:
+                priority = self.assignment.queue_priority(self.decide(time.time), payload.get('energy_kwh'))
+            position = station.add_to_queue(car_id, priority, power_kw)
 
             data = {
-                'command': 'registered_in_queue', 'car_id': car_id, 'position': len(station.queue)
+                'command': 'registered_in_queue', 'car_id': car_id, 'position': position,
+                'area': self.area_index.area_summary(station.area_id)
             }
-            self._logger.debug(f'No chargers available, your position is {len(station.queue)}')
+            if alternative is not None:
+                # Offer the free station, the car can register there instead
+                data['alternative'] = {
+                    'station_id': alternative.id,
+                    'name': alternative.station_name,
+                    'availableChargers': alternative.available_chargers
+                }
+            self._logger.debug(f'No chargers available, your position is {position}')
 
         return data
 
+    def get_queue_position(self, payload):
+        car_id = payload.get('car_id')
+        station = self.get_station(payload.get('station_id'))
+
+        eta = self.wait_estimator.last_eta(station.id, car_id)
+
+        return {
+            'command': 'queue_position', 'car_id': car_id, 'position': station.queue_position(car_id),
+            'eta_seconds': round(eta) if eta is not None else None
+        }
+
     def unregister_from_queue(self, payload):
         car_id = payload.get('car_id')
-        station = self.stations.get(payload.get('station_id'))
+        station = self.get_station(payload.get('station_id'))
 
         # If the element is assigned to a charger, remove it
-        for charger in station.chargers.values():
-            if charger.car_id == car_id:
-                charger.car_id = None
-                charger.charging = False
-                charger.assigned = False
+        charger = station.charger_of(car_id)
+        if charger is not None:
+            self.wait_estimator.session_cancelled(station.id, charger.id)
+            self.reservations.cancel((station.id, charger.id))
+            self.sessions.released(station, charger.id, time.time(), 'cancelled')
+            self.telemetry.end_session(station.id, charger.id)
+            charger.car_id = None
+            charger.charging = False
+            charger.assigned = False
 
         # If the element is in the queue, remove it
         station.remove_element(car_id)
 
         self._logger.debug(f'car {car_id} is now removed')
 
+        # A charger it gave up goes to the next car in line
+        return self.assign_next_in_queue(station)
+
     def charger_connected(self, payload):
         charger_id = payload.get('charger_id')
-        station = self.stations.get(int(payload.get('station_id')))
+        station = self.get_station(payload.get('station_id'))
 
         station.chargers[charger_id].charging = True
+        self.reservations.cancel((station.id, charger_id))
+        now = self.decide(time.time)
+        self.wait_estimator.session_started(station.id, charger_id, now)
+        self.sessions.connected(station, charger_id, now)
+        self.telemetry.start_session(station.id, charger_id)
 
         self._logger.debug(
             f"Charger {charger_id} has been connected to car {station.chargers.get(charger_id).car_id}")
 
     def charger_available(self, payload):
-        station = self.stations.get(payload.get('station_id'))
+        station = self.get_station(payload.get('station_id'))
         charger_id = payload.get('charger_id')
 
         if charger_id not in station.chargers:
-            charger = Charger(charger_id)
-            station.chargers.update({charger_id: charger})
+            station.add_charger(charger_id, payload.get('power_kw'))
+        elif payload.get('power_kw') is not None:
+            station.set_charger_power(charger_id, payload.get('power_kw'))
 
         charger = station.chargers[charger_id]
         charger.operational = True
+        self.liveness.offline.discard((station.id, charger_id))
+        self.liveness.seen((station.id, charger_id), time.time())
 
         car_id = station.chargers[charger_id].car_id
 
         if car_id is not None:
             self._logger.debug(f"Charger {charger_id} has been disconnected from {car_id} and is now free")
+            if charger.charging:
+                now = self.decide(time.time)
+                self.wait_estimator.session_ended(station.id, charger_id, now)
+                self.sessions.released(station, charger_id, now, 'completed')
+            else:
+                self.wait_estimator.session_cancelled(station.id, charger_id)
+                self.sessions.released(station, charger_id, time.time(), 'cancelled')
+            self.telemetry.end_session(station.id, charger_id)
+            self.reservations.cancel((station.id, charger_id))
             charger.car_id = None
             charger.charging = False
             charger.assigned = False
 
-        if len(station.queue) > 0:
+        return self.assign_next_in_queue(station)
 
-            car_id = station.queue.popleft()
-            charger_id = self.get_random_available_charger(station)
-
-            charger = station.chargers[charger_id]
-            charger.car_id = car_id
-            charger.assigned = True
+    def reservation_expired(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        charger = station.chargers[payload.get('charger_id')]
 
-            self._logger.debug(f'Car {car_id} has been assigned charger {charger_id}')
+        # The car may have plugged in or left while the expiry was on its way
+        if not charger.assigned or charger.charging:
+            return None
+
+        car_id = charger.car_id
+        self._logger.debug(f'Car {car_id} did not arrive at charger {charger.id}, releasing it')
+        self.reservations.cancel((station.id, charger.id))
+        self.wait_estimator.session_cancelled(station.id, charger.id)
+        self.sessions.released(station, charger.id, time.time(), 'no_show')
+        charger.car_id = None
+        charger.assigned = False
+
+        replies = [{
+            'command': 'reservation_expired', 'car_id': car_id, 'charger_id': charger.id, 'station_id': station.id
+        }]
+        assignment = self.assign_next_in_queue(station)
+        if assignment is not None:
+            replies.append(assignment)
+        return replies
+
+    def assign_charger(self, station, charger_id, car_id):
+        charger = station.chargers[charger_id]
+        charger.car_id = car_id
+        charger.assigned = True
+        # Logged, so a replayed session keeps its assignment time
+        now = self.decide(time.time)
+        self.reservations.schedule((station.id, charger_id), now + RESERVATION_TIMEOUT)
+        self.wait_estimator.session_reserved(station.id, charger_id)
+        self.sessions.assigned(station, charger_id, car_id, now)
+
+    def assign_next_in_queue(self, station):
+        if len(station.queue) == 0 or station.available_chargers == 0:
+            return None
+
+        car_id = station.remove_from_queue()
+        charger_id = self.choose_charger(station, station.requested_power.pop(car_id, None))
+        self.assign_charger(station, charger_id, car_id)
+
+        self._logger.debug(f'Car {car_id} has been assigned charger {charger_id}')
+
+        return {
+            'command': 'charger_assigned', 'car_id': car_id, 'charger_id': charger_id, 'station_id': station.id,
+            'queue': list(station.queue)
+        }
 
-            data = {
-                'command': 'charger_assigned', 'car_id': car_id, 'charger_id': charger_id, 'queue': list(station.queue)
-            }
+    def expire_reservations(self):
+        with self.lock:
+            expired = self.reservations.expire(time.time())
+
+        for station_id, charger_id in expired:
+            self.handle_command({'command': 'reservation_expired', 'station_id': station_id, 'charger_id': charger_id})
+
+    def flush_sessions(self):
+        with self.lock:
+            self.sessions.flush()
+
+    def _run_timers(self):
+        while not self._stop_event.wait(TIMER_TICK_INTERVAL):
+            self.expire_reservations()
+            self.sweep_liveness()
+            self.flush_sessions()
+            self.publish_telemetry()
+            self.refresh_search_replica()
+
+    def refresh_search_replica(self):
+        with self.lock:
+            self.search_replica.refresh()
+
+    def publish_telemetry(self):
+        """Send the dashboard the downsampled telemetry of sessions with new samples, one message per station."""
+        updates = self.telemetry.drain(time.time())
+        if not updates:
+            return
 
-            self.publish_command(data)
+        by_station = {}
+        for (station_id, charger_id), buckets in updates.items():
+            by_station.setdefault(station_id, {})[str(charger_id)] = buckets
+        messages = [{'type': 'telemetry', 'id': station_id, 'bucketSeconds': self.telemetry.bucket_seconds,
+                     'chargers': chargers} for station_id, chargers in by_station.items()]
+        self.publish(MQTT_TOPIC_DASHBOARD_TELEMETRY, self.codecs.encode(MQTT_TOPIC_DASHBOARD_TELEMETRY, messages))
+
+    def get_statistics(self, payload):
+        """Hourly usage, peak hours and utilization over the last `hours`, for a station, an area or everything."""
+        end = time.time()
+        hours = payload.get('hours', STATISTICS_DEFAULT_HOURS)
+        start = end - hours * 3600
+
+        station_id, area_id, chargers = None, payload.get('area_id'), None
+        if payload.get('station_id') is not None:
+            station = self.get_station(payload.get('station_id'))
+            if station is None:
+                return {'command': 'statistics', 'message': 'Unknown station {}.'.format(payload.get('station_id'))}
+            station_id, area_id, chargers = station.id, None, station.num_chargers
+
+        charging = self.sessions.charging_seconds(start, end, station_id, area_id)
+        return {
+            'command': 'statistics',
+            'station_id': station_id,
+            'area_id': area_id,
+            'hours': hours,
+            'hourly': self.sessions.hourly(start, end, station_id, area_id),
+            'peakHours': self.sessions.peak_hours(start, end, station_id, area_id),
+            'chargingHours': charging / 3600,
+            'utilization': charging / (chargers * hours * 3600) if chargers else None
+        }
 
     def charger_out_of_order(self, payload):
-        station = self.stations.get(payload.get('station_id'))
+        station = self.get_station(payload.get('station_id'))
         charger = station.chargers[payload.get('charger_id')]
         charger.operational = False
 
+    def heartbeat(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        now = time.time()
+        for charger_id in payload.get('charger_ids'):
+            if charger_id in station.chargers:
+                self.liveness.seen((station.id, charger_id), now)
+
+    def chargers_offline(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        for charger_id in payload.get('charger_ids'):
+            charger = station.chargers.get(charger_id)
+            # Chargers already out of order stay that way when they come back
+            if charger is not None and charger.operational:
+                charger.operational = False
+                self.liveness.offline.add((station.id, charger_id))
+                self._logger.debug(f'Charger {charger_id} at station {station.id} is offline')
+
+    def chargers_online(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        for charger_id in payload.get('charger_ids'):
+            if (station.id, charger_id) in self.liveness.offline and charger_id in station.chargers:
+                self.liveness.offline.discard((station.id, charger_id))
+                station.chargers[charger_id].operational = True
+
+        replies = []
+        assignment = self.assign_next_in_queue(station)
+        while assignment is not None:
+            replies.append(assignment)
+            assignment = self.assign_next_in_queue(station)
+        return replies
+
+    def chargers_removed(self, payload):
+        station = self.get_station(payload.get('station_id'))
+        for charger_id in payload.get('charger_ids'):
+            charger = station.chargers.get(charger_id)
+            if charger is not None and not charger.operational and charger.car_id is None:
+                station.remove_charger(charger_id)
+                self.liveness.forget((station.id, charger_id))
+                self._logger.debug(f'Removed stale charger {charger_id} from station {station.id}')
+
+    def sweep_liveness(self):
+        """Send one command per station and kind for every charger whose liveness changed."""
+        self.apply_heartbeats()
+        with self.lock:
+            stale, forgotten, revived = self.liveness.sweep(time.time())
+
+        for command, keys in (('chargers_offline', stale), ('chargers_online', revived),
+                              ('chargers_removed', forgotten)):
+            by_station = {}
+            for station_id, charger_id in keys:
+                by_station.setdefault(station_id, []).append(charger_id)
+            for station_id, charger_ids in by_station.items():
+                self.handle_command({'command': command, 'station_id': station_id, 'charger_ids': charger_ids})
+
+    def resync_dashboard(self, payload):
+        self.dashboard.request_snapshot(self.get_station(payload.get('station_id')).id)
+
+    def station_changed(self, station_id):
+        station = self.get_station(station_id)
+        self.search_replica.mark_dirty(station.id)
+        self.update_dashboard(station.id)
+        self.publish_etas(station)
+
+    def publish_etas(self, station):
+        for car_id, eta in self.wait_estimator.changed_etas(station, time.time()).items():
+            self.publish_command({
+                'command': 'queue_eta', 'car_id': car_id, 'eta_seconds': round(eta) if eta is not None else None
+            })
+
     def update_dashboard(self, station_id):
-        station = self.stations.get(int(station_id))
+        self.dashboard.mark_dirty(station_id)
 
-        chargers = [charger.serialize() for charger in station.chargers.values()]
-        dashboard_update = {
-            'id': station.id,
-            'stationName': station.station_name,
-            'availableChargers':  self.get_num_available_chargers(station.id),
-            'unavailableChargers': station.unavailable_chargers,
-            'queue': list(station.queue),
-            'chargers': chargers
-        }
+    def init_dashboard(self):
+        # Stations that are not loaded yet have seen no traffic, they appear once they do
+        self.dashboard.publish_all_snapshots([station.id for station in self.stations.values()])
 
-        self.mqtt_client.publish(MQTT_TOPIC_DASHBOARD_UPDATE, json.dumps(dashboard_update))
+    def publish_dashboard(self, payload):
+        self.publish(MQTT_TOPIC_DASHBOARD_UPDATE, payload)
 
-    def init_dashboard(self):
-        data = []
-        for station in self.stations.values():
-            chargers = [charger.serialize() for charger in station.chargers.values()]
-            dashboard_update = {
-                'id': station.id,
-                'stationName': station.station_name,
-                'availableChargers': self.get_num_available_chargers(station.id),
-                'unavailableChargers': station.unavailable_chargers,
-                'queue': list(station.queue),
-                'queueLength': len(station.queue),
-                'chargers': chargers
-            }
-            data.append(dashboard_update)
+    def publish(self, topic, payload):
+        self.count_publish(payload)
+        self.mqtt_client.publish(topic, payload=payload)
 
-        self.mqtt_client.publish(MQTT_TOPIC_DASHBOARD_UPDATE, json.dumps(data))
+    def count_publish(self, payload):
+        self.metrics.inc('published_messages_total')
+        self.metrics.inc('published_bytes_total', len(payload))
 
     def publish_command(self, command):
-        payload = json.dumps(command)
-        print("server", payload)
-        self.mqtt_client.publish(MQTT_TOPIC_OUTPUT, payload=payload)
+        """
+        Publish a reply on the topics of the devices it concerns.
+
+        Replies naming a car or charger go only to that device's topic, so a
+        device never has to parse traffic meant for the rest of the fleet.
+        Anything else, such as search results, goes to the shared output topic.
+        """
+        self.reply_log.log('reply', command)
 
-    def get_random_available_charger(self, station):
-        charger = random.choice([
-            v for k, v in station.chargers.items() if not v.assigned and v.operational
-        ])
+        topics = []
+        if command.get('car_id') is not None:
+            topics.append(MQTT_TOPIC_CAR_OUTPUT.format(command.get('car_id')))
+        if command.get('charger_id') is not None:
+            topics.append(MQTT_TOPIC_CHARGER_OUTPUT.format(command.get('station_id'), command.get('charger_id')))
+        if not topics:
+            topics.append(MQTT_TOPIC_OUTPUT)
 
-        return charger.id
+        for topic in topics:
+            self.publish(topic, self.codecs.encode(topic, command))
+
+    def choose_charger(self, station, power_kw=None):
+        return self.decide(lambda: self.assignment.choose_charger(station, power_kw))
+
+    def decide(self, decision):
+        """Run a non-deterministic `decision`, or return its logged result while replaying."""
+        if self._replay_choices:
+            return self._replay_choices.pop(0)
+
+        result = decision()
+        if self._choices is not None:
+            self._choices.append(result)
+        return result
 
     def get_num_available_chargers(self, station_id):
         station = self.stations.get(station_id)
-        available_chargers = 0
-        for charger in station.chargers.values():
-            if not charger.assigned and charger.operational:
-                available_chargers += 1
-        return available_chargers
+        return station.available_chargers
 
     def stop(self):
+        self._stop_event.set()
+        self._timer_thread.join()
+        self._worker_thread.join()
+        self._search_thread.join()
+        self.sessions.close()
+        self.dashboard.stop()
+        if self.event_log is not None:
+            self.event_log.stop()
         self.mqtt_client.loop_stop()
         self.stm_driver.stop()
 
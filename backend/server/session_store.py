@@ -0,0 +1,167 @@
+import sqlite3
+
+HOUR = 3600
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    station_id INTEGER, area_id INTEGER, charger_id TEXT, car_id TEXT,
+    assigned_at REAL, connected_at REAL, released_at REAL, outcome TEXT
+);
+CREATE TABLE IF NOT EXISTS station_hourly (
+    station_id INTEGER, hour INTEGER, area_id INTEGER,
+    sessions INTEGER DEFAULT 0, no_shows INTEGER DEFAULT 0,
+    charging_seconds REAL DEFAULT 0, wait_seconds REAL DEFAULT 0,
+    PRIMARY KEY (station_id, hour)
+);
+CREATE INDEX IF NOT EXISTS station_hourly_area ON station_hourly (area_id, hour);
+CREATE TABLE IF NOT EXISTS area_hourly (
+    area_id INTEGER, hour INTEGER,
+    sessions INTEGER DEFAULT 0, no_shows INTEGER DEFAULT 0,
+    charging_seconds REAL DEFAULT 0, wait_seconds REAL DEFAULT 0,
+    PRIMARY KEY (area_id, hour)
+);
+'''
+
+_UPSERT = '''
+INSERT INTO {table} ({key}, hour, {extra}sessions, no_shows, charging_seconds, wait_seconds)
+VALUES (?, ?, {extra_values}?, ?, ?, ?)
+ON CONFLICT ({key}, hour) DO UPDATE SET
+    sessions = sessions + excluded.sessions,
+    no_shows = no_shows + excluded.no_shows,
+    charging_seconds = charging_seconds + excluded.charging_seconds,
+    wait_seconds = wait_seconds + excluded.wait_seconds
+'''
+
+_UPSERT_STATION = _UPSERT.format(table='station_hourly', key='station_id', extra='area_id, ', extra_values='?, ')
+_UPSERT_AREA = _UPSERT.format(table='area_hourly', key='area_id', extra='', extra_values='')
+
+
+def hour_of(timestamp):
+    return int(timestamp // HOUR) * HOUR
+
+
+def split_by_hour(start, end):
+    """Yield (hour, seconds) for the part of [start, end) that falls in each hour."""
+    hour = hour_of(start)
+    while hour < end:
+        yield hour, min(end, hour + HOUR) - max(start, hour)
+        hour += HOUR
+
+
+class SessionStore:
+    """
+    Append-only history of charging sessions in SQLite, with hourly rollups.
+
+    A session runs from charger assignment through plug-in to release. Open
+    sessions are kept in memory. Closed ones are buffered and written in one
+    transaction per `flush`, together with their contribution to the per
+    station and per area hourly rollups, so queries over months read one row
+    per station or area and hour instead of every session. Charging time is
+    split over the hours it falls in.
+
+    Set `recording` to False to track sessions without writing them, e.g.
+    while an event log is replayed.
+    """
+
+    def __init__(self, path=':memory:', batch_size=500):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self.batch_size = batch_size
+        self.recording = True
+
+        # (station id, charger id) -> [area id, car id, assigned at, connected at]
+        self._open = {}
+        self._pending = []
+
+    def open_sessions(self):
+        """Sessions not yet released, as [station id, charger id, area id, car id, assigned at, connected at] rows."""
+        return [[station_id, charger_id] + session for (station_id, charger_id), session in self._open.items()]
+
+    def restore(self, sessions):
+        """Reopen sessions saved with `open_sessions`, e.g. from a snapshot."""
+        for station_id, charger_id, *session in sessions:
+            self._open[(station_id, charger_id)] = session
+
+    def assigned(self, station, charger_id, car_id, now):
+        self._open[(station.id, charger_id)] = [station.area_id, car_id, now, None]
+
+    def connected(self, station, charger_id, now):
+        session = self._open.get((station.id, charger_id))
+        if session is not None:
+            session[3] = now
+
+    def released(self, station, charger_id, now, outcome):
+        session = self._open.pop((station.id, charger_id), None)
+        if session is None or not self.recording:
+            return
+
+        area_id, car_id, assigned_at, connected_at = session
+        self._pending.append((station.id, area_id, str(charger_id), str(car_id), assigned_at, connected_at, now,
+                              outcome))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        rollups = {}
+
+        def add(key, hour, sessions=0, no_shows=0, charging=0.0, waiting=0.0):
+            row = rollups.setdefault(key + (hour,), [0, 0, 0.0, 0.0])
+            row[0] += sessions
+            row[1] += no_shows
+            row[2] += charging
+            row[3] += waiting
+
+        for station_id, area_id, _, _, assigned_at, connected_at, released_at, outcome in self._pending:
+            for key in (('station', station_id, area_id), ('area', area_id)):
+                add(key, hour_of(assigned_at), sessions=1, no_shows=outcome == 'no_show')
+                if connected_at is not None:
+                    add(key, hour_of(assigned_at), waiting=connected_at - assigned_at)
+                    for hour, seconds in split_by_hour(connected_at, released_at):
+                        add(key, hour, charging=seconds)
+
+        with self._db:
+            self._db.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self._pending)
+            self._db.executemany(_UPSERT_STATION, [(key[1], key[3], key[2], *row)
+                                                   for key, row in rollups.items() if key[0] == 'station'])
+            self._db.executemany(_UPSERT_AREA, [(key[1], key[2], *row)
+                                                for key, row in rollups.items() if key[0] == 'area'])
+        self._pending = []
+
+    def _rollup_query(self, select, station_id, area_id, start, end, group_by):
+        if station_id is not None:
+            table, where, args = 'station_hourly', 'station_id = ?', [station_id]
+        elif area_id is not None:
+            table, where, args = 'area_hourly', 'area_id = ?', [area_id]
+        else:
+            table, where, args = 'area_hourly', '1', []
+
+        self.flush()
+        query = 'SELECT {} FROM {} WHERE {} AND hour >= ? AND hour < ? GROUP BY {} ORDER BY 1'.format(
+            select, table, where, group_by)
+        return self._db.execute(query, args + [hour_of(start), end]).fetchall()
+
+    def hourly(self, start, end, station_id=None, area_id=None):
+        """Per hour: sessions started, no-shows, seconds charging and seconds waiting to plug in."""
+        rows = self._rollup_query('hour, SUM(sessions), SUM(no_shows), SUM(charging_seconds), SUM(wait_seconds)',
+                                  station_id, area_id, start, end, 'hour')
+        return [{'hour': hour, 'sessions': sessions, 'noShows': no_shows, 'chargingSeconds': charging,
+                 'waitSeconds': waiting} for hour, sessions, no_shows, charging, waiting in rows]
+
+    def peak_hours(self, start, end, station_id=None, area_id=None, top=3):
+        """The hours of day (UTC) with the most sessions started."""
+        rows = self._rollup_query('(hour % 86400) / 3600, SUM(sessions)', station_id, area_id, start, end, 1)
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return [{'hourOfDay': hour, 'sessions': sessions} for hour, sessions in rows[:top]]
+
+    def charging_seconds(self, start, end, station_id=None, area_id=None):
+        rows = self._rollup_query('SUM(charging_seconds)', station_id, area_id, start, end, "'all'")
+        if not rows:
+            return 0.0
+        return rows[0][0] or 0.0
+
+    def close(self):
+        self.flush()
+        self._db.close()
@@ -0,0 +1,208 @@
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+import zlib
+
+import paho.mqtt.client as mqtt
+
+from backend.server.server import (DATA_DIR, ID_TYPES, METRICS_PORT, MQTT_BROKER, MQTT_PORT, MQTT_TOPIC_INPUT,
+                                   MQTT_TOPIC_OUTPUT, MQTT_TOPIC_SEARCH_REPLY, MQTT_TOPIC_TELEMETRY, SEARCH_SCHEMA,
+                                   STATION_REGISTRY, Server, default_stations, search_page, shared_topic,
+                                   station_input_topic)
+from backend.server.station_registry import load_registry
+from backend.server.station_search import search_order
+
+MQTT_TOPIC_SHARD_SEARCH = 'charging_ahead/queue/shard/{}/search'
+MQTT_ROUTER_GROUP = 'charging_ahead_router'
+
+SEARCH_TIMEOUT = 1.0
+
+
+def shard_key(station, partition):
+    return station.area_id if partition == 'area' else station.id
+
+
+def shard_for(key, num_shards):
+    # crc32 rather than hash() so every process agrees on the shard
+    return zlib.crc32(str(key).encode('utf-8')) % num_shards
+
+
+def shard_stations(shard, num_shards, partition='station'):
+    def in_shard(station):
+        return shard_for(shard_key(station, partition), num_shards) == shard
+
+    # Registry rows have the same id and area fields as stations
+    if STATION_REGISTRY:
+        return load_registry(STATION_REGISTRY, keep=in_shard)
+    return {station_id: station for station_id, station in default_stations().items() if in_shard(station)}
+
+
+def run_worker(shard, num_shards, partition):
+    logging.basicConfig(level=logging.INFO)
+    stations = shard_stations(shard, num_shards, partition)
+
+    topics = [station_input_topic(station_id) for station_id in stations]
+    topics += [MQTT_TOPIC_TELEMETRY.format(station_id, '+') for station_id in stations]
+    topics.append(MQTT_TOPIC_SHARD_SEARCH.format(shard))
+
+    # Every shard logs its own slice of the state
+    data_dir = os.path.join(DATA_DIR, 'shard-{}'.format(shard)) if DATA_DIR else None
+
+    # Shards serve metrics on the ports after METRICS_PORT
+    metrics_port = METRICS_PORT + 1 + shard if METRICS_PORT else 0
+
+    Server(stations=stations, input_topics=topics, data_dir=data_dir, metrics_port=metrics_port)
+    threading.Event().wait()
+
+
+class ShardRouter:
+    """
+    Front door for a sharded server.
+
+    Commands for a station are re-published unchanged on that station's topic,
+    which only the owning worker subscribes to. Searches are scattered to every
+    shard and the partial results, each already in `search_order`, are merged
+    into one reply.
+
+    Routers hold no station state, so several of them can share the input
+    topic. Each one gets its own reply topic for search results.
+    """
+
+    def __init__(self, num_shards):
+        self._logger = logging.getLogger(__name__)
+        self.num_shards = num_shards
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.reply_topic = MQTT_TOPIC_SEARCH_REPLY.format(uuid.uuid4().hex)
+
+        self.mqtt_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION1, protocol=mqtt.MQTTv5)
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_message = self.on_message
+        self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
+        self.mqtt_client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        client.subscribe(shared_topic(MQTT_TOPIC_INPUT, MQTT_ROUTER_GROUP))
+        client.subscribe(self.reply_topic)
+
+    def on_message(self, client, userdata, msg):
+        # Runs on paho's network thread, an exception here would stop the router
+        try:
+            self.route_message(msg.topic, msg.payload)
+        except Exception as err:
+            self._logger.error('Message sent to topic {} could not be routed. Message ignored. {}'.format(msg.topic, err))
+
+    def route_message(self, topic, raw_payload):
+        try:
+            payload = json.loads(raw_payload.decode("utf-8"))
+        except Exception as err:
+            self._logger.error('Message sent to topic {} had no valid JSON. Message ignored. {}'.format(topic, err))
+            return
+        if not isinstance(payload, dict):
+            self._logger.error('Message sent to topic {} is not an object. Message ignored.'.format(topic))
+            return
+
+        if topic == self.reply_topic:
+            self.collect_search_result(payload)
+        elif payload.get('command') == 'status_available_charger':
+            self.scatter_search(payload)
+        elif isinstance(payload.get('station_id'), ID_TYPES):
+            self.mqtt_client.publish(station_input_topic(payload.get('station_id')), raw_payload)
+        else:
+            self._logger.error('Command {} has no station_id and cannot be routed'.format(payload.get('command')))
+
+    def scatter_search(self, payload):
+        error = SEARCH_SCHEMA.validate(payload)
+        if error is not None:
+            self._logger.warning('Search ignored. {}'.format(error))
+            data = {'command': 'available_chargers', 'message': 'Invalid search: {}.'.format(error)}
+            self.mqtt_client.publish(MQTT_TOPIC_OUTPUT, json.dumps(data))
+            return
+
+        request_id = uuid.uuid4().hex
+        search_string, offset, limit = search_page(payload)
+
+        timer = threading.Timer(SEARCH_TIMEOUT, self.finish_search, args=(request_id,))
+        with self._lock:
+            self._pending[request_id] = {
+                'remaining': self.num_shards, 'offset': offset, 'limit': limit,
+                'total': 0, 'stations': [], 'timer': timer
+            }
+        timer.start()
+
+        request = dict(payload, search_string=search_string, offset=offset, limit=limit,
+                       request_id=request_id, reply_topic=self.reply_topic)
+        for shard in range(self.num_shards):
+            self.mqtt_client.publish(MQTT_TOPIC_SHARD_SEARCH.format(shard), json.dumps(request))
+
+    def collect_search_result(self, payload):
+        request_id = payload.get('request_id')
+        with self._lock:
+            pending = self._pending.get(request_id)
+            if pending is None:
+                return
+            pending['total'] += payload.get('total', 0)
+            pending['stations'].append(payload.get('stations', []))
+            pending['remaining'] -= 1
+            done = pending['remaining'] == 0
+
+        if done:
+            pending['timer'].cancel()
+            self.finish_search(request_id)
+
+    def finish_search(self, request_id):
+        # Runs on the last reply or on timeout, whichever comes first
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return
+
+        if pending['remaining'] > 0:
+            self._logger.warning('Search {} timed out waiting for {} shard(s)'.format(request_id, pending['remaining']))
+
+        # k-way merge of the sorted shard results, stopping at the end of the page
+        stations = heapq.merge(*pending['stations'], key=lambda station: search_order(station['id']))
+        offset = pending['offset']
+        page = list(itertools.islice(stations, offset, offset + pending['limit']))
+
+        if page:
+            data = {'command': 'available_chargers', 'stations': page, 'total': pending['total'], 'offset': offset}
+        else:
+            data = {'command': 'available_chargers', 'message': 'No matching station or area found.'}
+
+        self.mqtt_client.publish(MQTT_TOPIC_OUTPUT, json.dumps(data))
+
+    def stop(self):
+        self.mqtt_client.loop_stop()
+
+
+def run_sharded(num_shards, partition='station'):
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(shard, num_shards, partition), daemon=True)
+        for shard in range(num_shards)
+    ]
+    for worker in workers:
+        worker.start()
+
+    router = ShardRouter(num_shards)
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        router.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the queue server partitioned across worker processes.')
+    parser.add_argument('--shards', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--partition', choices=['station', 'area'], default='station')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_sharded(args.shards, args.partition)
@@ -0,0 +1,160 @@
+import csv
+import json
+import logging
+import time
+from collections import namedtuple
+
+from backend.helperClasses.station import Station
+
+# Seconds loading a registry file may take before a warning is logged
+REGISTRY_LOAD_BUDGET = 1.0
+
+# A station as read from the registry file. `chargers` is left as read and only
+# parsed when the station is hydrated
+StationRow = namedtuple('StationRow', ['id', 'area_id', 'station_name', 'area_name', 'num_chargers', 'chargers'])
+
+
+class StationRegistry:
+    """
+    Station id -> Station, for every station the server knows about.
+
+    Stations from a registry file start as light rows and are only turned into
+    Station objects (hydrated) the first time they are looked up, so a large
+    registry costs a tuple per station until it sees traffic. `on_hydrate` is
+    called with every Station as it is created or added.
+
+    `get`, `[]`, `in`, `len` and iteration cover all stations. `values` and
+    `items` only cover hydrated ones, which are the only ones whose state can
+    differ from the file. Rows are kept after hydration, so `row` can describe
+    a station as the file does without touching its live state.
+    """
+
+    def __init__(self, rows=(), stations=None):
+        self._rows = {row.id: row for row in rows}
+        self._stations = {}
+        self._order = list(self._rows)
+        self.on_hydrate = None
+
+        for station in (stations or {}).values():
+            self.add(station)
+
+    def __contains__(self, station_id):
+        return station_id in self._stations or station_id in self._rows
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __getitem__(self, station_id):
+        station = self.get(station_id)
+        if station is None:
+            raise KeyError(station_id)
+        return station
+
+    def add(self, station):
+        if station.id not in self:
+            self._order.append(station.id)
+        self._stations[station.id] = station
+        if self.on_hydrate is not None:
+            self.on_hydrate(station)
+
+    def get(self, station_id, default=None):
+        station = self._stations.get(station_id)
+        if station is not None:
+            return station
+
+        row = self._rows.get(station_id)
+        if row is None:
+            return default
+
+        station = build_station(row)
+        self.add(station)
+        return station
+
+    def row(self, station_id):
+        """The station's row from the registry file, or None if it did not come from one."""
+        return self._rows.get(station_id)
+
+    def describe(self, station_id):
+        """The hydrated station or its row, both have id, area and name fields."""
+        return self._stations.get(station_id) or self._rows[station_id]
+
+    def values(self):
+        return self._stations.values()
+
+    def items(self):
+        return self._stations.items()
+
+    def unloaded(self):
+        return [row for station_id, row in self._rows.items() if station_id not in self._stations]
+
+
+def build_station(row):
+    """A Station as described by a registry row, with every charger free."""
+    station = Station(row.id, row.area_id, row.station_name, row.area_name, 0)
+    for charger_id, power_kw in parse_chargers(row.chargers):
+        station.add_charger(charger_id, power_kw)
+    station.num_chargers = len(station.chargers)
+    return station
+
+
+def parse_chargers(chargers):
+    """
+    Yield (charger id, power kW or None) from a registry charger field.
+
+    CSV files list chargers as 'id:kw;id:kw' (the ':kw' is optional), JSON
+    files as a list of ids or of {"id": ..., "power_kw": ...} objects.
+    """
+    if isinstance(chargers, str):
+        for spec in filter(None, chargers.split(';')):
+            charger_id, _, power_kw = spec.partition(':')
+            yield charger_id, float(power_kw) if power_kw else None
+        return
+
+    for spec in chargers:
+        if isinstance(spec, dict):
+            yield spec['id'], spec.get('power_kw')
+        else:
+            yield spec, None
+
+
+def _csv_rows(file):
+    # Header: station_id,area_id,station_name,area_name,chargers
+    reader = csv.reader(file)
+    next(reader, None)
+    for station_id, area_id, station_name, area_name, chargers in reader:
+        # Counted like parse_chargers, which skips empty specs such as a trailing ';'
+        yield StationRow(int(station_id), int(area_id), station_name, area_name,
+                         sum(1 for spec in chargers.split(';') if spec), chargers)
+
+
+def _json_rows(file):
+    for record in json.load(file):
+        chargers = record.get('chargers', [])
+        yield StationRow(record['id'], record['area_id'], record['station_name'], record['area_name'],
+                         len(chargers), chargers)
+
+
+def load_registry(path, keep=None):
+    """
+    Read a .csv or .json registry file without hydrating any station.
+
+    `keep` filters rows, e.g. to the stations of one shard.
+    """
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+
+    read_rows = _json_rows if path.endswith('.json') else _csv_rows
+    with open(path, encoding='utf-8', newline='') as file:
+        rows = [row for row in read_rows(file) if keep is None or keep(row)]
+    registry = StationRegistry(rows)
+
+    elapsed = time.perf_counter() - start
+    if elapsed > REGISTRY_LOAD_BUDGET:
+        logger.warning('Loading {} stations from {} took {:.2f}s, over the {:.2f}s budget'.format(
+            len(rows), path, elapsed, REGISTRY_LOAD_BUDGET))
+    else:
+        logger.info('Loaded {} stations from {} in {:.3f}s'.format(len(rows), path, elapsed))
+    return registry
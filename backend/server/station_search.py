@@ -0,0 +1,102 @@
+import unicodedata
+
+NGRAM_SIZE = 3
+
+# Letters that do not decompose under NFKD but are commonly typed without the accent
+_TRANSLITERATIONS = str.maketrans({
+    'ø': 'o',
+    'æ': 'ae',
+    'đ': 'd',
+    'ł': 'l',
+    'þ': 'th',
+})
+
+
+def search_order(station_id):
+    """Sort key giving search results one total order: numeric ids by value, then any others as text."""
+    if isinstance(station_id, int):
+        return 0, station_id, ''
+    return 1, 0, str(station_id)
+
+
+def normalize(text):
+    """Case-fold and strip accents so that e.g. 'Øya', 'øya' and 'oya' compare equal."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.translate(_TRANSLITERATIONS)
+
+
+class StationSearchIndex:
+    """
+    Substring search over station and area names.
+
+    Names are normalized once when a station is added. `build_ngrams` then maps
+    every substring of up to NGRAM_SIZE characters to the stations containing
+    it, so short queries are a single lookup and longer ones intersect their
+    n-grams before a final substring check. Until it has run, searches scan
+    the normalized names instead, which is slower but gives the same result,
+    so the index can be searched while the n-grams are built on another
+    thread. Station names never change, so the index is otherwise only read.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._ngrams = None
+        self._order = []
+        self._rank = {}
+
+    def add_station(self, station):
+        names = (normalize(station.station_name), normalize(station.area_name))
+        self._names[station.id] = names
+        self._rank[station.id] = len(self._order)
+        self._order.append(station.id)
+
+        if self._ngrams is not None:
+            self._add_grams(self._ngrams, station.id, names)
+
+    def build_ngrams(self):
+        ngrams = {}
+        for station_id in list(self._order):
+            self._add_grams(ngrams, station_id, self._names[station_id])
+        self._ngrams = ngrams
+
+    def match(self, search_string):
+        """Ids of the stations whose station or area name contains the search string, in the order added."""
+        query = normalize(search_string)
+        if not query:
+            return list(self._order)
+
+        ngrams = self._ngrams
+        if ngrams is None:
+            return [station_id for station_id in list(self._order)
+                    if any(query in name for name in self._names[station_id])]
+
+        if len(query) <= NGRAM_SIZE:
+            candidates = ngrams.get(query, set())
+        else:
+            grams = sorted({query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)},
+                           key=lambda gram: len(ngrams.get(gram, ())))
+            candidates = set(ngrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= ngrams.get(gram, set())
+
+            candidates = {station_id for station_id in candidates
+                          if any(query in name for name in self._names[station_id])}
+
+        return sorted(candidates, key=self._rank.__getitem__)
+
+    @classmethod
+    def _add_grams(cls, ngrams, station_id, names):
+        for name in names:
+            for gram in cls._grams(name):
+                ngrams.setdefault(gram, set()).add(station_id)
+
+    @staticmethod
+    def _grams(name):
+        grams = set()
+        for size in range(1, NGRAM_SIZE + 1):
+            for i in range(len(name) - size + 1):
+                grams.add(name[i:i + size])
+        return grams
@@ -0,0 +1,166 @@
+import threading
+from array import array
+
+from backend.helperClasses.telemetry import SOC_UNKNOWN, unpack_samples
+
+
+class RingBuffer:
+    """
+    The last `capacity` samples of one charging session, oldest overwritten first.
+
+    Samples are kept column-wise in typed arrays, 13 bytes each, allocated
+    once when the session starts.
+    """
+
+    __slots__ = ('capacity', 'times', 'power', 'soc', '_next', '_size')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.power = array('f', bytes(4 * capacity))
+        self.soc = array('B', bytes(capacity))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, power_kw, soc):
+        i = self._next
+        self.times[i] = timestamp
+        self.power[i] = power_kw
+        self.soc[i] = SOC_UNKNOWN if soc is None else soc
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def samples(self, since=None):
+        """(timestamp, power kW, state of charge % or None) oldest first, only those from `since` on."""
+        result = []
+        i = self._next
+        for _ in range(self._size):
+            i = (i - 1) % self.capacity
+            if since is not None and self.times[i] < since:
+                break
+            soc = self.soc[i]
+            result.append((self.times[i], self.power[i], None if soc == SOC_UNKNOWN else soc))
+        result.reverse()
+        return result
+
+
+def downsample(samples, bucket_seconds):
+    """
+    Reduce samples to [bucket start, min kW, max kW, mean kW, last state of charge] per time bucket.
+
+    Buckets without samples are left out.
+    """
+    buckets = {}
+    for timestamp, power_kw, soc in samples:
+        start = timestamp - timestamp % bucket_seconds
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = [start, power_kw, power_kw, power_kw, 1, soc]
+            continue
+        bucket[1] = min(bucket[1], power_kw)
+        bucket[2] = max(bucket[2], power_kw)
+        bucket[3] += power_kw
+        bucket[4] += 1
+        if soc is not None:
+            bucket[5] = soc
+    return [[start, round(low, 2), round(high, 2), round(total / count, 2), soc]
+            for start, low, high, total, count, soc in sorted(buckets.values())]
+
+
+class TelemetryPipeline:
+    """
+    Power and state of charge samples of the sessions in progress.
+
+    Each charging session gets a fixed-size ring buffer when it starts and
+    loses it when it ends, so memory is bounded by the number of chargers in
+    use. Samples for chargers without a session are dropped. `drain` hands the
+    dashboard the downsampled buckets of the sessions that got samples since
+    the last call, at most once per `publish_interval`, so the dashboard topic
+    carries a few buckets per session per interval however fast chargers
+    sample.
+
+    Samples arrive on the MQTT thread while sessions start and end under the
+    server lock, so the pipeline has its own lock.
+    """
+
+    def __init__(self, capacity=900, bucket_seconds=10.0, publish_interval=5.0):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.publish_interval = publish_interval
+
+        self._lock = threading.Lock()
+        # (station id, charger id) as strings, as they appear in topics
+        self._buffers = {}
+        self._ids = {}
+        self._dirty = set()
+        self._published_until = {}
+        self._last_drain = None
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def start_session(self, station_id, charger_id):
+        key = (str(station_id), str(charger_id))
+        with self._lock:
+            self._buffers[key] = RingBuffer(self.capacity)
+            self._ids[key] = (station_id, charger_id)
+            self._published_until.pop(key, None)
+
+    def end_session(self, station_id, charger_id):
+        key = (str(station_id), str(charger_id))
+        with self._lock:
+            self._buffers.pop(key, None)
+            self._ids.pop(key, None)
+            self._dirty.discard(key)
+            self._published_until.pop(key, None)
+
+    def ingest(self, station_id, charger_id, raw):
+        """
+        Add a packed batch of samples, return how many were kept.
+
+        Returns None if the charger has no session. Raises ValueError for a
+        malformed batch.
+        """
+        key = (str(station_id), str(charger_id))
+        samples = list(unpack_samples(raw))
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                return None
+            for timestamp, power_kw, soc in samples:
+                buffer.append(timestamp, power_kw, soc)
+            if samples:
+                self._dirty.add(key)
+        return len(samples)
+
+    def drain(self, now):
+        """
+        Return {(station id, charger id): buckets} for sessions with new samples.
+
+        The last bucket sent to the dashboard is sent again, since it may have
+        been partial. Returns {} if called within `publish_interval` of the
+        last drain.
+        """
+        if self._last_drain is not None and now - self._last_drain < self.publish_interval:
+            return {}
+        self._last_drain = now
+
+        with self._lock:
+            pending = {}
+            for key in self._dirty:
+                since = self._published_until.get(key)
+                pending[self._ids[key]] = (key, self._buffers[key].samples(since))
+            self._dirty.clear()
+
+        updates = {}
+        for ids, (key, samples) in pending.items():
+            buckets = downsample(samples, self.bucket_seconds)
+            if buckets:
+                updates[ids] = buckets
+                with self._lock:
+                    if key in self._buffers:
+                        self._published_until[key] = buckets[-1][0]
+        return updates
@@ -0,0 +1,60 @@
+import math
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for many timeouts of similar length.
+
+    Time is cut into ticks of `tick` seconds and every timer is stored in the
+    slot for its deadline tick, modulo the number of slots. Scheduling and
+    cancelling are dict operations, O(1). `expire` visits only the slots for
+    the ticks that have passed since the last call, and a timer further out
+    than one turn of the wheel simply stays in its slot until its turn comes.
+    Scheduling a key again replaces its timer.
+    """
+
+    def __init__(self, tick=1.0, num_slots=512, now=0.0):
+        self.tick = tick
+        self.num_slots = num_slots
+        self._slots = [dict() for _ in range(num_slots)]
+        self._deadlines = {}
+        self._current = self._tick_of(now)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def _tick_of(self, when):
+        return math.floor(when / self.tick)
+
+    def schedule(self, key, when):
+        self.cancel(key)
+        # Never in a slot the wheel has already passed
+        deadline = max(math.ceil(when / self.tick), self._current + 1)
+        self._deadlines[key] = deadline
+        self._slots[deadline % self.num_slots][key] = deadline
+
+    def cancel(self, key):
+        deadline = self._deadlines.pop(key, None)
+        if deadline is None:
+            return False
+        del self._slots[deadline % self.num_slots][key]
+        return True
+
+    def expire(self, now):
+        """Remove and return the keys of all timers due by `now`."""
+        target = self._tick_of(now)
+        expired = []
+        # After a long pause every slot is due once, no need to go round again
+        first = max(self._current + 1, target - self.num_slots + 1)
+        for tick in range(first, target + 1):
+            slot = self._slots[tick % self.num_slots]
+            due = [key for key, deadline in slot.items() if deadline <= target]
+            for key in due:
+                del slot[key]
+                del self._deadlines[key]
+            expired.extend(due)
+        self._current = max(self._current, target)
+        return expired
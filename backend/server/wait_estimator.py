@@ -0,0 +1,153 @@
+import heapq
+import itertools
+
+
+class SessionStats:
+    """
+    Running mean and variance of charging session length, in constant memory.
+
+    Exponentially weighted, so the estimate follows changes in how long cars
+    charge. The first samples are weighted 1/n so a fresh station does not sit
+    at the prior for long.
+    """
+
+    def __init__(self, prior_seconds, alpha=0.1):
+        self.alpha = alpha
+        self.mean = prior_seconds
+        self.variance = 0.0
+        self.count = 0
+
+    def add(self, seconds):
+        self.count += 1
+        weight = max(self.alpha, 1 / self.count)
+        diff = seconds - self.mean
+        self.mean += weight * diff
+        self.variance = (1 - weight) * (self.variance + weight * diff * diff)
+
+
+class WaitEstimator:
+    """
+    Estimated wait for every queued car, from per-station session statistics.
+
+    Session lengths are measured from `charger_connected` to the charger
+    becoming available again. To estimate waits, each charger is given the
+    time until it is expected to be free, and queued cars take the earliest
+    one in queue order. Busy chargers are tracked by the session hooks, in the
+    order their sessions started, so the n cars of a queue only look at the n
+    chargers expected to be free first: O(n log n) whatever the station size.
+    New estimates are only reported for cars whose ETA moved by at least
+    `push_threshold` seconds, so waiting cars are not flooded.
+    """
+
+    def __init__(self, prior_seconds=1800.0, alpha=0.1, push_threshold=60.0):
+        self.prior_seconds = prior_seconds
+        self.alpha = alpha
+        self.push_threshold = push_threshold
+
+        self._stats = {}
+        # station id -> charger id -> time its current session started, oldest first
+        self._charging = {}
+        # station id -> charger id -> None, for assigned chargers whose car has not plugged in yet
+        self._reserved = {}
+        # station id -> car id -> last ETA sent to the car
+        self._pushed = {}
+
+    def stats(self, station_id):
+        stats = self._stats.get(station_id)
+        if stats is None:
+            stats = self._stats[station_id] = SessionStats(self.prior_seconds, self.alpha)
+        return stats
+
+    def session_reserved(self, station_id, charger_id):
+        self._reserved.setdefault(station_id, {})[charger_id] = None
+
+    def session_started(self, station_id, charger_id, now):
+        self._discard(self._reserved, station_id, charger_id)
+        charging = self._charging.setdefault(station_id, {})
+        # Re-inserted so the sessions stay in the order they started
+        charging.pop(charger_id, None)
+        charging[charger_id] = now
+
+    def session_ended(self, station_id, charger_id, now):
+        self._discard(self._reserved, station_id, charger_id)
+        started = self._discard(self._charging, station_id, charger_id)
+        if started is not None:
+            self.stats(station_id).add(now - started)
+
+    def session_cancelled(self, station_id, charger_id):
+        self._discard(self._reserved, station_id, charger_id)
+        self._discard(self._charging, station_id, charger_id)
+
+    @staticmethod
+    def _discard(by_station, station_id, charger_id):
+        chargers = by_station.get(station_id)
+        if chargers is None or charger_id not in chargers:
+            return None
+        value = chargers.pop(charger_id)
+        if not chargers:
+            del by_station[station_id]
+        return value
+
+    def free_times(self, station, now):
+        """Yield the time until each operational charger is expected to be free, earliest first."""
+        mean = self.stats(station.id).mean
+        for _ in range(station.available_chargers):
+            yield 0.0
+
+        # Sessions that started earlier end earlier, and none is expected to
+        # take longer than a session that has not started yet
+        for charger_id, started in self._charging.get(station.id, {}).items():
+            if self._busy(station, charger_id):
+                yield max(mean - (now - started), 0.0)
+        for charger_id in self._reserved.get(station.id, ()):
+            if self._busy(station, charger_id):
+                yield mean
+
+    @staticmethod
+    def _busy(station, charger_id):
+        charger = station.chargers.get(charger_id)
+        return charger is not None and charger.operational and charger.assigned
+
+    def estimate(self, station, now):
+        """Return {car id: seconds until a charger is expected to be free} for the queue."""
+        if len(station.queue) == 0:
+            return {}
+
+        mean = self.stats(station.id).mean
+        # Already sorted, so already a heap. Each car takes one charger, so no
+        # charger past the first len(queue) can be reached
+        free_at = list(itertools.islice(self.free_times(station, now), len(station.queue)))
+        if not free_at:
+            return {car_id: None for car_id in station.queue}
+
+        etas = {}
+        for car_id in station.queue:
+            eta = heapq.heappop(free_at)
+            etas[car_id] = eta
+            heapq.heappush(free_at, eta + mean)
+        return etas
+
+    def changed_etas(self, station, now):
+        """Estimate the queue and return only the ETAs that moved past the threshold."""
+        if len(station.queue) == 0:
+            self._pushed.pop(station.id, None)
+            return {}
+
+        pushed = self._pushed.get(station.id, {})
+        current = {}
+        changed = {}
+        for car_id, eta in self.estimate(station, now).items():
+            last = pushed.get(car_id)
+            if car_id not in pushed or (eta is None) != (last is None) or (
+                    eta is not None and abs(eta - last) >= self.push_threshold):
+                changed[car_id] = eta
+                current[car_id] = eta
+            else:
+                current[car_id] = last
+
+        # Cars that left the queue are dropped here
+        self._pushed[station.id] = current
+        return changed
+
+    def last_eta(self, station_id, car_id):
+        return self._pushed.get(station_id, {}).get(car_id)
@@ -12,6 +12,8 @@ const MQTT_BROKER = 'broker.hivemq.com';
 const MQTT_PORT = 8000;
 const MQTT_TOPIC_INPUT = 'charging_ahead/queue/server_input';
 const MQTT_TOPIC_OUTPUT = 'charging_ahead/queue/server_output';
+// Lets the server rate limit each open console on its own
+const CLIENT_ID = Math.random().toString(36).slice(2, 12);
 
 export default function Console() {
     const [client, setClient] = useState<mqtt.MqttClient>();
@@ -46,7 +48,7 @@ export default function Console() {
 
     const publishCommand = (command: any) => {
         if (client) {
-            const payload = JSON.stringify(command);
+            const payload = JSON.stringify({ ...command, client_id: CLIENT_ID });
             client.publish(MQTT_TOPIC_INPUT, payload, { qos: 2 });
         }
     };
@@ -2,9 +2,12 @@
 
 import { useEffect, useState } from 'react';
 import mqtt from 'mqtt';
-import { StationDetails } from "@/lib/types";
+import { Charger, DashboardUpdate, StationDetails, TelemetryUpdate } from "@/lib/types";
 import StationDetailsCard from "@/components/station-details-card";
 
+const MQTT_TOPIC_DASHBOARD_UPDATE = 'charging_ahead/dashboard/update';
+const MQTT_TOPIC_DASHBOARD_TELEMETRY = 'charging_ahead/dashboard/telemetry';
+
 export default function Dashboard() {
     const [data, setData] = useState<StationDetails[]>();
 
@@ -16,7 +19,7 @@ export default function Dashboard() {
 
         client.on('connect', () => {
             console.log('Connected');
-            client.subscribe('charging_ahead/dashboard/update', function (err) {
+            client.subscribe([MQTT_TOPIC_DASHBOARD_UPDATE, MQTT_TOPIC_DASHBOARD_TELEMETRY], function (err) {
                 if (!err) {
                     console.log('Subscribed to topic');
                 }
@@ -29,38 +32,113 @@ export default function Dashboard() {
 
             console.log("Updated data", jsonData)
 
-            const newStations: StationDetails[] = Array.isArray(jsonData) ? jsonData : [jsonData];
+            if (topic === MQTT_TOPIC_DASHBOARD_TELEMETRY) {
+                const telemetry: TelemetryUpdate[] = Array.isArray(jsonData) ? jsonData : [jsonData];
+                setData(currentData => currentData && applyTelemetry(currentData, telemetry));
+                return;
+            }
+
+            const updates: DashboardUpdate[] = Array.isArray(jsonData) ? jsonData : [jsonData];
 
             setData(currentData => {
-                if (!currentData || currentData.length === 0) {
-                    return newStations;
-                }
+                const updatedData: StationDetails[] = currentData ? [...currentData] : [];
 
-                const updatedData: StationDetails[] = currentData.map((station: StationDetails) => {
-                    const updateStation = newStations.find(ns => ns.id === station.id);
-                    if (updateStation) {
-                        return convertStationData(updateStation)
+                updates.forEach((update: DashboardUpdate) => {
+                    const index = updatedData.findIndex(station => station.id === update.id);
+                    const station = index >= 0 ? updatedData[index] : undefined;
+
+                    if (update.type === 'delta') {
+                        // A missed delta means our copy is stale, so ask the server for a snapshot
+                        if (!station || station.seq === undefined || update.seq !== station.seq + 1) {
+                            requestResync(update.id);
+                            return;
+                        }
+                        updatedData[index] = applyDelta(station, update);
+                    } else {
+                        const converted = convertStationData(update);
+                        if (index >= 0) {
+                            updatedData[index] = converted;
+                        } else {
+                            updatedData.push(converted);
+                        }
                     }
-                    return station;
                 });
 
                 return updatedData;
             });
         });
 
+        function requestResync(stationId: string) {
+            const command = { command: 'dashboard_resync', station_id: stationId };
+            client.publish('charging_ahead/queue/server_input', JSON.stringify(command));
+        }
+
         return () => {
             client.end();
         };
     }, []);
 
-    function convertStationData(station: StationDetails) {
+    function applyDelta(station: StationDetails, delta: DashboardUpdate): StationDetails {
+        const changedChargers = delta.chargers as Record<string, Partial<Charger>> | undefined;
+        const removed = delta.removedChargers ?? [];
+
+        const chargers = station.chargers
+            .filter((charger: Charger) => !removed.includes(String(charger.id)))
+            .map((charger: Charger) => {
+                const changes = changedChargers?.[String(charger.id)];
+                return changes ? { ...charger, ...changes } : charger;
+            });
+
+        if (changedChargers) {
+            Object.entries(changedChargers).forEach(([id, charger]) => {
+                if (!chargers.some((existing: Charger) => String(existing.id) === id)) {
+                    chargers.push(charger as Charger);
+                }
+            });
+        }
+
+        return {
+            ...station,
+            seq: delta.seq,
+            stationName: delta.stationName ?? station.stationName,
+            availableChargers: delta.availableChargers ?? station.availableChargers,
+            unavailableChargers: delta.unavailableChargers ?? station.unavailableChargers,
+            queue: delta.queue ?? station.queue,
+            chargers: chargers
+        };
+    }
+
+    function applyTelemetry(stations: StationDetails[], updates: TelemetryUpdate[]): StationDetails[] {
+        return stations.map((station: StationDetails) => {
+            const update = updates.find(telemetry => String(telemetry.id) === String(station.id));
+            if (!update) {
+                return station;
+            }
+
+            return {
+                ...station,
+                chargers: station.chargers.map((charger: Charger) => {
+                    const buckets = update.chargers[String(charger.id)];
+                    if (!buckets || buckets.length === 0) {
+                        return charger;
+                    }
+                    // Only the latest bucket is shown, as the charger's current reading
+                    const [, , , meanKw, stateOfCharge] = buckets[buckets.length - 1];
+                    return { ...charger, currentKw: meanKw, stateOfCharge: stateOfCharge };
+                })
+            };
+        });
+    }
+
+    function convertStationData(station: DashboardUpdate): StationDetails {
         return {
             id: station.id,
-            stationName: station.stationName,
-            availableChargers: station.availableChargers,
-            unavailableChargers: station.unavailableChargers,
-            queue: station.queue,
-            chargers: station.chargers.map((charger: any) => ({
+            seq: station.seq,
+            stationName: station.stationName ?? '',
+            availableChargers: station.availableChargers ?? 0,
+            unavailableChargers: station.unavailableChargers ?? 0,
+            queue: station.queue ?? [],
+            chargers: ((station.chargers ?? []) as Charger[]).map((charger: any) => ({
                 id: charger.id,
                 carId: charger.carId,
                 operational: charger.operational,
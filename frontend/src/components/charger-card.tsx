@@ -37,7 +37,11 @@ export default function ChargerCard({ charger }: ChargerProps) {
                 ) : isChargerInUse ? (
                     <p className="text-sm text-gray-500">
                         {charger.charging ?
-                            <><span className="font-semibold">{charger.carId}</span> is charging</> :
+                            <>
+                                <span className="font-semibold">{charger.carId}</span> is charging
+                                {charger.currentKw !== undefined && <> at {charger.currentKw} kW</>}
+                                {charger.stateOfCharge != null && <>, {charger.stateOfCharge}%</>}
+                            </> :
                             charger.assigned && !charger.charging ?
                                 <><span className="font-semibold">{charger.carId}</span> is assigned</> :
                                 "Available"
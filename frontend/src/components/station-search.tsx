@@ -14,7 +14,8 @@ export default function StationSearch(props: StationSearchProps) {
 
     const registerToQueue = () => {
         const carId = generateRandomId();
-        const command = { command: "register_to_queue", station_id: station.id, car_id: carId };
+        // The server answers a repeated request id with its first reply instead of registering again
+        const command = { command: "register_to_queue", station_id: station.id, car_id: carId, request_id: generateRandomId() };
         publishCommand(command);
     };
 
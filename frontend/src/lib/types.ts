@@ -2,6 +2,7 @@
 
 export type StationDetails = {
     id: string
+    seq?: number,
     stationName: string,
     availableChargers: number,
     unavailableChargers: number,
@@ -10,12 +11,40 @@ export type StationDetails = {
 }
 
 
+export type DashboardUpdate = {
+    type: 'snapshot' | 'delta',
+    id: string,
+    seq: number,
+    stationName?: string,
+    availableChargers?: number,
+    unavailableChargers?: number,
+    queue?: string[],
+    queueLength?: number,
+    chargers?: Charger[] | Record<string, Partial<Charger>>,
+    removedChargers?: string[]
+}
+
+
 export type Charger = {
     id: string,
     carId: string,
     operational: boolean,
     charging: boolean,
-    assigned: boolean
+    assigned: boolean,
+    powerKw?: number | null,
+    currentKw?: number,
+    stateOfCharge?: number | null
+}
+
+
+// [bucket start, min kW, max kW, mean kW, last state of charge]
+export type TelemetryBucket = [number, number, number, number, number | null]
+
+export type TelemetryUpdate = {
+    type: 'telemetry',
+    id: string,
+    bucketSeconds: number,
+    chargers: Record<string, TelemetryBucket[]>
 }
 
 export type AppMode = {
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip('paho.mqtt')
+pytest.importorskip('stmpy')
+
+from backend.server.async_server import AsyncServer  # noqa: E402
+from backend.server.local_broker import LocalBroker  # noqa: E402
+
+
+class RecordingServer(AsyncServer):
+    """An AsyncServer that is never run: replies are collected and queued messages handled on demand."""
+
+    def __init__(self, **kwargs):
+        super().__init__(LocalBroker().client, **kwargs)
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.count_publish(payload)
+        self.published.append((topic, payload))
+
+    def work(self):
+        """Handle every queued message, like the worker task would."""
+        while True:
+            message = self.inbox.get_nowait()
+            if message is None:
+                return
+            self.handle_command(message[1])
+
+    def replies(self, command=None):
+        decoded = [self.codecs.decode(topic, payload) for topic, payload in self.published]
+        return [reply for reply in decoded
+                if isinstance(reply, dict) and (command is None or reply.get('command') == command)]
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = RecordingServer(data_dir=None)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_server(tmp_path):
+    """Servers sharing one data directory, to restart from the event log."""
+    servers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('data_dir', str(tmp_path))
+        server = RecordingServer(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
@@ -0,0 +1,78 @@
+from backend.helperClasses.area_index import AreaIndex
+from backend.helperClasses.station import Station
+
+
+def make_index(*stations):
+    index = AreaIndex()
+    for station in stations:
+        index.add_station(station)
+    return index
+
+
+def test_least_loaded_follows_free_chargers_and_queues():
+    a = Station(1, 1, 'A', 'Area', 2)
+    b = Station(2, 1, 'B', 'Area', 1)
+    index = make_index(a, b)
+    assert index.least_loaded(1) == 1
+
+    a.chargers[1].assigned = True
+    a.chargers[2].assigned = True
+    assert index.least_loaded(1) == 2
+    assert index.least_loaded(1, exclude=2) == 1
+
+    b.add_to_queue('car')
+    b.add_to_queue('other')
+    assert index.least_loaded(1) == 1
+
+
+def test_least_loaded_is_per_area():
+    index = make_index(Station(1, 1, 'A', 'One', 1), Station(2, 2, 'B', 'Two', 3))
+    assert index.least_loaded(1) == 1
+    assert index.least_loaded(2) == 2
+    assert index.least_loaded(3) is None
+    assert index.least_loaded(1, exclude=1) is None
+
+
+def test_unloaded_stations_count_all_chargers_free():
+    station = Station(1, 1, 'A', 'Area', 1)
+    station.chargers[1].assigned = True
+    index = make_index(station)
+    index.add_unloaded(2, 1, 4)
+    assert index.least_loaded(1) == 2
+    assert index.area_summary(1) == {'areaId': 1, 'availableChargers': 4, 'queued': 0}
+
+
+def test_area_summary_totals_stay_current():
+    a = Station(1, 1, 'A', 'Area', 2)
+    b = Station(2, 1, 'B', 'Area', 1)
+    index = make_index(a, b)
+    b.chargers[1].assigned = True
+    b.add_to_queue('x')
+    b.add_to_queue('y')
+    b.remove_element('x')
+    assert index.area_summary(1) == {'areaId': 1, 'availableChargers': 2, 'queued': 1}
+
+
+def test_station_of_car_tracks_queue_places_and_chargers():
+    a = Station(1, 1, 'A', 'Area', 1)
+    b = Station(2, 1, 'B', 'Area', 1)
+    index = make_index(a, b)
+
+    a.add_to_queue('car')
+    assert index.station_of_car('car') == 1
+
+    a.remove_from_queue()
+    b.chargers[1].car_id = 'car'
+    assert index.station_of_car('car') == 2
+
+    b.chargers[1].car_id = None
+    assert index.station_of_car('car') is None
+
+
+def test_station_of_car_covers_cars_already_at_an_added_station():
+    station = Station(1, 1, 'A', 'Area', 1)
+    station.chargers[1].car_id = 'charging'
+    station.add_to_queue('queued')
+    index = make_index(station)
+    assert index.station_of_car('charging') == 1
+    assert index.station_of_car('queued') == 1
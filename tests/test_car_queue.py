@@ -0,0 +1,53 @@
+import pytest
+
+from backend.helperClasses.car_queue import CarQueue, PriorityCarQueue
+
+
+def test_car_queue_keeps_arrival_order_through_cancellations_and_growth():
+    queue = CarQueue(capacity=2)
+    for car in range(10):
+        assert queue.append('car{}'.format(car))
+    assert not queue.append('car3')
+
+    assert queue.remove('car3')
+    assert not queue.remove('car3')
+    assert queue.popleft() == 'car0'
+    assert list(queue) == ['car1', 'car2', 'car4', 'car5', 'car6', 'car7', 'car8', 'car9']
+    assert [queue.position(car_id) for car_id in queue] == list(range(1, 9))
+    assert queue.position('car3') is None
+
+    # Tickets are renumbered once they run out, positions stay right
+    for car in range(10, 30):
+        queue.append('car{}'.format(car))
+        queue.remove('car{}'.format(car - 5))
+    assert [queue.position(car_id) for car_id in queue] == list(range(1, len(queue) + 1))
+
+
+def test_priority_car_queue_serves_lowest_priority_first_then_arrival_order():
+    queue = PriorityCarQueue()
+    for car_id, priority in [('a', 5), ('b', 1), ('c', 5), ('d', None), ('e', 1)]:
+        assert queue.append(car_id, priority)
+    assert not queue.append('a', 0)
+
+    assert list(queue) == ['d', 'b', 'e', 'a', 'c']
+    assert [queue.position(car_id) for car_id in ['d', 'b', 'e', 'a', 'c']] == [1, 2, 3, 4, 5]
+    assert queue.priority('a') == 5
+    assert queue.priority('d') == 0
+
+    assert queue.remove('b')
+    assert queue.position('e') == 2
+    assert [queue.popleft() for _ in range(len(queue))] == ['d', 'e', 'a', 'c']
+    with pytest.raises(IndexError):
+        queue.popleft()
+
+
+def test_priority_car_queue_drops_cancelled_cars_from_its_heap():
+    queue = PriorityCarQueue()
+    for car in range(200):
+        queue.append(car, car % 7)
+    for car in range(190):
+        queue.remove(car)
+
+    assert len(queue) == 10
+    assert len(queue._heap) <= 2 * len(queue) + 64
+    assert [queue.popleft() for _ in range(10)] == sorted(range(190, 200), key=lambda car: (car % 7, car))
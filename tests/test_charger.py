@@ -0,0 +1,27 @@
+import json
+
+import stmpy
+
+from backend.charger.main import charger_logic
+from backend.helperClasses.io_backend import SimulatedIOBackend
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload)))
+
+
+def test_charger_announces_its_rated_power(server):
+    client = FakeClient()
+    charger = charger_logic(10, io=SimulatedIOBackend(), station_id=1, client=client,
+                            stm_driver=stmpy.Driver(), power_kw=150.0)
+
+    charger.waiting()
+    (_, announcement), = client.published
+    assert announcement['power_kw'] == 150.0
+
+    server.handle_command(announcement)
+    assert server.stations[1].chargers[charger.id].power_kw == 150.0
@@ -0,0 +1,75 @@
+from backend.server.dedup import DedupCache
+
+
+def test_cache_returns_stored_replies():
+    cache = DedupCache(capacity=10, ttl=60)
+    cache.put('a', ['reply'], now=0)
+    assert cache.get('a', now=1) == ['reply']
+    assert cache.get('b', now=1) is None
+
+
+def test_entries_expire_after_ttl():
+    cache = DedupCache(capacity=10, ttl=60)
+    cache.put('a', ['reply'], now=0)
+    assert cache.get('a', now=60) is None
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_dropped_as_new_ones_are_stored():
+    cache = DedupCache(capacity=10, ttl=60)
+    cache.put('a', [], now=0)
+    cache.put('b', [], now=30)
+    cache.put('c', [], now=70)
+    assert len(cache) == 2
+
+
+def test_least_recently_used_entry_is_evicted_beyond_capacity():
+    cache = DedupCache(capacity=2, ttl=60)
+    cache.put('a', [], now=0)
+    cache.put('b', [], now=0)
+    cache.get('a', now=1)
+    cache.put('c', [], now=1)
+    assert cache.get('a', now=1) == []
+    assert cache.get('b', now=1) is None
+
+
+def register(server, car_id, request_id, station_id=1):
+    server.handle_command({'command': 'register_to_queue', 'car_id': car_id, 'station_id': station_id,
+                           'request_id': request_id})
+
+
+def assigned_cars(server, station_id=1):
+    return {charger.car_id for charger in server.stations[station_id].chargers.values() if charger.car_id}
+
+
+def test_duplicate_request_is_answered_without_running_again(server):
+    register(server, 'a', 'R1')
+    register(server, 'a', 'R1')
+    assert assigned_cars(server) == {'a'}
+    assert len(server.replies('charger_assigned')) == 4
+    assert server.stations[1].available_chargers == 3
+
+
+def test_same_request_id_from_another_car_is_not_a_duplicate(server):
+    register(server, 'a', 'R1')
+    register(server, 'b', 'R1')
+    assert assigned_cars(server) == {'a', 'b'}
+
+
+def test_same_request_id_for_another_command_is_not_a_duplicate(server):
+    register(server, 'a', 1, station_id=1)
+    server.handle_command({'command': 'charger_connected', 'station_id': 1, 'charger_id': 1, 'request_id': 1})
+    connected = [charger for charger in server.stations[1].chargers.values() if charger.charging]
+    assert [charger.id for charger in connected] == [1]
+
+
+def test_requests_handled_before_a_restart_are_recognised(make_server):
+    server = make_server()
+    register(server, 'a', 'R1')
+    server.stop()
+
+    restarted = make_server()
+    register(restarted, 'a', 'R1')
+    register(restarted, 'b', 'R1')
+    assert assigned_cars(restarted) == {'a', 'b'}
+    assert restarted.stations[1].available_chargers == 2
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+import backend.server.server as server_module
+from backend.helperClasses.assignment import POLICIES
+
+STATION = 3
+POWERS = [11, 11, 22, 50, 50, 150, 150, 350]
+
+
+def run(server, commands):
+    for command in commands:
+        server.handle_command(dict(command, station_id=STATION))
+
+
+def setup_commands():
+    commands = [{'command': 'charger_available', 'charger_id': charger_id, 'power_kw': power_kw}
+                for charger_id, power_kw in enumerate(POWERS, start=1)]
+    # Fill every charger, then queue cars with different needs so the order matters
+    for car in range(20):
+        commands.append({'command': 'register_to_queue', 'car_id': 'car{}'.format(car),
+                         'power_kw': POWERS[car * 3 % len(POWERS)], 'energy_kwh': (car * 7) % 40})
+    commands.append({'command': 'unregister_from_queue', 'car_id': 'car15'})
+    return commands
+
+
+def release_commands(station):
+    # Every charger frees up in turn, some twice, handing out the queue
+    charger_ids = [charger_id for charger_id in station.chargers] * 2
+    return [{'command': 'charger_available', 'charger_id': charger_id} for charger_id in charger_ids]
+
+
+def assignments(server):
+    return [(reply['car_id'], reply['charger_id'])
+            for topic, reply in zip([topic for topic, _ in server.published], server.replies())
+            if reply.get('command') == 'charger_assigned' and topic.startswith('charging_ahead/queue/car/')]
+
+
+def state(server):
+    return server.stations[STATION].to_record()
+
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_restart_from_snapshot_and_log_hands_out_chargers_the_same_way(make_server, monkeypatch, policy):
+    monkeypatch.setattr(server_module, 'ASSIGNMENT_POLICY', policy)
+    # Snapshot once cars are queued, so both the snapshot and the log tail are restored
+    monkeypatch.setattr(server_module, 'SNAPSHOT_EVERY', 25)
+
+    live = make_server()
+    random.seed(1)
+    run(live, setup_commands())
+    # The live server carries on without its log, to compare with the restarted one
+    live.event_log.stop()
+    live.event_log = None
+
+    restarted = make_server()
+    assert state(restarted) == state(live)
+
+    for server in (live, restarted):
+        server.published.clear()
+        random.seed(2)
+        run(server, release_commands(server.stations[STATION]))
+    assert assignments(restarted) == assignments(live)
+    assert len(assignments(live)) > 8
+    assert state(restarted) == state(live)
+
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_restart_keeps_queued_priorities_and_requested_power(make_server, monkeypatch, policy):
+    monkeypatch.setattr(server_module, 'ASSIGNMENT_POLICY', policy)
+    monkeypatch.setattr(server_module, 'SNAPSHOT_EVERY', 1)
+
+    live = make_server()
+    run(live, setup_commands())
+    live.event_log.stop()
+    live.event_log = None
+
+    restarted = make_server()
+    station = restarted.stations[STATION]
+    queued = list(live.stations[STATION].queue)
+    assert list(station.queue) == queued
+    assert [station.queue.priority(car_id) for car_id in queued] == \
+        [live.stations[STATION].queue.priority(car_id) for car_id in queued]
+    assert station.requested_power == live.stations[STATION].requested_power
@@ -0,0 +1,49 @@
+from backend.server.inbox import PriorityInbox
+from backend.server.server import INBOX_CHARGER_OVERFLOW, PRIORITY_CAR, PRIORITY_CHARGER
+
+
+def drain(inbox):
+    items = []
+    while True:
+        message = inbox.get_nowait()
+        if message is None:
+            return items
+        items.append(message)
+
+
+def test_highest_priority_first_and_fifo_within_a_level():
+    inbox = PriorityInbox(10, levels=3)
+    inbox.put(2, 'other')
+    inbox.put(1, 'car1')
+    inbox.put(0, 'charger')
+    inbox.put(1, 'car2')
+    assert drain(inbox) == [(0, 'charger'), (1, 'car1'), (1, 'car2'), (2, 'other')]
+
+
+def test_full_inbox_sheds_the_newest_lower_priority_message():
+    inbox = PriorityInbox(2, levels=3)
+    inbox.put(2, 'old')
+    inbox.put(2, 'new')
+    assert inbox.put(1, 'car') == (2, 'new')
+    assert inbox.put(2, 'late') == (2, 'late')
+    assert drain(inbox) == [(1, 'car'), (2, 'old')]
+
+
+def test_level_zero_uses_the_overflow_slots_and_stays_bounded():
+    inbox = PriorityInbox(2, levels=3, overflow=2)
+    inbox.put(1, 'car')
+    assert inbox.put(0, 'a') is None
+    assert inbox.put(0, 'b') == (1, 'car')
+    assert inbox.put(0, 'c') is None
+    assert inbox.put(0, 'd') is None
+    assert inbox.put(0, 'e') == (0, 'e')
+    assert len(inbox) == 4
+
+
+def test_async_server_inbox_keeps_charger_state_past_its_size(server):
+    size = server.inbox.maxsize
+    for i in range(size + INBOX_CHARGER_OVERFLOW):
+        assert server.inbox.put(PRIORITY_CHARGER, {'command': 'charger_available'}) is None
+    assert server.inbox.put(PRIORITY_CHARGER, {'command': 'charger_available'})[0] == PRIORITY_CHARGER
+    assert server.inbox.put(PRIORITY_CAR, {'command': 'queue_position'})[0] == PRIORITY_CAR
+    assert server.inbox.lengths() == [size + INBOX_CHARGER_OVERFLOW, 0, 0]
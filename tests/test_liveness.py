@@ -0,0 +1,41 @@
+from backend.server.liveness import LivenessTracker
+
+
+def test_sweep_reports_silent_chargers_then_forgets_them():
+    tracker = LivenessTracker(timeout=30, forget_after=100)
+    tracker.seen('a', 0)
+    tracker.seen('b', 10)
+    tracker.seen('a', 20)
+
+    assert tracker.sweep(39) == ([], [], [])
+    assert tracker.sweep(40) == (['b'], [], [])
+    assert tracker.sweep(50) == (['a'], [], [])
+    assert len(tracker) == 0
+
+    assert tracker.sweep(139) == ([], [], [])
+    assert tracker.sweep(150) == ([], ['b', 'a'], [])
+
+
+def test_offline_chargers_heard_from_again_are_revived():
+    tracker = LivenessTracker(timeout=30, forget_after=100)
+    tracker.seen('a', 0)
+    assert tracker.sweep(30) == (['a'], [], [])
+    tracker.offline.add('a')
+
+    tracker.seen('a', 40)
+    assert tracker.sweep(41) == ([], [], ['a'])
+    # Heard from before it was forgotten, so it is tracked again from then on
+    assert tracker.sweep(69) == ([], [], [])
+    assert tracker.sweep(70) == (['a'], [], [])
+
+
+def test_forget_drops_every_trace_of_a_charger():
+    tracker = LivenessTracker(timeout=30, forget_after=100)
+    tracker.seen('a', 0)
+    tracker.offline.add('a')
+    tracker.seen('a', 1)
+    tracker.forget('a')
+
+    assert len(tracker) == 0
+    assert 'a' not in tracker.offline
+    assert tracker.sweep(1000) == ([], [], [])
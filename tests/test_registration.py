@@ -0,0 +1,88 @@
+def register(server, car_id, station_id, **fields):
+    return server.commands.dispatch(dict(fields, command='register_to_queue', car_id=car_id, station_id=station_id))[1]
+
+
+def fill(server, station_id, prefix='car'):
+    station = server.stations[station_id]
+    for i in range(len(station.chargers)):
+        register(server, '{}-{}-{}'.format(prefix, station_id, i), station_id)
+
+
+def test_registering_again_keeps_the_charger(server):
+    first = register(server, 'a', 1)
+    assert first['command'] == 'charger_assigned'
+    assert register(server, 'a', 1) == first
+    assert server.stations[1].available_chargers == 3
+
+
+def test_registering_again_keeps_the_queue_place(server):
+    fill(server, 3)
+    first = register(server, 'a', 3)
+    assert first['command'] == 'registered_in_queue'
+    again = register(server, 'a', 3)
+    assert again['position'] == first['position']
+    assert len(server.stations[3].queue) == 1
+
+
+def test_retry_after_a_redirect_keeps_the_charger_at_the_other_station(server):
+    fill(server, 1)
+    first = register(server, 'a', 1, allow_redirect=True)
+    assert first['command'] == 'charger_assigned' and first['station_id'] != 1
+
+    again = register(server, 'a', 1, allow_redirect=True)
+    assert again == first
+    held = [(station.id, charger.id) for station in server.stations.values()
+            for charger in station.chargers.values() if charger.car_id == 'a']
+    assert held == [(first['station_id'], first['charger_id'])]
+
+
+def test_registering_at_another_station_returns_the_existing_place(server):
+    first = register(server, 'a', 2)
+    again = register(server, 'a', 4)
+    assert again == first
+    assert server.stations[4].available_chargers == 4
+
+
+def unregister(server, car_id, station_id):
+    return server.commands.dispatch({'command': 'unregister_from_queue', 'car_id': car_id, 'station_id': station_id})[1]
+
+
+def test_queued_cars_are_served_in_order_as_chargers_free_up(server):
+    fill(server, 1)
+    for car_id in ('q1', 'q2', 'q3'):
+        assert register(server, car_id, 1)['command'] == 'registered_in_queue'
+
+    station = server.stations[1]
+    first = next(iter(station.chargers.values()))
+    reply = server.commands.dispatch({'command': 'charger_available', 'charger_id': first.id, 'station_id': 1})[1]
+    assert (reply['car_id'], reply['charger_id']) == ('q1', first.id)
+    assert list(station.queue) == ['q2', 'q3']
+
+
+def test_unregistering_a_queued_car_moves_the_others_up(server):
+    fill(server, 1)
+    for car_id in ('q1', 'q2', 'q3'):
+        register(server, car_id, 1)
+    assert unregister(server, 'q1', 1) is None
+    assert list(server.stations[1].queue) == ['q2', 'q3']
+    assert server.stations[1].queue_position('q3') == 2
+
+
+def test_unregistering_a_car_with_a_charger_hands_it_to_the_next_car(server):
+    fill(server, 1)
+    register(server, 'q1', 1)
+    station = server.stations[1]
+    charger = station.charger_of('car-1-0')
+
+    reply = unregister(server, 'car-1-0', 1)
+    assert (reply['command'], reply['car_id'], reply['charger_id']) == ('charger_assigned', 'q1', charger.id)
+    assert station.charger_of('q1') is charger
+    assert len(station.queue) == 0
+    assert station.available_chargers == 0
+
+
+def test_unregistering_the_last_car_frees_the_charger(server):
+    register(server, 'a', 1)
+    assert unregister(server, 'a', 1) is None
+    assert server.stations[1].available_chargers == 4
+    assert server.area_index.station_of_car('a') is None
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from backend.server.server import station_input_topic
+
+MALFORMED = [
+    b'not json',
+    b'[1, 2, 3]',
+    b'"register_to_queue"',
+    b'null',
+    json.dumps({'command': []}).encode(),
+    json.dumps({'command': {'a': 1}}).encode(),
+    json.dumps({'command': None, 'car_id': 'a'}).encode(),
+    json.dumps({'command': 'heartbeat', 'station_id': 1, 'charger_ids': 'x'}).encode(),
+    json.dumps({'command': 'register_to_queue', 'car_id': [], 'station_id': 1}).encode(),
+    json.dumps({'command': 'register_to_queue', 'car_id': 'a', 'station_id': {}}).encode(),
+]
+
+
+@pytest.mark.parametrize('raw', MALFORMED)
+def test_malformed_message_is_dropped(server, raw):
+    server.receive_message(station_input_topic(1), raw)
+    server.work()
+
+    server.receive_message(station_input_topic(1), json.dumps(
+        {'command': 'register_to_queue', 'car_id': 'good', 'station_id': 1}).encode())
+    server.work()
+    assert {reply['car_id'] for reply in server.replies('charger_assigned')} == {'good'}
+
+
+def test_telemetry_on_a_malformed_topic_is_dropped(server):
+    server.receive_message('charging_ahead/telemetry/station', b'\x00')
+    server.receive_message(station_input_topic(1), json.dumps(
+        {'command': 'register_to_queue', 'car_id': 'good', 'station_id': 1}).encode())
+    server.work()
+    assert server.replies('charger_assigned')
+
+
+@pytest.mark.parametrize('reply_topic', [
+    'charging_ahead/queue/car/victim',
+    'charging_ahead/queue/router/search_reply',
+    'charging_ahead/queue/router/+/search_reply',
+    'charging_ahead/queue/router/a/b/search_reply',
+])
+def test_search_reply_topic_must_be_a_router_topic(server, reply_topic):
+    server.handle_search({'command': 'status_available_charger', 'search_string': '', 'reply_topic': reply_topic})
+    assert server.published == []
+
+
+def test_search_is_answered_on_a_router_reply_topic(server):
+    reply_topic = 'charging_ahead/queue/router/abc123/search_reply'
+    server.handle_search({'command': 'status_available_charger', 'search_string': '', 'reply_topic': reply_topic,
+                          'request_id': 'r1'})
+    assert [topic for topic, _ in server.published] == [reply_topic]
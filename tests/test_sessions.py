@@ -0,0 +1,23 @@
+import backend.server.server as server_module
+
+
+def test_session_open_at_a_snapshot_is_recorded_after_a_restart(make_server, monkeypatch):
+    monkeypatch.setattr(server_module, 'SNAPSHOT_EVERY', 2)
+
+    live = make_server()
+    live.handle_command({'command': 'register_to_queue', 'car_id': 'car', 'station_id': 1})
+    charger_id = live.replies('charger_assigned')[0]['charger_id']
+    # The second logged command writes a snapshot while the session is open
+    live.handle_command({'command': 'charger_connected', 'charger_id': charger_id, 'station_id': 1})
+    live.event_log.stop()
+    live.event_log = None
+
+    restarted = make_server()
+    restarted.handle_command({'command': 'charger_available', 'charger_id': charger_id, 'station_id': 1})
+    restarted.sessions.flush()
+
+    rows = restarted.sessions._db.execute('SELECT car_id, charger_id, connected_at, outcome FROM sessions').fetchall()
+    assert len(rows) == 1
+    car_id, recorded_charger, connected_at, outcome = rows[0]
+    assert (car_id, recorded_charger, outcome) == ('car', str(charger_id), 'completed')
+    assert connected_at is not None
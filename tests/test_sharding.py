@@ -0,0 +1,90 @@
+import json
+import types
+
+import pytest
+
+from backend.server import sharding
+from backend.server.server import MQTT_TOPIC_OUTPUT
+from backend.server.station_registry import StationRegistry, StationRow
+from backend.server.search_replica import SearchReplica
+
+
+class FakeClient:
+    def __init__(self, *args, **kwargs):
+        self.published = []
+
+    def connect(self, *args):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def publish(self, topic, payload):
+        self.published.append((topic, json.loads(payload)))
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(sharding.mqtt, 'Client', FakeClient)
+    monkeypatch.setattr(sharding, 'SEARCH_TIMEOUT', 60)
+    router = sharding.ShardRouter(3)
+    yield router
+    for pending in router._pending.values():
+        pending['timer'].cancel()
+
+
+def message(topic, payload):
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return types.SimpleNamespace(topic=topic, payload=raw)
+
+
+@pytest.mark.parametrize('payload', [
+    b'[]', b'"x"', b'not json',
+    {'command': 'status_available_charger', 'offset': 'x'},
+    {'command': 'status_available_charger', 'limit': [1]},
+    {'command': 'register_to_queue', 'station_id': ['#']},
+])
+def test_malformed_messages_do_not_raise(router, payload):
+    router.on_message(None, None, message('charging_ahead/queue/server_input', payload))
+    assert not router._pending
+
+
+def test_invalid_search_gets_an_error_reply(router):
+    router.on_message(None, None, message('charging_ahead/queue/server_input',
+                                          {'command': 'status_available_charger', 'offset': 'x'}))
+    topic, reply = router.mqtt_client.published[-1]
+    assert topic == MQTT_TOPIC_OUTPUT
+    assert 'offset' in reply['message']
+
+
+def test_null_page_fields_take_defaults(router):
+    router.on_message(None, None, message('charging_ahead/queue/server_input',
+                                          {'command': 'status_available_charger', 'offset': None, 'limit': None}))
+    assert len(router._pending) == 1
+    scattered = [payload for topic, payload in router.mqtt_client.published]
+    assert len(scattered) == 3
+    assert scattered[0]['offset'] == 0 and scattered[0]['limit'] == sharding.search_page({})[2]
+
+
+@pytest.mark.parametrize('offset', [0, 2, 5, 8])
+def test_pages_merge_in_station_order(router, offset):
+    ids = [12, 3, 7, 1, 25, 9, 2, 100, 40]
+    rows = [StationRow(station_id, 1, 'Station {}'.format(station_id), 'Area', 0, '') for station_id in ids]
+    shards = [StationRegistry([row for row in rows if sharding.shard_for(row.id, 3) == shard]) for shard in range(3)]
+    replicas = [SearchReplica(stations, lambda station: {'id': station.id}) for stations in shards]
+
+    router.on_message(None, None, message('charging_ahead/queue/server_input',
+                                          {'command': 'status_available_charger', 'search_string': 'station',
+                                           'offset': offset, 'limit': 3}))
+    request_id = next(iter(router._pending))
+    for replica in replicas:
+        total, stations = replica.search('station', limit=offset + 3)
+        router.on_message(None, None, message(router.reply_topic,
+                                              {'request_id': request_id, 'total': total, 'stations': stations}))
+
+    topic, reply = router.mqtt_client.published[-1]
+    assert reply['total'] == len(ids)
+    assert [station['id'] for station in reply['stations']] == sorted(ids)[offset:offset + 3]
@@ -0,0 +1,29 @@
+from backend.helperClasses.station import Station
+from backend.server.station_search import StationSearchIndex
+
+NAMES = [('Øya', 'Trondheim'), ('Solsiden', 'Trondheim'), ('Lade', 'Trondheim'), ('Sandvika', 'Bærum')]
+QUERIES = ['', 'o', 'oya', 'ØYA', 'sol', 'trondheim', 'baerum', 'de', 'missing']
+
+
+def make_index():
+    index = StationSearchIndex()
+    for station_id, (station_name, area_name) in enumerate(NAMES, start=1):
+        index.add_station(Station(station_id, station_id, station_name, area_name, 1))
+    return index
+
+
+def test_scanning_before_the_ngrams_are_built_matches_the_ngram_search():
+    index = make_index()
+    scanned = {query: index.match(query) for query in QUERIES}
+
+    index.build_ngrams()
+    assert {query: index.match(query) for query in QUERIES} == scanned
+    assert scanned['oya'] == [1]
+    assert scanned['trondheim'] == [1, 2, 3]
+
+
+def test_search_index_is_built_in_the_background_after_boot(server):
+    assert server.search_replica.index_ready.wait(timeout=5)
+
+    total, summaries = server.search_replica.search('')
+    assert total == len(server.stations)
@@ -0,0 +1,48 @@
+from backend.server.timer_wheel import TimerWheel
+
+
+def test_timers_expire_once_their_tick_has_passed():
+    wheel = TimerWheel(tick=1.0, num_slots=8, now=0.0)
+    wheel.schedule('a', 2.5)
+    wheel.schedule('b', 3.0)
+    wheel.schedule('c', 5.0)
+
+    assert wheel.expire(2.9) == []
+    assert sorted(wheel.expire(3.0)) == ['a', 'b']
+    assert wheel.expire(4.0) == []
+    assert wheel.expire(5.0) == ['c']
+    assert len(wheel) == 0
+
+
+def test_rescheduling_replaces_and_cancelling_removes_a_timer():
+    wheel = TimerWheel(tick=1.0, num_slots=8, now=0.0)
+    wheel.schedule('a', 2.0)
+    wheel.schedule('a', 6.0)
+    wheel.schedule('b', 2.0)
+    assert wheel.cancel('b')
+    assert not wheel.cancel('b')
+
+    assert wheel.expire(3.0) == []
+    assert 'a' in wheel
+    assert wheel.expire(6.0) == ['a']
+
+
+def test_timers_beyond_one_turn_of_the_wheel_wait_for_their_turn():
+    wheel = TimerWheel(tick=1.0, num_slots=4, now=0.0)
+    wheel.schedule('near', 2.0)
+    wheel.schedule('far', 10.0)
+
+    assert wheel.expire(6.0) == ['near']
+    assert wheel.expire(9.0) == []
+    assert wheel.expire(10.0) == ['far']
+
+
+def test_a_long_pause_expires_everything_due_and_past_deadlines_fire_on_the_next_tick():
+    wheel = TimerWheel(tick=1.0, num_slots=4, now=0.0)
+    for key in range(10):
+        wheel.schedule(key, key + 1.0)
+    assert sorted(wheel.expire(100.0)) == list(range(10))
+
+    wheel.schedule('late', 50.0)
+    assert wheel.expire(100.0) == []
+    assert wheel.expire(101.0) == ['late']